@@ -1,11 +1,20 @@
 from .options import BandcampSyncOptions
 from .config import VERSION as version
-from .sync import Syncer
+from .sync import MultiFormatSyncer, Syncer
 
 
-__all__ = ["version", "do_sync", "Syncer", "BandcampSyncOptions"]
+__all__ = [
+    "version",
+    "do_sync",
+    "Syncer",
+    "MultiFormatSyncer",
+    "BandcampSyncOptions",
+]
 
 
 def do_sync(options: BandcampSyncOptions):
-    Syncer(options, auto_run=True)
+    if options.format_dirs:
+        MultiFormatSyncer(options, auto_run=True)
+    else:
+        Syncer(options, auto_run=True)
     return True
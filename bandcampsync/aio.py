@@ -0,0 +1,359 @@
+import asyncio
+import math
+from time import monotonic
+from curl_cffi import requests
+from .bandcamp import BandcampError
+from .download import (
+    mask_sig,
+    _abort_observers,
+    _is_expired_download_page,
+    _sniff_file,
+    DownloadBadStatusCode,
+    DownloadInvalidContentType,
+    DownloadExpired,
+    DownloadInterrupted,
+    DownloadRateLimited,
+)
+from .logger import get_logger
+from .metrics import observe_request, observe_transfer
+from .writer import TransferStats, preallocate
+
+
+log = get_logger("aio")
+
+
+def new_async_session(max_clients=10):
+    """
+    Returns an AsyncSession for use with AsyncBandcamp and download_file_async.
+    Connections are kept open and reused by up to "max_clients" concurrent requests.
+    Like the pooled blocking sessions, cookies are not kept between requests.
+    """
+    return requests.AsyncSession(
+        impersonate="chrome",
+        max_clients=max(1, int(max_clients)),
+        discard_cookies=True,
+    )
+
+
+class AsyncBandcamp:
+    """
+    An asyncio client for the per-item Bandcamp requests made while syncing, which
+    are fetching the download page, the download stat check and the download itself.
+    It wraps an authenticated Bandcamp instance and shares its cookies, download page
+    cache, rate limiter and parsing, only the HTTP requests are made asynchronously.
+    """
+
+    def __init__(self, bandcamp, session):
+        self.bandcamp = bandcamp
+        self.session = session
+
+    async def _request(
+        self, method, url, data=None, json_data=None, is_json=False, endpoint="other"
+    ):
+        rate_limiter = self.bandcamp.rate_limiter
+        if rate_limiter:
+            await rate_limiter.wait_async("api")
+        started = monotonic()
+        try:
+            log.debug(f"Making async {method} request to {url}")
+            response = await self.session.request(
+                method,
+                url,
+                cookies=self.bandcamp.plain_cookies,
+                data=data,
+                json=json_data,
+            )
+        except Exception as e:
+            observe_request(endpoint, started, "error")
+            raise BandcampError(
+                f"Failed to make HTTP request to {mask_sig(url)}: {e}"
+            ) from e
+        observe_request(endpoint, started, response.status_code)
+        return self.bandcamp._parse_response(
+            url, response, is_json=is_json, as_raw=not is_json
+        )
+
+    async def get_item_downloads(self, item):
+        downloads = self.bandcamp._get_cached_item_downloads(item)
+        if downloads:
+            return downloads
+        # Share the fetch with any other caller for the same item, the task is
+        # shielded so a cancelled caller does not cancel it for the others
+        tasks = self.bandcamp.download_page_tasks
+        task = tasks.get(item.item_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_item_downloads(item))
+            tasks[item.item_id] = task
+            task.add_done_callback(lambda _: tasks.pop(item.item_id, None))
+        return await asyncio.shield(task)
+
+    async def _load_item_downloads(self, item):
+        html = await self._request("get", item.download_url, endpoint="download_page")
+        downloads = self.bandcamp._parse_item_downloads(item, html)
+        self.bandcamp._put_cached_item_downloads(item, downloads)
+        return downloads
+
+    def invalidate_item_downloads(self, item):
+        return self.bandcamp.invalidate_item_downloads(item)
+
+    async def get_download_file_url(self, item, encoding="flac"):
+        downloads = await self.get_item_downloads(item)
+        return self.bandcamp._select_download_url(downloads, encoding)
+
+    async def get_download_file_size(self, item, encoding="flac"):
+        downloads = await self.get_item_downloads(item)
+        return self.bandcamp._select_download_size(downloads, encoding)
+
+    async def get_download_file(self, item, encoding="flac"):
+        downloads = await self.get_item_downloads(item)
+        return (
+            self.bandcamp._select_download_url(downloads, encoding),
+            self.bandcamp._select_download_size(downloads, encoding),
+        )
+
+    async def check_download_stat(self, item, file_download_url):
+        stat_url = self.bandcamp._stat_url(file_download_url)
+        body = await self._request("get", stat_url, endpoint="statdownload")
+        return self.bandcamp._get_js_stat_url(body, file_download_url)
+
+
+async def download_file_async(
+    url,
+    target,
+    session,
+    mode="wb",
+    write_size=1024 * 1024,
+    logevery=10,
+    disallow_content_type="text/html",
+    rate_limiter=None,
+    write_executor=None,
+    partial=None,
+    preallocate_file=False,
+    stats=None,
+    observers=None,
+    sniffer=None,
+):
+    """
+    Streams a download to an open target file handle on the event loop. Received
+    data is collected into blocks of up to "write_size" bytes which are written to
+    the target in "write_executor" (or the loop's default executor), so disk writes
+    do not block the loop and each download holds at most one block in memory. The
+    checks, exceptions and resuming of a PartialDownload are the same as
+    download_file(). If "preallocate_file" is set the disk space for the download is
+    reserved before it is written and if a TransferStats is passed as "stats" the
+    time spent receiving and writing the download is added to it. "observers" are
+    fed each block after it is written, in the write executor, and "sniffer" is set
+    to the kind of content from the first chunk, as with download_file().
+    """
+    loop = asyncio.get_running_loop()
+    text = True if "t" in mode else False
+    data_streamed = 0
+    last_log = 0
+    offset = 0
+    headers = None
+    if partial:
+        if partial.complete:
+            log.info(f"Download already complete: {mask_sig(url)}")
+            _abort_observers(observers, "download was already complete")
+            await loop.run_in_executor(write_executor, _sniff_file, sniffer, target)
+            return partial.content_type or ""
+        offset = partial.resume_offset
+        headers = partial.range_headers()
+        if headers:
+            log.info(
+                f"Resuming download from byte {offset} of {partial.length}: "
+                f"{mask_sig(url)}"
+            )
+        await loop.run_in_executor(write_executor, _truncate, target, offset)
+    if rate_limiter:
+        await rate_limiter.wait_async("download")
+    try:
+        r = await session.get(url, headers=headers, stream=True)
+    except requests.exceptions.RequestException as e:
+        raise DownloadInterrupted(f"Download failed: {e}") from e
+    try:
+        if rate_limiter and rate_limiter.update(r.status_code, r.headers):
+            raise DownloadRateLimited(f"Rate limited with status code: {r.status_code}")
+        if r.status_code == 416 and partial:
+            partial.reset()
+            raise DownloadBadStatusCode("Server could not resume the download")
+        if r.status_code == 206 and offset:
+            problem = partial.check_resumed(
+                r.headers.get("Content-Range"), offset, _content_length(r)
+            )
+            if problem is not None:
+                partial.reset()
+                raise DownloadBadStatusCode(
+                    f"Server did not honour the resume request: {problem}"
+                )
+        elif r.status_code != 200:
+            raise DownloadBadStatusCode(f"Got non-200 status code: {r.status_code}")
+        elif offset:
+            log.info(f"Server sent the whole file, restarting: {mask_sig(url)}")
+            offset = 0
+            await loop.run_in_executor(write_executor, _truncate, target, 0)
+        try:
+            content_type = r.headers.get("Content-Type", "")
+        except (ValueError, KeyError):
+            content_type = ""
+        content_type_parts = content_type.split(";")
+        major_content_type = content_type_parts[0].strip()
+        if major_content_type == disallow_content_type:
+            try:
+                html_body = await r.atext()
+            except requests.exceptions.RequestException as e:
+                log.warning(f"Failed to read HTML body for: {mask_sig(url)} ({e})")
+                html_body = ""
+            if _is_expired_download_page(html_body):
+                raise DownloadExpired(
+                    "Download expired and requires email confirmation on Bandcamp"
+                )
+            raise DownloadInvalidContentType(
+                f"Invalid content type: {major_content_type}"
+            )
+        chunks = r.aiter_content()
+        first_chunk = b""
+        if sniffer is not None:
+            if offset:
+                await loop.run_in_executor(write_executor, _sniff_file, sniffer, target)
+            else:
+                try:
+                    first_chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    pass
+                except requests.exceptions.RequestException as e:
+                    raise DownloadInterrupted(f"Download failed: {e}") from e
+                sniffer.sniff(first_chunk)
+            if sniffer.is_html:
+                html_body = await _read_html(first_chunk, chunks, url)
+                if _is_expired_download_page(html_body):
+                    raise DownloadExpired(
+                        "Download expired and requires email confirmation on Bandcamp"
+                    )
+                raise DownloadInvalidContentType(
+                    f"Download is an HTML page served as: {major_content_type}"
+                )
+            if sniffer.problem():
+                raise DownloadInvalidContentType(
+                    f"Unexpected download: {sniffer.problem()}"
+                )
+
+        async def body():
+            if first_chunk:
+                yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        content_length = _content_length(r)
+        if partial:
+            partial.start(url, content_length, major_content_type, offset=offset)
+            partial.record_headers(r.headers)
+        if offset:
+            _abort_observers(observers, f"download resumed from byte {offset}")
+            observers = None
+        transfer = TransferStats()
+        transfer.downloads = 1
+        if preallocate_file and content_length:
+            await loop.run_in_executor(
+                write_executor, preallocate, target, offset, offset + content_length
+            )
+
+        def write(data):
+            started = monotonic()
+            target.write(data)
+            if partial:
+                partial.written(len(data), target)
+            transfer.add_disk(len(data), monotonic() - started)
+            for observer in observers or ():
+                observer.feed(data)
+
+        async def write_block(data):
+            started = monotonic()
+            await loop.run_in_executor(write_executor, write, data)
+            transfer.wait_seconds += monotonic() - started
+
+        started = monotonic()
+        block = bytearray()
+        try:
+            async for chunk in body():
+                if rate_limiter:
+                    transfer.throttle_seconds += await rate_limiter.throttle_async(
+                        len(chunk)
+                    )
+                block += chunk
+                transfer.network_bytes += len(chunk)
+                if len(block) < write_size:
+                    continue
+                data = bytes(block)
+                block.clear()
+                if text:
+                    data = data.decode()
+                await write_block(data)
+                data_streamed += len(data)
+                if content_length > 0 and logevery > 0:
+                    percent_complete = math.floor(
+                        ((offset + data_streamed) / (offset + content_length)) * 100
+                    )
+                    if percent_complete % logevery == 0 and percent_complete > last_log:
+                        log.info(f"Downloading {mask_sig(url)}: {percent_complete}%")
+                        last_log = percent_complete
+        except requests.exceptions.RequestException as e:
+            if partial:
+                await write_block(bytes(block))
+                await loop.run_in_executor(write_executor, partial.sync, target)
+                log.warning(
+                    f"Download interrupted after {partial.bytes_written} of "
+                    f"{partial.length} bytes: {mask_sig(url)}"
+                )
+            _add_stats(stats, transfer, started)
+            raise DownloadInterrupted(f"Download failed: {e}") from e
+        if block:
+            data = bytes(block)
+            if text:
+                data = data.decode()
+            await write_block(data)
+        if partial:
+            await loop.run_in_executor(write_executor, partial.sync, target)
+        if preallocate_file and content_length:
+            # A short download must not leave preallocated space past its end
+            await loop.run_in_executor(
+                write_executor, _truncate, target, offset + transfer.network_bytes
+            )
+        _add_stats(stats, transfer, started)
+    finally:
+        await r.aclose()
+    return major_content_type
+
+
+async def _read_html(first_chunk, chunks, url, limit=1024 * 1024):
+    body = bytearray(first_chunk)
+    try:
+        async for chunk in chunks:
+            if len(body) < limit:
+                body += chunk
+    except requests.exceptions.RequestException as e:
+        log.warning(f"Failed to read HTML body for: {mask_sig(url)} ({e})")
+    return body.decode("utf-8", errors="replace")
+
+
+def _add_stats(stats, transfer, started):
+    elapsed = monotonic() - started
+    transfer.network_seconds = max(
+        0.0, elapsed - transfer.wait_seconds - transfer.throttle_seconds
+    )
+    log.debug(f"Download transfer: {transfer.summary()}")
+    observe_transfer(transfer)
+    if stats is not None:
+        stats.add(transfer)
+
+
+def _content_length(response):
+    try:
+        return max(0, int(response.headers.get("Content-Length", "0")))
+    except (TypeError, ValueError, KeyError):
+        return 0
+
+
+def _truncate(target, offset):
+    target.seek(offset)
+    target.truncate()
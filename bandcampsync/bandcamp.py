@@ -1,12 +1,18 @@
+import hashlib
 import json
 import re
-from time import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import time, monotonic
 from http.cookies import SimpleCookie
 from html import unescape as html_unescape
 from urllib.parse import urlsplit, urlunsplit
 from bs4 import BeautifulSoup
-from curl_cffi import requests
 from .download import mask_sig
+from .metrics import COLLECTION_PAGES, observe_request
+from .pagedata import extract_data_blob, json_loads
+from .sessions import SessionPool
 from .logger import get_logger
 
 
@@ -21,6 +27,14 @@ class BandcampDownloadUnavailable(BandcampError):
     pass
 
 
+class BandcampRateLimited(BandcampError):
+    pass
+
+
+class BandcampAuthError(BandcampError):
+    pass
+
+
 class Bandcamp:
     BASE_PROTO = "https"
     BASE_DOMAIN = "bandcamp.com"
@@ -28,14 +42,53 @@ class Bandcamp:
         "index": "/",
         "collection_items": "/api/fancollection/1/collection_items",
     }
-
-    def __init__(self, cookies=""):
+    # Collection pagination page sizes, and the page request latency range (in
+    # seconds) outside of which an adaptive page size is grown or shrunk
+    PER_PAGE = 100
+    DOWNLOAD_PAGE_LOCKS = 64
+    MIN_PER_PAGE = 20
+    MAX_PER_PAGE = 500
+    PAGE_LATENCY_LOW = 1.0
+    PAGE_LATENCY_HIGH = 5.0
+    # Responses to requests that are not authenticated
+    AUTH_STATUS_CODES = (401, 403)
+    LOGIN_PATH = "/login"
+
+    def __init__(
+        self,
+        cookies="",
+        per_page=PER_PAGE,
+        adaptive_per_page=False,
+        pipeline=True,
+        download_cache=None,
+        auth_cache=None,
+        rate_limiter=None,
+        session_pool=None,
+    ):
         self.is_authenticated = False
         self.user_id = 0
         self.user_verified = False
         self.cookies = None
+        self.plain_cookies = {}
         self.purchases = []
         self.collection_items = []
+        self.per_page = max(1, int(per_page or self.PER_PAGE))
+        self.adaptive_per_page = adaptive_per_page
+        self.pipeline = pipeline
+        self.download_cache = download_cache
+        self.auth_cache = auth_cache
+        self.rate_limiter = rate_limiter
+        self.session_pool = session_pool if session_pool else SessionPool()
+        # Callers fetching the same item's download page at the same time, such as
+        # several formats of the item, wait for one fetch. Threads share a lock by
+        # item ID and the async engine shares the task fetching it
+        self.download_page_locks = [
+            threading.Lock() for _ in range(self.DOWNLOAD_PAGE_LOCKS)
+        ]
+        self.download_page_tasks = {}
+        # Set when the identity was loaded from the auth cache and has not yet been
+        # confirmed by an authenticated request
+        self.auth_unconfirmed = False
         self.load_cookies(cookies)
         identity = False
         if self.cookies:
@@ -47,11 +100,8 @@ class Bandcamp:
                 "authenticated browser"
             )
         identity_snip = identity.value[:20]
+        self.identity_hash = hashlib.sha256(identity.value.encode()).hexdigest()
         log.info(f"Located Bandcamp identity in cookies: {identity_snip}...")
-        # Create a "requests" session and map our SimpleCookie to it
-        self.session = requests.Session(impersonate="chrome")
-        for cookie_name, morsel in self.cookies.items():
-            self.session.cookies.set(cookie_name, morsel.value)
 
     def load_cookies(self, cookies_str):
         self.cookies = SimpleCookie()
@@ -75,6 +125,8 @@ class Bandcamp:
                     if secure == "TRUE":
                         cookie_string += "; Secure"
                     self.cookies.load(cookie_string)
+        # Pooled sessions do not keep cookies, so they are sent with every request
+        self.plain_cookies = self._plain_cookies()
         return True
 
     @property
@@ -100,23 +152,55 @@ class Bandcamp:
         return cookies
 
     def _request(
-        self, method, url, data=None, json_data=None, is_json=False, as_raw=False
+        self,
+        method,
+        url,
+        data=None,
+        json_data=None,
+        is_json=False,
+        as_raw=False,
+        endpoint="other",
     ):
+        if self.rate_limiter:
+            self.rate_limiter.wait("api")
+        started = monotonic()
         try:
             # The debug logs do not mask the URL, which may be a security issue if you run
             # with level=logging.DEBUG
             log.debug(f"Making {method} request to {url}")
-            response = self.session.request(
+            response = self.session_pool.request(
                 method,
                 url,
-                cookies=self._plain_cookies(),
+                cookies=self.plain_cookies,
                 data=data,
                 json=json_data,
             )
         except Exception as e:
+            observe_request(endpoint, started, "error")
             raise BandcampError(
                 f"Failed to make HTTP request to {mask_sig(url)}: {e}"
             ) from e
+        observe_request(endpoint, started, response.status_code)
+        return self._parse_response(url, response, is_json=is_json, as_raw=as_raw)
+
+    def _parse_response(self, url, response, is_json=False, as_raw=False):
+        if self.rate_limiter and self.rate_limiter.update(
+            response.status_code, response.headers
+        ):
+            raise BandcampRateLimited(
+                f"Failed to make HTTP request to {mask_sig(url)}: "
+                f"rate limited with status code: {response.status_code}"
+            )
+        if response.status_code in self.AUTH_STATUS_CODES:
+            raise BandcampAuthError(
+                f"Failed to make HTTP request to {mask_sig(url)}: "
+                f"not authenticated, status code: {response.status_code}"
+            )
+        if self._is_login_redirect(response):
+            raise BandcampAuthError(
+                f"Failed to make HTTP request to {mask_sig(url)}: "
+                "redirected to the login page"
+            )
         if response.status_code != 200:
             raise BandcampError(
                 f"Failed to make HTTP request to {mask_sig(url)}: "
@@ -125,10 +209,21 @@ class Bandcamp:
         if as_raw:
             return response.text
         elif is_json:
-            return json.loads(response.text)
+            return json_loads(response.text)
         else:
             return BeautifulSoup(response.text, "html.parser")
 
+    @classmethod
+    def _is_login_redirect(cls, response):
+        """True if a response redirects, or was redirected, to the login page."""
+        if 300 <= response.status_code < 400:
+            target = response.headers.get("Location")
+        else:
+            target = getattr(response, "url", None)
+        if not isinstance(target, str):
+            return False
+        return urlsplit(target).path.rstrip("/") == cls.LOGIN_PATH
+
     @staticmethod
     def _extract_pagedata_from_soup(soup, id_name="pagedata"):
         pagedata_tag = soup.find("div", id=id_name)
@@ -150,12 +245,18 @@ class Bandcamp:
         except Exception as e:
             raise BandcampError(f"Failed to parse pagedata as JSON: {e}") from e
 
-    def _extract_pagedata_from_html(self, html):
+    def _extract_pagedata_from_html(self, html, id_name="pagedata"):
         """
-        Wrapper for _extract_pagedata_from_soup() that can accept HTML rather than a bs4 soup.
+        Extracts the pagedata JSON from HTML. The data-blob attribute is located with
+        a targeted string search which avoids building a full DOM. If the markup is
+        not in the expected shape this falls back to parsing the HTML with bs4.
         """
+        pagedata = extract_data_blob(html, id_name=id_name)
+        if pagedata is not None:
+            return pagedata
+        log.debug(f'Fast pagedata extraction failed for "{id_name}", parsing HTML')
         soup = BeautifulSoup(html, "html.parser")
-        return self._extract_pagedata_from_soup(soup)
+        return self._extract_pagedata_from_soup(soup, id_name=id_name)
 
     @staticmethod
     def _get_js_stat_url(body, download_url):
@@ -175,15 +276,31 @@ class Bandcamp:
         # Fallback to the original download URL
         return download_url
 
-    def verify_authentication(self):
+    def verify_authentication(self, use_cache=True):
         """
         Loads the initial account and session data from a request to the index page
         of bandcamp.com. When properly authenticated, an HTML data attribute is present
         that contains account information in an encoded form.
+        If an auth cache is set and contains a recently verified identity for the
+        current cookies it is used instead, and is confirmed by the first collection
+        page request.
         """
+        if use_cache and self.auth_cache is not None:
+            cached_identity = self.auth_cache.get(self.identity_hash)
+            if cached_identity:
+                self.user_id = cached_identity["user_id"]
+                self.user_verified = cached_identity.get("user_verified", False)
+                self.is_authenticated = self.user_id > 0
+                self.auth_unconfirmed = True
+                log.info(
+                    f"Loaded cached identity for user id: {self.user_id}, will "
+                    "confirm with the first collection request"
+                )
+                return True
+        self.auth_unconfirmed = False
         url = self._construct_url("index")
-        soup = self._request("get", url)
-        pagedata = self._extract_pagedata_from_soup(soup, id_name="HomepageApp")
+        html = self._request("get", url, as_raw=True, endpoint="homepage")
+        pagedata = self._extract_pagedata_from_html(html, id_name="HomepageApp")
         try:
             pagecontext = pagedata["pageContext"]
         except KeyError as e:
@@ -213,8 +330,54 @@ class Bandcamp:
         log.info(
             f"Loaded page data, session is authenticated for user id: {self.user_id})"
         )
+        if self.auth_cache is not None and self.is_authenticated:
+            self.auth_cache.put(self.identity_hash, self.user_id, self.user_verified)
+        return True
+
+    def _confirm_cached_authentication(self, data):
+        """
+        Checks a collection page loaded with a cached identity. Each collection item
+        has the fan id of the collection it is in, so an item for another fan means
+        the cached identity is not valid for the current cookies, as does a 401 or
+        403 response or a redirect to the login page, which raise BandcampAuthError
+        when the page is requested. A page that is missing data, such as redownload
+        URLs, is left to the normal checks and does not renew the cached identity.
+        """
+        if not isinstance(data, dict) or data.get("error"):
+            return False
+        for item in data.get("items") or ():
+            fan_id = item.get("fan_id") if isinstance(item, dict) else None
+            if fan_id is not None and fan_id != self.user_id:
+                raise BandcampAuthError(
+                    f"Collection page is for fan id {fan_id}, not {self.user_id}"
+                )
+        self.auth_unconfirmed = False
+        log.info(f"Confirmed cached identity for user id: {self.user_id}")
+        self.auth_cache.put(self.identity_hash, self.user_id, self.user_verified)
         return True
 
+    def _fetch_first_collection_page(self, token, per_page):
+        """
+        Fetches the first collection page. If the identity came from the auth cache
+        and the page does not confirm it, the cache entry is dropped and the
+        identity is verified with a homepage request before trying again. Other
+        errors, such as network errors, do not drop the cached identity.
+        """
+        try:
+            data, latency = self._fetch_collection_page(token, per_page)
+            if self.auth_unconfirmed:
+                self._confirm_cached_authentication(data)
+            return data, latency
+        except BandcampAuthError as e:
+            if not self.auth_unconfirmed:
+                raise
+            log.warning(
+                f"Failed to confirm cached identity ({e}), verifying authentication"
+            )
+            self.auth_cache.invalidate(self.identity_hash)
+            self.verify_authentication(use_cache=False)
+            return self._fetch_collection_page(token, per_page)
+
     @staticmethod
     def _resolve_download_url(item, redownload_urls):
         sale_item_type = item.sale_item_type
@@ -262,12 +425,108 @@ class Bandcamp:
                 f"Duplicate name details: {duplicate.band_name} / {duplicate.item_title}: {', '.join(duplicate_details)}"
             )
 
-    def load_purchases(self, stop_when=None):
+    def _next_per_page(self, per_page, latency):
         """
-        Loads all purchases on the authenticated account and returns a list of
-        purchase data. Each purchase is a dict of data.
+        Returns the page size to request next. With adaptive page sizes enabled the
+        page size doubles while pages return quickly and halves when they are slow.
+        """
+        if not self.adaptive_per_page:
+            return per_page
+        if latency < self.PAGE_LATENCY_LOW:
+            return min(per_page * 2, self.MAX_PER_PAGE)
+        if latency > self.PAGE_LATENCY_HIGH:
+            return max(per_page // 2, self.MIN_PER_PAGE)
+        return per_page
+
+    def _fetch_collection_page(self, token, per_page):
+        log.info(f"Requesting {per_page} purchases using token {token}")
+        data = {
+            "fan_id": self.user_id,
+            "count": per_page,
+            "older_than_token": token,
+        }
+        url = self._construct_url("collection_items")
+        started = monotonic()
+        data = self._request(
+            "POST", url, json_data=data, is_json=True, endpoint="collection_items"
+        )
+        return data, monotonic() - started
+
+    def _iter_collection_pages(self):
+        """
+        Yields (items, redownload_urls) tuples for each page of the collection. When
+        pipelining is enabled the request for the next page is sent as soon as the
+        token of the last item on the current page is known, so it is in flight while
+        the caller processes the current page. If the caller stops iterating early any
+        page that was requested ahead is discarded.
+        """
+        now = int(time())
+        page_ts = 0
+        token = f"{now}:{page_ts}:a::"
+        per_page = self.per_page
+        executor = ThreadPoolExecutor(max_workers=1) if self.pipeline else None
+        pending = None
+        first_page = True
+        try:
+            while True:
+                if pending is not None:
+                    data, latency = pending.result()
+                    pending = None
+                elif first_page:
+                    data, latency = self._fetch_first_collection_page(token, per_page)
+                else:
+                    data, latency = self._fetch_collection_page(token, per_page)
+                first_page = False
+                try:
+                    items = data["items"]
+                except KeyError:
+                    raise BandcampError(
+                        "Failed to extract items from collection results page"
+                    )
+                if not items:
+                    log.info("Reached end of items")
+                    return
+                try:
+                    redownload_urls = data["redownload_urls"]
+                except KeyError:
+                    raise BandcampError(
+                        "Failed to extract redownload_urls from collection results page"
+                    )
+                next_token = None
+                for item_data in reversed(items):
+                    next_token = item_data.get("token")
+                    if next_token is not None:
+                        break
+                more_available = data.get("more_available", True)
+                per_page = self._next_per_page(per_page, latency)
+                if executor and next_token and more_available:
+                    pending = executor.submit(
+                        self._fetch_collection_page, next_token, per_page
+                    )
+                COLLECTION_PAGES.inc()
+                yield items, redownload_urls
+                if not more_available:
+                    log.info("Reached end of items")
+                    return
+                if next_token:
+                    token = next_token
+        finally:
+            if executor:
+                if pending is not None:
+                    pending.cancel()
+                executor.shutdown(wait=False)
+
+    def iter_purchases(self, stop_when=None):
+        """
+        Loads all purchases on the authenticated account, yielding each purchase as
+        soon as the page it is on has been loaded so callers can start working on
+        items while later pages are still being fetched. self.purchases and
+        self.collection_items are populated as items are yielded.
         If stop_when is provided, it is called for every parsed BandcampItem and
         should return True to stop pagination early.
+        Purchases that share an artist and title are given a folder suffix as soon as
+        the second one is found. An item that was yielded before its duplicate was
+        found will have its folder_suffix updated after it has been yielded.
         """
         if not self.is_authenticated:
             raise BandcampError(
@@ -276,82 +535,129 @@ class Bandcamp:
         log.info(f"Loading purchases for user id: {self.user_id}")
         self.purchases = []
         self.collection_items = []
-        now = int(time())
-        page_ts = 0
-        token = f"{now}:{page_ts}:a::"
-        per_page = 100
         items_by_title_key = {}
         stop_loading = False
-        while True:
-            log.info(f"Requesting {per_page} purchases using token {token}")
-            data = {
-                "fan_id": self.user_id,
-                "count": per_page,
-                "older_than_token": token,
-            }
-            url = self._construct_url("collection_items")
-            data = self._request("POST", url, json_data=data, is_json=True)
-            try:
-                items = data["items"]
-            except KeyError:
-                raise BandcampError(
-                    "Failed to extract items from collection results page"
-                )
-            if not items:
-                log.info("Reached end of items")
-                break
-            try:
-                redownload_urls = data["redownload_urls"]
-            except KeyError:
-                raise BandcampError(
-                    "Failed to extract redownload_urls from collection results page"
-                )
-            for item_data in items:
-                item = BandcampItem(item_data)
-                item_token = item.token
-                if item_token is not None:
-                    token = item_token
-                if not item.band_name:
-                    log.error(
-                        "Failed to locate band name in item metadata, skipping item..."
-                    )
-                    continue
-                if not item.item_title:
-                    log.error(
-                        f'Failed to locate title in item metadata (possibly a subscription?) for "{item.band_name}", skipping item...'
-                    )
-                    continue
-                if item.item_id is None:
-                    log.error(
-                        f'Failed to locate item id for "{item.band_name} / {item.item_title}", skipping item...'
+        pages = self._iter_collection_pages()
+        try:
+            for items, redownload_urls in pages:
+                for item_data in items:
+                    item = BandcampItem(item_data)
+                    if not item.band_name:
+                        log.error(
+                            "Failed to locate band name in item metadata, skipping item..."
+                        )
+                        continue
+                    if not item.item_title:
+                        log.error(
+                            f'Failed to locate title in item metadata (possibly a subscription?) for "{item.band_name}", skipping item...'
+                        )
+                        continue
+                    if item.item_id is None:
+                        log.error(
+                            f'Failed to locate item id for "{item.band_name} / {item.item_title}", skipping item...'
+                        )
+                        continue
+                    self.collection_items.append(item)
+                    if stop_when and stop_when(item):
+                        stop_loading = True
+                        break
+                    download_url = self._resolve_download_url(item, redownload_urls)
+                    if not download_url:
+                        continue
+                    item.download_url = download_url
+                    item_key = (item.band_name, item.item_title)
+                    title_group = items_by_title_key.setdefault(item_key, [])
+                    title_group.append(item)
+                    if len(title_group) > 1:
+                        for duplicate in title_group:
+                            duplicate.folder_suffix = f" [{duplicate.item_id}]"
+                    log.info(
+                        f"Found item: {item.band_name} / {item.item_title} (id:{item.item_id})"
                     )
-                    continue
-                self.collection_items.append(item)
-                if stop_when and stop_when(item):
-                    stop_loading = True
+                    self.purchases.append(item)
+                    yield item
+                if stop_loading:
+                    log.info("Stopping purchase pagination early due to stop condition")
                     break
-                download_url = self._resolve_download_url(item, redownload_urls)
-                if not download_url:
-                    continue
-                item.download_url = download_url
-                item_key = (item.band_name, item.item_title)
-                items_by_title_key.setdefault(item_key, []).append(item)
-                log.info(
-                    f"Found item: {item.band_name} / {item.item_title} (id:{item.item_id})"
-                )
-                self.purchases.append(item)
-            if stop_loading:
-                log.info("Stopping purchase pagination early due to stop condition")
-                break
+        finally:
+            pages.close()
 
         # De-duplicate multiple purchases sharing the same artist and title.
         self._deduplicate_purchases(items_by_title_key)
         log.info(f"Loaded {len(self.purchases)} purchases")
+
+    def load_purchases(self, stop_when=None):
+        """
+        Loads all purchases on the authenticated account and returns a list of
+        purchase data. Each purchase is a dict of data.
+        If stop_when is provided, it is called for every parsed BandcampItem and
+        should return True to stop pagination early.
+        """
+        for _ in self.iter_purchases(stop_when=stop_when):
+            pass
         return True
 
-    def get_download_file_url(self, item, encoding="flac"):
-        soup = self._request("get", item.download_url)
-        pagedata = self._extract_pagedata_from_soup(soup, id_name="pagedata")
+    @staticmethod
+    def _token_timestamp(token):
+        try:
+            return int(str(token).split(":")[0])
+        except (TypeError, ValueError):
+            return None
+
+    def resolve_download_urls(self, items):
+        """
+        Sets the download URL of items that were not loaded from the collection in
+        this run, such as items synced from the collection snapshot, and returns the
+        items that have one. Each collection page is requested from just before the
+        newest item still to resolve so items near each other share a page.
+        """
+        if not self.is_authenticated:
+            raise BandcampError(
+                "Authentication not verified, call load_pagedata() first"
+            )
+        pending = {item.item_id: item for item in items}
+        resolved = []
+        for item in items:
+            if item.item_id not in pending:
+                continue
+            page_ts = self._token_timestamp(item.token)
+            if page_ts is None:
+                log.warning(
+                    f"No collection token for {item.band_name} / {item.item_title} "
+                    f"(id:{item.item_id}), unable to resolve its download URL"
+                )
+                pending.pop(item.item_id)
+                continue
+            data, _ = self._fetch_collection_page(f"{page_ts + 1}:0:a::", self.per_page)
+            try:
+                page_items = data["items"]
+                redownload_urls = data["redownload_urls"]
+            except (KeyError, TypeError):
+                raise BandcampError(
+                    "Failed to extract items from collection results page"
+                )
+            COLLECTION_PAGES.inc()
+            for item_data in page_items:
+                page_item = pending.pop(item_data.get("item_id"), None)
+                if page_item is None:
+                    continue
+                download_url = self._resolve_download_url(page_item, redownload_urls)
+                if download_url:
+                    page_item.download_url = download_url
+                    resolved.append(page_item)
+            if pending.pop(item.item_id, None) is not None:
+                log.warning(
+                    f"{item.band_name} / {item.item_title} (id:{item.item_id}) is no "
+                    f"longer in the collection, skipping item..."
+                )
+        return resolved
+
+    def _parse_item_downloads(self, item, html):
+        """
+        Parses the download page HTML for an item and returns the "downloads" dict of
+        available encodings for it.
+        """
+        pagedata = self._extract_pagedata_from_html(html, id_name="pagedata")
         if not pagedata:
             raise BandcampError("No download information found for item")
         try:
@@ -370,40 +676,118 @@ class Bandcamp:
                 ) from e
             if digital_item_id == item.item_id:
                 try:
-                    downloads = digital_item["downloads"]
+                    return digital_item["downloads"]
                 except KeyError as e:
                     raise BandcampDownloadUnavailable(
                         f"No downloads listed for {item.band_name} / {item.item_title}"
                     ) from e
-                try:
-                    download_format = downloads[encoding]
-                except KeyError as e:
-                    encodings = downloads.keys()
-                    raise BandcampError(
-                        f"Download formats does not contain requested encoding: {encoding} "
-                        f"(available encodings: {encodings})"
-                    ) from e
-                try:
-                    return download_format["url"]
-                except KeyError as e:
-                    raise BandcampError(
-                        "Failed to parse pagedata JSON, does not contain an "
-                        '"digital_items.downloads.[encoding].url" key'
-                    ) from e
         raise BandcampDownloadUnavailable("No download available for item")
 
-    def check_download_stat(self, item, file_download_url):
+    def _load_item_downloads(self, item):
         """
-        Constructs the download "stat" URL and verifies the state of the download.
-        If the state is OK, return the existing URL (download is OK), otherwise wait
-        for the stat to complete and return the new download URL.
+        Fetches and parses the download page for an item and returns the "downloads"
+        dict of available encodings for it.
+        """
+        html = self._request(
+            "get", item.download_url, as_raw=True, endpoint="download_page"
+        )
+        return self._parse_item_downloads(item, html)
+
+    def _get_cached_item_downloads(self, item):
+        if self.download_cache is None:
+            return None
+        downloads = self.download_cache.get(item.item_id)
+        if downloads:
+            log.debug(f"Using cached download page for item id:{item.item_id}")
+        return downloads
+
+    def _put_cached_item_downloads(self, item, downloads):
+        if self.download_cache is not None and isinstance(downloads, dict):
+            self.download_cache.put(item.item_id, downloads)
+
+    def get_item_downloads(self, item):
+        """
+        Returns the "downloads" dict of available encodings for an item, from the
+        download page cache if it has a valid entry or by fetching the download page.
+        """
+        downloads = self._get_cached_item_downloads(item)
+        if downloads:
+            return downloads
+        lock = self.download_page_locks[hash(item.item_id) % self.DOWNLOAD_PAGE_LOCKS]
+        with lock:
+            # Fetched by another thread while this one waited
+            downloads = self._get_cached_item_downloads(item)
+            if downloads:
+                return downloads
+            downloads = self._load_item_downloads(item)
+            self._put_cached_item_downloads(item, downloads)
+        return downloads
+
+    def invalidate_item_downloads(self, item):
+        """
+        Drops any cached download page for an item, for example when a cached
+        download URL has stopped working.
+        """
+        if self.download_cache is not None:
+            return self.download_cache.invalidate(item.item_id)
+        return False
+
+    @staticmethod
+    def _select_download_url(downloads, encoding):
+        try:
+            download_format = downloads[encoding]
+        except KeyError as e:
+            encodings = downloads.keys()
+            raise BandcampError(
+                f"Download formats does not contain requested encoding: {encoding} "
+                f"(available encodings: {encodings})"
+            ) from e
+        try:
+            return download_format["url"]
+        except KeyError as e:
+            raise BandcampError(
+                "Failed to parse pagedata JSON, does not contain an "
+                '"digital_items.downloads.[encoding].url" key'
+            ) from e
+
+    def get_download_file_url(self, item, encoding="flac"):
+        downloads = self.get_item_downloads(item)
+        return self._select_download_url(downloads, encoding)
+
+    @staticmethod
+    def _select_download_size(downloads, encoding):
+        try:
+            return parse_size(downloads[encoding]["size_mb"])
+        except (KeyError, TypeError):
+            return None
+
+    def get_download_file_size(self, item, encoding="flac"):
         """
+        Returns the size in bytes of a download as listed on its download page, or
+        None if it is not listed.
+        """
+        downloads = self.get_item_downloads(item)
+        return self._select_download_size(downloads, encoding)
+
+    def get_download_file(self, item, encoding="flac"):
+        """
+        Returns the download URL of an item and its size in bytes, or None if the
+        size is not listed, from the same download page.
+        """
+        downloads = self.get_item_downloads(item)
+        return (
+            self._select_download_url(downloads, encoding),
+            self._select_download_size(downloads, encoding),
+        )
+
+    @staticmethod
+    def _stat_url(file_download_url):
         download_url_parts = urlsplit(file_download_url)
         path = download_url_parts.path
         path_parts = path.split("/")
         if path_parts[1] == "download":
             path_parts[1] = "statdownload"
-        stat_url = urlunsplit(
+        return urlunsplit(
             (
                 download_url_parts.scheme,
                 download_url_parts.netloc,
@@ -412,67 +796,138 @@ class Bandcamp:
                 "",
             )
         )
-        body = self._request("get", stat_url, as_raw=True)
-        return self._get_js_stat_url(body, file_download_url)
 
+    def check_download_stat(self, item, file_download_url):
+        """
+        Constructs the download "stat" URL and verifies the state of the download.
+        If the state is OK, return the existing URL (download is OK), otherwise wait
+        for the stat to complete and return the new download URL.
+        """
+        stat_url = self._stat_url(file_download_url)
+        body = self._request("get", stat_url, as_raw=True, endpoint="statdownload")
+        return self._get_js_stat_url(body, file_download_url)
 
-class BandcampItem:
-    def __init__(self, data):
-        self._data = data
-        self._data.setdefault("folder_suffix", "")
-
-    @property
-    def band_name(self):
-        return self._data.get("band_name")
 
-    @property
-    def item_title(self):
-        return self._data.get("item_title")
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(value):
+    """
+    Parses a download page size string, such as "93.2MB", into a number of bytes.
+    Returns None if the value cannot be parsed.
+    """
+    if not isinstance(value, str):
+        return None
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMG]?B)\s*", value.upper())
+    if not match:
+        return None
+    try:
+        return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+    except ValueError:
+        return None
+
+
+def parse_purchase_datetime(purchased):
+    """
+    Parses a collection "purchased" date string, such as "06 Feb 2026 19:06:47 GMT",
+    into a timezone aware datetime. Returns None if the value cannot be parsed.
+    """
+    if not purchased or not isinstance(purchased, str):
+        return None
+    if purchased.endswith(" GMT"):
+        try:
+            dt = datetime.strptime(purchased, "%d %b %Y %H:%M:%S GMT")
+            return dt.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    try:
+        dt = datetime.strptime(purchased, "%d %b %Y %H:%M:%S %Z")
+        return dt.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
 
-    @property
-    def item_id(self):
-        return self._data.get("item_id")
 
-    @property
-    def sale_item_type(self):
-        return self._data.get("sale_item_type")
+class BandcampItem:
+    """
+    A single item in a Bandcamp collection. Only the fields used to sync the item
+    are kept from the collection API payload so large collections stay compact in
+    memory. Pass keep_raw=True to also keep the full payload, which makes any other
+    payload key available as an attribute.
+    """
+
+    FIELDS = (
+        "band_name",
+        "item_title",
+        "item_id",
+        "item_type",
+        "sale_item_type",
+        "sale_item_id",
+        "token",
+        "purchased",
+        "is_preorder",
+        "download_url",
+        "folder_suffix",
+    )
+    __slots__ = FIELDS + ("_hidden", "_slug", "_purchased_datetime", "_raw")
+    _NOT_PARSED = object()
+
+    def __init__(self, data, keep_raw=False):
+        get = data.get
+        self.band_name = get("band_name")
+        self.item_title = get("item_title")
+        self.item_id = get("item_id")
+        self.item_type = get("item_type")
+        self.sale_item_type = get("sale_item_type")
+        self.sale_item_id = get("sale_item_id")
+        self.token = get("token")
+        self.purchased = get("purchased")
+        self.is_preorder = get("is_preorder")
+        self.download_url = get("download_url")
+        self.folder_suffix = get("folder_suffix") or ""
+        self._hidden = True if get("hidden", False) else False
+        url_hints = get("url_hints")
+        self._slug = url_hints.get("slug") if isinstance(url_hints, dict) else None
+        self._purchased_datetime = self._NOT_PARSED
+        self._raw = data if keep_raw else None
 
     @property
     def hidden(self):
-        return True if self._data.get("hidden", False) else False
+        return self._hidden
 
     @property
-    def token(self):
-        return self._data.get("token")
-
-    @property
-    def download_url(self):
-        return self._data.get("download_url")
-
-    @download_url.setter
-    def download_url(self, value):
-        self._data["download_url"] = value
+    def url_hints(self):
+        if self._slug is None:
+            return None
+        return {"slug": self._slug}
 
     @property
-    def folder_suffix(self):
-        return self._data["folder_suffix"]
-
-    @folder_suffix.setter
-    def folder_suffix(self, value):
-        self._data["folder_suffix"] = value
+    def purchased_datetime(self):
+        """The purchase date as a datetime, parsed on first access."""
+        if self._purchased_datetime is self._NOT_PARSED:
+            self._purchased_datetime = parse_purchase_datetime(self.purchased)
+        return self._purchased_datetime
 
     def is_physical_purchase(self):
         # Note that this only tells us that this is a physical purchase, not if there's also a digital download
-        item_type = self._data.get("item_type")
-        if item_type:
-            return item_type == "package"
-        return self._data.get("sale_item_type") == "p"
+        if self.item_type:
+            return self.item_type == "package"
+        return self.sale_item_type == "p"
+
+    def as_dict(self):
+        data = {key: getattr(self, key) for key in self.FIELDS}
+        data["hidden"] = self.hidden
+        data["url_hints"] = self.url_hints
+        return data
 
     def __repr__(self):
-        return json.dumps(self._data, indent=4, sort_keys=True)
+        return json.dumps(self.as_dict(), indent=4, sort_keys=True)
 
     def __getattr__(self, key):
+        # Only called for names that are not fields of the item
+        if key.startswith("__"):
+            raise AttributeError(key)
+        raw = object.__getattribute__(self, "_raw")
         try:
-            return self._data[key]
-        except KeyError as e:
+            return raw[key]
+        except (KeyError, TypeError) as e:
             raise KeyError(f'BandcampItem value "{key}" does not exist') from e
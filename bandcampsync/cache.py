@@ -0,0 +1,332 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from time import time
+from urllib.parse import urlsplit, parse_qs
+from .logger import get_logger
+
+
+log = get_logger("cache")
+
+
+def user_cache_dir():
+    """
+    Returns the directory for caches kept out of the media directory,
+    $XDG_CACHE_HOME/bandcampsync or ~/.cache/bandcampsync.
+    """
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "bandcampsync"
+
+
+class DownloadPageCache:
+    """
+    A persistent cache of the parsed "downloads" section of download pages. Each
+    cached item stores the available encodings with their signed download URLs and
+    sizes so retries and repeated runs can skip fetching the download page while the
+    URLs are still valid. The signed URLs let anyone download the items, so the file
+    is only readable by its owner and is kept out of the media directory. Stored in
+    the following format:
+
+        {
+            "version": 1,
+            "items": {
+                "<item_id>": {
+                    "fetched_at": 1700000000,
+                    "expires_at": 1700003600,
+                    "downloads": {
+                        "<encoding>": {"url": "...", "size_mb": "79MB"},
+                        ...
+                    }
+                }
+            }
+        }
+    """
+
+    CACHE_VERSION = 1
+    DEFAULT_TTL = 3600
+    MAX_ENTRIES = 5000
+    # Bandcamp does not say how long a signed URL is valid for, URLs are assumed to
+    # be valid for this long from when they were signed
+    SIGNED_URL_LIFETIME = 3600
+    # Entries expire this long before their URLs so a download started from a
+    # cached URL is not refused part way through a retry
+    EXPIRY_MARGIN = 300
+    CACHED_DOWNLOAD_KEYS = ("url", "size_mb")
+
+    def __init__(self, file_path, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.file_path = Path(file_path)
+        self.ttl = max(0, int(ttl))
+        self.max_entries = max(1, int(max_entries))
+        self.items = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def path_for(cache_dir, media_dir):
+        """
+        Returns the cache file in cache_dir for the downloads of a media directory,
+        each media directory has its own file.
+        """
+        media_dir = str(Path(media_dir).resolve())
+        digest = hashlib.sha256(media_dir.encode()).hexdigest()[:16]
+        return Path(cache_dir) / f".bandcampsync-cache-{digest}.json"
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @classmethod
+    def _signed_url_expires_at(cls, url, fetched_at):
+        """
+        Returns when a signed download URL stops being valid. This is the expiry
+        time at the start of its "token" query value if it has one, otherwise
+        SIGNED_URL_LIFETIME after its "ts" query value, which is when it was signed,
+        or after it was fetched if it has neither.
+        """
+        try:
+            query = parse_qs(urlsplit(url).query)
+        except (ValueError, TypeError):
+            query = {}
+        try:
+            return float(query["token"][0].split("_", 1)[0])
+        except (KeyError, IndexError, ValueError):
+            pass
+        try:
+            return float(query["ts"][0]) + cls.SIGNED_URL_LIFETIME
+        except (KeyError, IndexError, ValueError):
+            return fetched_at + cls.SIGNED_URL_LIFETIME
+
+    def _expires_at(self, fetched_at, downloads):
+        expires_at = fetched_at + self.ttl
+        for download in downloads.values():
+            url_expires_at = self._signed_url_expires_at(
+                download.get("url"), fetched_at
+            )
+            expires_at = min(expires_at, url_expires_at - self.EXPIRY_MARGIN)
+        return expires_at
+
+    def load(self):
+        if not self.enabled or not self.file_path.is_file():
+            return False
+        try:
+            with open(self.file_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Failed to parse download page cache "{self.file_path}": {e}')
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.CACHE_VERSION:
+            log.warning(f'Ignoring incompatible download page cache "{self.file_path}"')
+            return False
+        items = data.get("items")
+        if not isinstance(items, dict):
+            return False
+        now = time()
+        for item_id, entry in items.items():
+            if not isinstance(entry, dict) or entry.get("expires_at", 0) <= now:
+                self.dirty = True
+                continue
+            self.items[str(item_id)] = entry
+        log.info(
+            f'Loaded {len(self.items)} cached download pages from "{self.file_path}"'
+        )
+        return True
+
+    def get(self, item_id, encoding=None):
+        """
+        Returns the cached downloads dict for an item, or a single encoding entry if
+        an encoding is specified. Returns None if nothing valid is cached.
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.items.get(str(item_id))
+            if entry and entry.get("expires_at", 0) <= time():
+                del self.items[str(item_id)]
+                self.dirty = True
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            downloads = entry["downloads"]
+            if encoding is not None:
+                downloads = downloads.get(encoding)
+                if not downloads:
+                    self.misses += 1
+                    return None
+            self.hits += 1
+            return downloads
+
+    def put(self, item_id, downloads):
+        if not self.enabled:
+            return False
+        cached_downloads = {}
+        for encoding, download in downloads.items():
+            if not isinstance(download, dict) or not download.get("url"):
+                continue
+            cached_downloads[encoding] = {
+                k: download[k] for k in self.CACHED_DOWNLOAD_KEYS if k in download
+            }
+        if not cached_downloads:
+            return False
+        now = time()
+        with self.lock:
+            self.items[str(item_id)] = {
+                "fetched_at": now,
+                "expires_at": self._expires_at(now, cached_downloads),
+                "downloads": cached_downloads,
+            }
+            self.dirty = True
+        return True
+
+    def invalidate(self, item_id):
+        with self.lock:
+            if self.items.pop(str(item_id), None) is not None:
+                self.dirty = True
+                return True
+        return False
+
+    def _evict(self):
+        now = time()
+        for item_id in [k for k, v in self.items.items() if v["expires_at"] <= now]:
+            del self.items[item_id]
+        overflow = len(self.items) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self.items, key=lambda k: self.items[k]["fetched_at"])
+            for item_id in oldest[:overflow]:
+                del self.items[item_id]
+
+    def save(self):
+        if not self.enabled or not self.dirty:
+            return False
+        with self.lock:
+            self._evict()
+            data = {"version": self.CACHE_VERSION, "items": self.items}
+            temp_file_path = Path(f"{self.file_path}.tmp")
+            try:
+                self.file_path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(
+                    temp_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+                )
+                with open(fd, "wt", encoding="utf-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                temp_file_path.replace(self.file_path)
+            except OSError as e:
+                log.error(
+                    f'Failed to write download page cache "{self.file_path}": {e}'
+                )
+                if temp_file_path.exists():
+                    try:
+                        temp_file_path.unlink()
+                    except OSError:
+                        pass
+                return False
+            self.dirty = False
+        log.info(
+            f"Saved {len(self.items)} cached download pages "
+            f"({self.hits} hits, {self.misses} misses this run)"
+        )
+        return True
+
+
+class AuthCache:
+    """
+    A persistent cache of verified Bandcamp identities, keyed by a hash of the
+    identity cookie so the cookie itself is never written to disk. Stored in the
+    following format:
+
+        {
+            "version": 1,
+            "identities": {
+                "<sha256 of identity cookie>": {
+                    "user_id": 123,
+                    "user_verified": true,
+                    "verified_at": 1700000000
+                }
+            }
+        }
+    """
+
+    CACHE_VERSION = 1
+    DEFAULT_TTL = 2 * 86400
+
+    def __init__(self, file_path, ttl=DEFAULT_TTL):
+        self.file_path = Path(file_path)
+        self.ttl = max(0, int(ttl))
+        self.identities = {}
+        self.load()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def load(self):
+        if not self.enabled or not self.file_path.is_file():
+            return False
+        try:
+            with open(self.file_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Failed to parse auth cache "{self.file_path}": {e}')
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.CACHE_VERSION:
+            log.warning(f'Ignoring incompatible auth cache "{self.file_path}"')
+            return False
+        identities = data.get("identities")
+        if isinstance(identities, dict):
+            self.identities = identities
+        return True
+
+    def get(self, identity_hash):
+        if not self.enabled:
+            return None
+        identity = self.identities.get(identity_hash)
+        if not isinstance(identity, dict):
+            return None
+        if identity.get("verified_at", 0) + self.ttl <= time():
+            return None
+        if not isinstance(identity.get("user_id"), int):
+            return None
+        return identity
+
+    def put(self, identity_hash, user_id, user_verified):
+        if not self.enabled:
+            return False
+        self.identities[identity_hash] = {
+            "user_id": user_id,
+            "user_verified": user_verified,
+            "verified_at": time(),
+        }
+        return self.save()
+
+    def invalidate(self, identity_hash):
+        if self.identities.pop(identity_hash, None) is None:
+            return False
+        return self.save()
+
+    def save(self):
+        now = time()
+        self.identities = {
+            k: v
+            for k, v in self.identities.items()
+            if isinstance(v, dict) and v.get("verified_at", 0) + self.ttl > now
+        }
+        data = {"version": self.CACHE_VERSION, "identities": self.identities}
+        temp_file_path = Path(f"{self.file_path}.tmp")
+        try:
+            with open(temp_file_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+                f.write("\n")
+            temp_file_path.replace(self.file_path)
+        except OSError as e:
+            log.error(f'Failed to write auth cache "{self.file_path}": {e}')
+            if temp_file_path.exists():
+                try:
+                    temp_file_path.unlink()
+                except OSError:
+                    pass
+            return False
+        return True
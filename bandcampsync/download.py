@@ -1,14 +1,53 @@
+import errno
 import math
+import os
 import shutil
-from zipfile import ZipFile
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from io import BytesIO
+from time import monotonic
+import zlib
+from zipfile import BadZipFile, ZipFile
 from bs4 import BeautifulSoup
-from curl_cffi import requests
+from curl_cffi import CurlInfo, requests
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
+from .journal import parse_content_range
 from .logger import get_logger
+from .metrics import observe_transfer
+from .pagedata import find_tag_attrs
+from .sessions import SessionPool
+from .writer import (
+    MB,
+    BufferPool,
+    FileWriter,
+    ThreadedFileWriter,
+    TransferStats,
+    preallocate,
+)
 
 
 log = get_logger("download")
 
 
+# Largest block written to disk at once, and blocks queued for the writer thread
+MAX_BLOCK_SIZE = MB
+WRITER_QUEUE_DEPTH = 3
+# Size of the first range requested by a segmented download, which finds out if the
+# server supports ranges and the size of the file, and the smallest segment
+SEGMENT_PROBE_SIZE = MB
+MIN_SEGMENT_SIZE = MB
+# Bytes read from the start of a partial file to sniff its content
+SNIFF_SIZE = 4096
+# Errors from copy_file_range() when it cannot copy between two files
+COPY_FILE_RANGE_UNSUPPORTED = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+)
+
+
 def mask_sig(url):
     if "&sig=" not in url:
         return url
@@ -33,23 +72,62 @@ class DownloadExpired(ValueError):
     pass
 
 
+class DownloadRateLimited(DownloadBadStatusCode):
+    pass
+
+
+class DownloadInterrupted(DownloadBadStatusCode):
+    pass
+
+
+class DownloadInvalidArchive(DownloadInvalidContentType):
+    pass
+
+
+def _sniff_file(sniffer, target):
+    """Sniffs the content of a download from the start of its partial file."""
+    if sniffer is None or not hasattr(os, "pread"):
+        return
+    try:
+        target.flush()
+        head = os.pread(target.fileno(), SNIFF_SIZE, 0)
+    except (AttributeError, OSError, ValueError):
+        return
+    if head:
+        sniffer.sniff(head)
+
+
+def _abort_observers(observers, reason):
+    for observer in observers or ():
+        observer.abort(reason)
+
+
 def _is_expired_download_page(html):
     if not html:
         return False
-    soup = BeautifulSoup(html, "html.parser")
-    reauth_error = soup.select_one("div.email-reauth-error")
-    if not reauth_error:
+    if "email-reauth-error" not in html:
         return False
-    style = str(reauth_error.get("style")) or ""
+    attrs = find_tag_attrs(html, "email-reauth-error")
+    if attrs is not None and "email-reauth-error" in attrs.get("class", "").split():
+        style = attrs.get("style", "")
+    else:
+        # Markup is not in the expected shape, fall back to parsing the full page
+        soup = BeautifulSoup(html, "html.parser")
+        reauth_error = soup.select_one("div.email-reauth-error")
+        if not reauth_error:
+            return False
+        style = str(reauth_error.get("style")) or ""
     style = style.replace(" ", "").lower()
     return "display:none" not in style
 
 
-def _fetch_html_body(url):
+def _fetch_html_body(url, session_pool=None):
     if not url:
         return ""
+    if session_pool is None:
+        session_pool = SessionPool()
     try:
-        resp = requests.get(url, stream=False, impersonate="chrome")
+        resp = session_pool.request("GET", url)
     except requests.exceptions.RequestException as e:
         log.warning(f"Failed to fetch HTML body for: {url} ({e})")
         return ""
@@ -59,44 +137,402 @@ def _fetch_html_body(url):
         resp.close()
 
 
-def _read_html_body(response):
-    html_body = ""
-    try:
-        html_body = response.text or ""
-    except requests.exceptions.RequestException as e:
-        log.warning(f"Failed to read HTML body for: {response.url} ({e})")
-        pass
-    if not html_body:
+class _DownloadWriter:
+    """
+    Receives the body of a download in chunks as they arrive on the connection.
+    The status code and content type are checked when the first chunk arrives, the
+    body of a successful download is written to the target file handle and any other
+    body is kept in memory so it can be inspected once the request has completed.
+    When resuming a partial download a 206 response is written after the bytes
+    already downloaded, a 200 response means the server sent the whole file again so
+    it replaces them.
+
+    Chunks are copied into pooled buffers and written in blocks. The block size
+    starts at "chunk_size" and doubles after every block up to the pool's buffer
+    size, so small files are written promptly and large ones with few system calls.
+    Blocks are written in the calling thread, or with "threaded" in a separate
+    writer thread, in which case the file is also preallocated. Written blocks are
+    passed on to "observers" if the download starts from the first byte, otherwise
+    the observers are aborted. A ContentSniffer passed as "sniffer" classifies the
+    download from its first chunk, an HTML page is kept in memory like a disallowed
+    content type and unexpected content is "rejected", which aborts the request.
+    A body that is not written is kept in memory up to MAX_BUFFERED_BODY bytes and
+    the request is aborted if it is any longer, a resumed response that does not
+    match the partial file is aborted as soon as it starts and described by
+    "problem". Each chunk waits for the bandwidth limit of "rate_limiter" before it is taken.
+    """
+
+    MAX_BUFFERED_BODY = 1024 * 1024
+
+    def __init__(
+        self,
+        url,
+        curl,
+        target,
+        text,
+        chunk_size,
+        logevery,
+        disallow,
+        partial=None,
+        threaded=False,
+        buffer_pool=None,
+        observers=None,
+        sniffer=None,
+        rate_limiter=None,
+    ):
+        self.url = url
+        self.curl = curl
+        self.rate_limiter = rate_limiter
+        self.target = target
+        self.text = text
+        self.logevery = logevery
+        self.disallow = disallow
+        self.partial = partial
+        self.offset = partial.resume_offset if partial else 0
+        self.threaded = threaded
+        self.observers = observers or ()
+        self.sniffer = sniffer
+        self.rejected = None
+        self.problem = None
+        self.truncated = False
+        if buffer_pool is None:
+            depth = WRITER_QUEUE_DEPTH + 1 if threaded else 1
+            buffer_pool = BufferPool(MAX_BLOCK_SIZE, max_buffers=depth)
+        self.pool = buffer_pool
+        self.block_size = max(1, min(chunk_size, self.pool.buffer_size))
+        self.writing = None
+        self.sink = None
+        self.buffer = None
+        self.used = 0
+        self.body = BytesIO()
+        self.content_length = 0
+        self.data_streamed = 0
+        self.last_log = 0
+        self.preallocated = False
+        self.stats = TransferStats()
+        self.started = None
+
+    def _start(self, chunk):
+        self.started = monotonic()
+        status_code = self.curl.getinfo(CurlInfo.RESPONSE_CODE)
+        content_type = self.curl.getinfo(CurlInfo.CONTENT_TYPE) or b""
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode("latin-1")
+        major_content_type = content_type.split(";")[0].strip()
         try:
-            html_body = response.content.decode("utf-8", errors="replace")
-        except requests.exceptions.RequestException as e:
-            log.warning(f"Failed to decode HTML body for: {response.url} ({e})")
-            pass
-    if not html_body:
-        html_body = _fetch_html_body(response.url)
-    return html_body
+            self.content_length = max(
+                0, int(self.curl.getinfo(CurlInfo.CONTENT_LENGTH_DOWNLOAD_T))
+            )
+        except (TypeError, ValueError):
+            self.content_length = 0
+        if status_code == 206 and self.offset:
+            # The Content-Range header is checked once the request completes, the
+            # length is checked here so a mismatched range is never written
+            expected = self.partial.length - self.offset
+            self.writing = (
+                self.content_length == expected and major_content_type != self.disallow
+            )
+            if self.content_length != expected:
+                self.problem = f"got {self.content_length} bytes, expected {expected}"
+        else:
+            self.writing = status_code == 200 and major_content_type != self.disallow
+            if self.writing and self.offset:
+                log.info(
+                    f"Server sent the whole file, restarting: {mask_sig(self.url)}"
+                )
+                self.offset = 0
+                self.target.seek(0)
+                self.target.truncate()
+        if self.writing and self.sniffer is not None:
+            if self.offset:
+                _sniff_file(self.sniffer, self.target)
+            else:
+                self.sniffer.sniff(chunk)
+            if self.sniffer.is_html:
+                self.writing = False
+            elif self.sniffer.problem():
+                self.rejected = self.sniffer.problem()
+                self.writing = False
+        if not self.writing:
+            return
+        if self.partial:
+            self.partial.start(
+                self.url,
+                self.content_length,
+                major_content_type,
+                offset=self.offset,
+            )
+        observers = self.observers
+        if self.offset:
+            _abort_observers(observers, f"download resumed from byte {self.offset}")
+            observers = ()
+        if self.threaded:
+            if self.content_length and not self.text:
+                self.preallocated = preallocate(
+                    self.target, self.offset, self.offset + self.content_length
+                )
+            self.sink = ThreadedFileWriter(
+                self.target,
+                self.pool,
+                text=self.text,
+                partial=self.partial,
+                stats=self.stats,
+                observers=observers,
+                depth=WRITER_QUEUE_DEPTH,
+            )
+        else:
+            self.sink = FileWriter(
+                self.target,
+                self.pool,
+                text=self.text,
+                partial=self.partial,
+                stats=self.stats,
+                observers=observers,
+            )
+
+    def __call__(self, chunk):
+        if self.writing is None:
+            self._start(chunk)
+        if self.rejected or self.problem:
+            return CURL_WRITEFUNC_ERROR
+        if self.rate_limiter:
+            self.stats.throttle_seconds += self.rate_limiter.throttle(len(chunk))
+        if not self.writing:
+            if self.body.tell() >= self.MAX_BUFFERED_BODY:
+                # Only the start of a body that is not written is needed
+                self.truncated = True
+                return CURL_WRITEFUNC_ERROR
+            self.body.write(chunk)
+            return len(chunk)
+        view = memoryview(chunk)
+        while view:
+            if self.buffer is None:
+                waited = monotonic()
+                self.buffer = self.pool.acquire()
+                self.stats.wait_seconds += monotonic() - waited
+            size = min(self.block_size - self.used, len(view))
+            self.buffer[self.used : self.used + size] = view[:size]
+            self.used += size
+            view = view[size:]
+            if self.used >= self.block_size:
+                self._submit()
+        return len(chunk)
+
+    def _submit(self):
+        buffer, size = self.buffer, self.used
+        self.buffer = None
+        self.used = 0
+        waited = monotonic()
+        self.sink.submit(buffer, size)
+        self.stats.wait_seconds += monotonic() - waited
+        self.data_streamed += size
+        self.block_size = min(self.block_size * 2, self.pool.buffer_size)
+        if self.content_length > 0 and self.logevery > 0:
+            percent_complete = math.floor(
+                (
+                    (self.offset + self.data_streamed)
+                    / (self.offset + self.content_length)
+                )
+                * 100
+            )
+            if (
+                percent_complete % self.logevery == 0
+                and percent_complete > self.last_log
+            ):
+                log.info(f"Downloading {mask_sig(self.url)}: {percent_complete}%")
+                self.last_log = percent_complete
+
+    def flush(self):
+        """Writes any data received so far and waits for it to be written."""
+        if self.sink is None:
+            return
+        if self.used:
+            self._submit()
+        self.sink.drain()
+
+    def close(self, stats=None):
+        """
+        Stops the writer thread and releases the buffers. The transfer statistics
+        of the download are added to "stats" if it is passed.
+        """
+        if self.buffer is not None:
+            self.pool.release(self.buffer)
+            self.buffer = None
+            self.used = 0
+        if self.sink is None:
+            return
+        sink, self.sink = self.sink, None
+        sink.close()
+        if self.preallocated:
+            # Do not leave preallocated space past the end of a short download
+            end = self.offset + sink.written
+            if end < self.offset + self.content_length:
+                self.target.truncate(end)
+        self.stats.downloads = 1
+        self.stats.network_bytes = self.data_streamed
+        elapsed = monotonic() - self.started
+        self.stats.network_seconds = max(
+            0.0, elapsed - self.stats.wait_seconds - self.stats.throttle_seconds
+        )
+        log.debug(f"Downloaded {mask_sig(self.url)}, {self.stats.summary()}")
+        observe_transfer(self.stats)
+        if stats is not None:
+            stats.add(self.stats)
+
+    @property
+    def html_body(self):
+        return self.body.getvalue().decode("utf-8", errors="replace")
 
 
 def download_file(
     url,
     target,
     mode="wb",
-    chunk_size=8192,
+    chunk_size=64 * 1024,
     logevery=10,
     disallow_content_type="text/html",
+    rate_limiter=None,
+    session_pool=None,
+    partial=None,
+    threaded=False,
+    buffer_pool=None,
+    stats=None,
+    observers=None,
+    sniffer=None,
 ):
     """
     Attempts to stream a download to an open target file handle in chunks. If the
     request returns a disallowed content type, then return a failed state with the
-    response content.
+    response content. If a rate limiter is passed the request waits for the
+    "download" budget and any 429 or 503 response pauses all requests, the body is
+    received no faster than its bandwidth limit if it has one. If a session pool is
+    passed the download reuses an open connection to the host if possible.
+    If a PartialDownload is passed the target must be its open partial file, the
+    download resumes from the bytes already written with a Range request and the
+    journal is kept up to date so an interrupted download can be resumed later, if
+    the server answers with a range that does not match the partial file the
+    download is started again from the first byte.
+    With "threaded" the data is written to disk in a separate thread so a slow disk
+    does not hold up the network, "buffer_pool" can be shared between downloads to
+    bound the memory they use. The time spent receiving and writing the download is
+    added to "stats" if a TransferStats is passed. Each block of the download is
+    passed to the feed() method of "observers" in order as it is written, such as a
+    StreamingZipExtractor, if the download does not start from the first byte the
+    observers are aborted instead. A ContentSniffer passed as "sniffer" is set to
+    the kind of content downloaded from its magic bytes. A download that turns out
+    to be an HTML page is treated as a disallowed content type and one that is not
+    of an expected kind raises DownloadInvalidContentType as soon as it starts.
     """
     text = True if "t" in mode else False
-    data_streamed = 0
-    last_log = 0
-    r = requests.get(url, stream=True, impersonate="chrome")
+    if session_pool is None:
+        session_pool = SessionPool()
+    headers = None
+    if partial:
+        if partial.complete:
+            log.info(f"Download already complete: {mask_sig(url)}")
+            _abort_observers(observers, "download was already complete")
+            _sniff_file(sniffer, target)
+            return partial.content_type or ""
+        headers = partial.range_headers()
+        if headers:
+            log.info(
+                f"Resuming download from byte {partial.resume_offset} of "
+                f"{partial.length}: {mask_sig(url)}"
+            )
+        target.seek(partial.resume_offset)
+        target.truncate()
+    if rate_limiter:
+        rate_limiter.wait("download")
+    with session_pool.session(url) as pooled_session:
+        writer = _DownloadWriter(
+            url,
+            pooled_session.session.curl,
+            target,
+            text,
+            chunk_size,
+            logevery,
+            disallow_content_type,
+            partial=partial,
+            threaded=threaded,
+            buffer_pool=buffer_pool,
+            observers=observers,
+            sniffer=sniffer,
+            rate_limiter=rate_limiter,
+        )
+        try:
+            r = pooled_session.get(url, headers=headers, content_callback=writer)
+        except requests.exceptions.RequestException as e:
+            if writer.rejected:
+                writer.close()
+                raise DownloadInvalidContentType(
+                    f"Unexpected download: {writer.rejected}"
+                ) from e
+            if writer.problem:
+                writer.close()
+                r = None
+            elif writer.truncated and e.response is not None:
+                r = e.response
+            else:
+                try:
+                    if partial and writer.writing:
+                        writer.flush()
+                        writer.close(stats)
+                        partial.record_headers(getattr(e.response, "headers", None))
+                        partial.sync(target)
+                        log.warning(
+                            f"Download interrupted after {partial.bytes_written} of "
+                            f"{partial.length} bytes: {mask_sig(url)}"
+                        )
+                finally:
+                    writer.close()
+                raise DownloadInterrupted(f"Download failed: {e}") from e
+        except BaseException:
+            writer.close()
+            raise
+    if r is None:
+        log.warning(
+            f"Server did not honour the resume request ({writer.problem}), "
+            f"restarting: {mask_sig(url)}"
+        )
+        target.seek(0)
+        target.truncate()
+        partial.reset()
+        return download_file(
+            url,
+            target,
+            mode=mode,
+            chunk_size=chunk_size,
+            logevery=logevery,
+            disallow_content_type=disallow_content_type,
+            rate_limiter=rate_limiter,
+            session_pool=session_pool,
+            partial=partial,
+            threaded=threaded,
+            buffer_pool=buffer_pool,
+            stats=stats,
+            observers=observers,
+            sniffer=sniffer,
+        )
     try:
         # r.raise_for_status()
-        if r.status_code != 200:
+        if rate_limiter and rate_limiter.update(r.status_code, r.headers):
+            raise DownloadRateLimited(f"Rate limited with status code: {r.status_code}")
+        if r.status_code == 416 and partial:
+            partial.reset()
+            raise DownloadBadStatusCode("Server could not resume the download")
+        if r.status_code == 206 and writer.offset:
+            problem = partial.check_resumed(
+                r.headers.get("Content-Range"), writer.offset, writer.content_length
+            )
+            if problem is not None or not writer.writing:
+                writer.close()
+                target.seek(writer.offset)
+                target.truncate()
+                partial.reset()
+                raise DownloadBadStatusCode(
+                    f"Server did not honour the resume request: {problem or 'bad length'}"
+                )
+        elif r.status_code != 200:
             raise DownloadBadStatusCode(f"Got non-200 status code: {r.status_code}")
         try:
             content_type = r.headers.get("Content-Type", "")
@@ -104,34 +540,418 @@ def download_file(
             content_type = ""
         content_type_parts = content_type.split(";")
         major_content_type = content_type_parts[0].strip()
-        if major_content_type == disallow_content_type:
-            html_body = _read_html_body(r)
+        is_html = sniffer is not None and sniffer.is_html
+        if major_content_type == disallow_content_type or is_html:
+            html_body = writer.html_body
+            if not html_body:
+                html_body = _fetch_html_body(url, session_pool=session_pool)
             if _is_expired_download_page(html_body):
                 raise DownloadExpired(
                     "Download expired and requires email confirmation on Bandcamp"
                 )
+            if is_html and major_content_type != disallow_content_type:
+                raise DownloadInvalidContentType(
+                    f"Download is an HTML page served as: {major_content_type}"
+                )
             raise DownloadInvalidContentType(
                 f"Invalid content type: {major_content_type}"
             )
-        try:
-            content_length = int(r.headers.get("Content-Length", "0"))
-        except (ValueError, KeyError):
-            content_length = 0
-        for chunk in r.iter_content(chunk_size=chunk_size):
-            data_streamed += len(chunk)
-            if text:
-                chunk = chunk.decode()
-            target.write(chunk)
-            if content_length > 0 and logevery > 0:
-                percent_complete = math.floor((data_streamed / content_length) * 100)
-                if percent_complete % logevery == 0 and percent_complete > last_log:
-                    log.info(f"Downloading {mask_sig(url)}: {percent_complete}%")
-                    last_log = percent_complete
+        writer.flush()
+        writer.close(stats)
     finally:
-        r.close()
+        writer.close()
+    if partial:
+        partial.record_headers(r.headers)
+        partial.sync(target)
     return major_content_type
 
 
+def _content_type(headers):
+    try:
+        content_type = headers.get("Content-Type", "")
+    except (ValueError, KeyError):
+        content_type = ""
+    return (content_type or "").split(";")[0].strip()
+
+
+def _split_range(start, length, count):
+    """
+    Splits the bytes from "start" to the end of a file of "length" bytes into up to
+    "count" (start, end) ranges of similar size, none smaller than MIN_SEGMENT_SIZE.
+    """
+    remaining = length - start
+    if remaining <= 0:
+        return []
+    count = max(1, min(count, remaining // MIN_SEGMENT_SIZE))
+    size = math.ceil(remaining / count)
+    return [
+        (offset, min(offset + size, length) - 1)
+        for offset in range(start, length, size)
+    ]
+
+
+class _Segment:
+    """
+    One byte range of a segmented download, from "start" to "end" inclusive. Each
+    response body is written at its offset in the target with os.pwrite(), so
+    segments are written by several threads at once without seeking. A segment
+    that is interrupted is requested again from the last byte written. A response
+    that cannot be used is aborted as soon as it arrives and described by "problem".
+    The "probe" segment is the first request of a download and also accepts the
+    whole file in a 200 response from servers that do not support ranges.
+    """
+
+    def __init__(self, download, start, end, probe=False):
+        self.download = download
+        self.start = start
+        self.end = end
+        self.probe = probe
+        self.written = 0
+        self.requested = start
+        self.curl = None
+        self.accepted = None
+        self.problem = None
+
+    def __str__(self):
+        return f"bytes {self.start}-{self.end}"
+
+    @property
+    def length(self):
+        return self.end + 1 - self.start
+
+    @property
+    def done(self):
+        return self.written >= self.length
+
+    def prepare(self, curl):
+        self.curl = curl
+        self.requested = self.start + self.written
+        self.accepted = None
+        self.problem = None
+        return f"bytes={self.requested}-{self.end}"
+
+    def _accept(self):
+        status_code = self.curl.getinfo(CurlInfo.RESPONSE_CODE)
+        content_type = self.curl.getinfo(CurlInfo.CONTENT_TYPE) or b""
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode("latin-1")
+        if content_type.split(";")[0].strip() == self.download.disallow:
+            return False
+        try:
+            content_length = int(self.curl.getinfo(CurlInfo.CONTENT_LENGTH_DOWNLOAD_T))
+        except (TypeError, ValueError):
+            content_length = -1
+        if self.probe:
+            if status_code == 200:
+                return True
+            return status_code == 206 and 0 < content_length <= self.length
+        if status_code == 206:
+            expected = self.end + 1 - self.requested
+            if content_length != expected:
+                self.problem = f"got {content_length} bytes, expected {expected}"
+                return False
+            return True
+        if status_code == 200:
+            # The file changed since the first segment was requested, If-Range
+            # asked for all of it rather than a range of the old file
+            self.problem = "server sent the whole file, it may have changed"
+        return False
+
+    def __call__(self, chunk):
+        if self.accepted is None:
+            self.accepted = self._accept()
+        if self.download.cancelled:
+            self.problem = self.problem or "cancelled"
+            return CURL_WRITEFUNC_ERROR
+        if not self.accepted:
+            # Small error bodies are discarded, unusable file bodies are aborted
+            return CURL_WRITEFUNC_ERROR if self.problem else len(chunk)
+        if self.download.rate_limiter:
+            self.download.rate_limiter.throttle(len(chunk))
+        self.download.write(self.start + self.written, chunk)
+        self.written += len(chunk)
+        return len(chunk)
+
+
+class _SegmentedDownload:
+    """
+    The shared state of the segments of one download: the target file descriptor,
+    the validators sent with If-Range, progress and transfer statistics.
+    """
+
+    def __init__(
+        self, url, target, session_pool, rate_limiter, disallow, logevery, retries
+    ):
+        self.url = url
+        self.fd = target.fileno()
+        self.session_pool = session_pool
+        self.rate_limiter = rate_limiter
+        self.disallow = disallow
+        self.logevery = logevery
+        self.retries = max(1, retries)
+        self.validators = {}
+        self.length = 0
+        self.received = 0
+        self.last_log = 0
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.stats = TransferStats()
+
+    def set_validators(self, headers):
+        try:
+            etag = headers.get("ETag")
+            last_modified = headers.get("Last-Modified")
+        except (ValueError, KeyError):
+            return
+        # Weak ETags cannot be used with If-Range
+        if etag and not etag.startswith("W/"):
+            self.validators = {"If-Range": etag}
+        elif last_modified:
+            self.validators = {"If-Range": last_modified}
+
+    def write(self, offset, data):
+        view = memoryview(data)
+        started = monotonic()
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            offset += written
+            view = view[written:]
+        self.stats.add_disk(len(data), monotonic() - started)
+        with self.lock:
+            self.received += len(data)
+            if self.length <= 0 or self.logevery <= 0:
+                return
+            percent_complete = math.floor((self.received / self.length) * 100)
+            if (
+                percent_complete % self.logevery != 0
+                or percent_complete <= self.last_log
+            ):
+                return
+            self.last_log = percent_complete
+        log.info(f"Downloading {mask_sig(self.url)}: {percent_complete}%")
+
+    def request(self, segment):
+        if self.rate_limiter:
+            self.rate_limiter.wait("download")
+        with self.session_pool.session(self.url) as pooled_session:
+            headers = {"Range": segment.prepare(pooled_session.session.curl)}
+            headers.update(self.validators)
+            return pooled_session.get(
+                self.url, headers=headers, content_callback=segment
+            )
+
+    def check(self, segment, response):
+        """Returns a problem with a completed segment response, or None."""
+        if response.status_code != 206 or not segment.accepted:
+            return (
+                f"got status code {response.status_code} with content type "
+                f'"{_content_type(response.headers)}"'
+            )
+        parsed = parse_content_range(response.headers.get("Content-Range"))
+        expected = (segment.requested, segment.end, self.length)
+        if parsed != expected:
+            return f"got range {parsed}, expected {expected}"
+        return None
+
+    def fetch(self, segment):
+        """Downloads a segment, retrying it from where it stopped."""
+        for attempt in range(1, self.retries + 1):
+            try:
+                r = self.request(segment)
+            except requests.exceptions.RequestException as e:
+                if segment.problem:
+                    raise DownloadBadStatusCode(
+                        f"Download segment {segment} failed: {segment.problem}"
+                    ) from e
+                log.warning(
+                    f"Download segment {segment} interrupted after {segment.written} "
+                    f"of {segment.length} bytes (attempt {attempt}/{self.retries}): "
+                    f"{mask_sig(self.url)}"
+                )
+                continue
+            if self.rate_limiter and self.rate_limiter.update(r.status_code, r.headers):
+                continue
+            if r.status_code >= 500:
+                log.warning(
+                    f"Download segment {segment} got status code {r.status_code} "
+                    f"(attempt {attempt}/{self.retries}): {mask_sig(self.url)}"
+                )
+                continue
+            problem = self.check(segment, r)
+            if problem is not None:
+                raise DownloadBadStatusCode(
+                    f"Download segment {segment} failed: {problem}"
+                )
+            if segment.done:
+                return
+        raise DownloadInterrupted(
+            f"Download segment {segment} failed after {self.retries} attempts"
+        )
+
+    def fetch_all(self, ranges):
+        """Downloads the ranges in parallel, each over its own connection."""
+        segments = [_Segment(self, start, end) for start, end in ranges]
+        if len(segments) == 1:
+            return self.fetch(segments[0])
+        with ThreadPoolExecutor(
+            max_workers=len(segments), thread_name_prefix="bandcampsync-segment"
+        ) as executor:
+            futures = [executor.submit(self.fetch, segment) for segment in segments]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [f.exception() for f in futures if f in done and f.exception()]
+            if errors:
+                # Stop the other segments, the download is started again
+                self.cancelled = True
+                raise errors[0]
+
+
+def download_file_segmented(
+    url,
+    target,
+    segments=4,
+    min_size=64 * MB,
+    segment_retries=3,
+    mode="wb",
+    chunk_size=64 * 1024,
+    logevery=10,
+    disallow_content_type="text/html",
+    rate_limiter=None,
+    session_pool=None,
+    partial=None,
+    threaded=False,
+    buffer_pool=None,
+    stats=None,
+    observers=None,
+    sniffer=None,
+):
+    """
+    Downloads a file as byte ranges fetched in parallel over separate connections,
+    which is faster than a single stream when the download server limits the speed
+    of each connection. The first SEGMENT_PROBE_SIZE bytes are requested on their
+    own to find out if the server supports ranges and the size of the file. Files
+    of at least "min_size" bytes are then fetched as up to "segments" ranges into
+    one preallocated file, smaller files as one more range. Each segment is retried
+    up to "segment_retries" times from where it stopped and If-Range makes sure a
+    file that changed between requests is never mixed with the old one. Once all
+    segments are written every range and the size of the file are validated.
+
+    Falls back to download_file() if the server does not support ranges, for the
+    first response that is not a usable file such as an expired download page, for
+    text downloads and to resume a PartialDownload. A segmented download cannot be
+    resumed, if it fails the partial download is reset. Segments are not written in
+    order so "observers" are aborted unless the file is downloaded in one stream.
+    The other arguments and the return value are the same as download_file().
+    """
+
+    def single_stream():
+        return download_file(
+            url,
+            target,
+            mode=mode,
+            chunk_size=chunk_size,
+            logevery=logevery,
+            disallow_content_type=disallow_content_type,
+            rate_limiter=rate_limiter,
+            session_pool=session_pool,
+            partial=partial,
+            threaded=threaded,
+            buffer_pool=buffer_pool,
+            stats=stats,
+            observers=observers,
+            sniffer=sniffer,
+        )
+
+    if segments < 2 or "t" in mode or not hasattr(os, "pwrite"):
+        return single_stream()
+    if partial and (partial.complete or partial.resume_offset):
+        return single_stream()
+    if session_pool is None:
+        session_pool = SessionPool(size=segments)
+    target.seek(0)
+    target.truncate()
+    target.flush()
+    download = _SegmentedDownload(
+        url,
+        target,
+        session_pool,
+        rate_limiter,
+        disallow_content_type,
+        logevery,
+        segment_retries,
+    )
+    started = monotonic()
+    probe = _Segment(download, 0, SEGMENT_PROBE_SIZE - 1, probe=True)
+    try:
+        r = download.request(probe)
+    except requests.exceptions.RequestException as e:
+        raise DownloadInterrupted(f"Download failed: {e}") from e
+    if rate_limiter and rate_limiter.update(r.status_code, r.headers):
+        raise DownloadRateLimited(f"Rate limited with status code: {r.status_code}")
+    content_type = _content_type(r.headers)
+    parsed = parse_content_range(r.headers.get("Content-Range"))
+    if not probe.accepted or (
+        r.status_code == 206
+        and (parsed is None or parsed[:2] != (0, probe.written - 1) or not parsed[2])
+    ):
+        # A single request reports the problem, or downloads the whole file if the
+        # range cannot be used
+        log.info(f"Not downloading in segments: {mask_sig(url)}")
+        target.seek(0)
+        target.truncate()
+        return single_stream()
+    _sniff_file(sniffer, target)
+    if sniffer is not None and sniffer.is_html:
+        target.seek(0)
+        target.truncate()
+        return single_stream()
+    if sniffer is not None and sniffer.problem():
+        raise DownloadInvalidContentType(f"Unexpected download: {sniffer.problem()}")
+    _abort_observers(observers, "segmented downloads are not streamed in order")
+    if r.status_code == 200:
+        log.info(
+            f"Server does not support ranges, downloaded in one stream: {mask_sig(url)}"
+        )
+        length = probe.written
+        if partial:
+            partial.start(url, length, content_type)
+    else:
+        length = download.length = parsed[2]
+        download.set_validators(r.headers)
+        count = segments if length >= min_size else 1
+        ranges = _split_range(probe.written, length, count)
+        if partial:
+            partial.start(url, length, content_type)
+            partial.record_headers(r.headers)
+        if ranges:
+            log.info(
+                f"Downloading {length} bytes in {len(ranges)} segments: {mask_sig(url)}"
+            )
+            preallocate(target, probe.written, length)
+            try:
+                download.fetch_all(ranges)
+            except BaseException:
+                if partial:
+                    partial.reset()
+                raise
+    size = os.fstat(download.fd).st_size
+    if size != length:
+        if partial:
+            partial.reset()
+        raise DownloadInterrupted(f"Downloaded {size} bytes, expected {length}")
+    transfer = download.stats
+    transfer.downloads = 1
+    transfer.network_bytes = download.received
+    transfer.network_seconds = monotonic() - started
+    log.debug(f"Downloaded {mask_sig(url)}, {transfer.summary()}")
+    observe_transfer(transfer)
+    if stats is not None:
+        stats.add(transfer)
+    if partial:
+        partial.bytes_written = length
+        partial.sync(target)
+    return content_type
+
+
 def is_zip_file(file_path):
     try:
         with ZipFile(file_path) as z:
@@ -141,15 +961,69 @@ def is_zip_file(file_path):
         return False
 
 
-def unzip_file(decompress_from, decompress_to):
-    with ZipFile(decompress_from) as z:
-        z.extractall(decompress_to)
-    return True
+def unzip_file(decompress_from, decompress_to, extractor=None, member_path=None):
+    """
+    Extracts a zip file into "decompress_to". With a ParallelZipExtractor the
+    members are inflated in parallel, "member_path" can name the file each member
+    is written to instead and the extracted files are returned as (path, digest)
+    pairs. Without one an empty list is returned.
+    """
+    try:
+        if extractor is not None:
+            return extractor.extract(
+                decompress_from, decompress_to, member_path=member_path
+            )
+        with ZipFile(decompress_from) as z:
+            z.extractall(decompress_to)
+    except (BadZipFile, EOFError, NotImplementedError, zlib.error) as e:
+        raise DownloadInvalidArchive(f"Failed to extract zip file: {e}") from e
+    return []
 
 
 def move_file(src, dst):
-    return shutil.move(src, dst)
+    """
+    Renames a file or directory, copying it only if it is on another filesystem.
+    """
+    return shutil.move(src, dst, copy_function=copy_file)
+
+
+def _copy_file_range(src, dst):
+    """
+    Copies a file in the kernel with copy_file_range(), which can share blocks on
+    filesystems that support reflinks. Returns False if it is not supported here,
+    before anything has been copied. Raises OSError if the copy stops short.
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        while copied < size:
+            try:
+                sent = copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+            except OSError as e:
+                if copied == 0 and e.errno in COPY_FILE_RANGE_UNSUPPORTED:
+                    return False
+                raise
+            if sent == 0:
+                if copied == 0:
+                    # Some filesystems copy nothing rather than raising an error
+                    return False
+                break
+            copied += sent
+    if copied < size:
+        raise OSError(
+            f"Copied {copied} of {size} bytes from {src} to {dst} with copy_file_range()"
+        )
+    return True
 
 
 def copy_file(src, dst):
+    """
+    Copies a file without reading it into Python, with copy_file_range() or
+    otherwise shutil.copyfile(), which uses sendfile() where it can.
+    """
+    if _copy_file_range(src, dst):
+        return dst
     return shutil.copyfile(src, dst)
@@ -0,0 +1,209 @@
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from tempfile import mkstemp
+from time import monotonic
+from zipfile import ZipFile
+from .logger import get_logger
+from .manifest import new_hash
+
+
+log = get_logger("extract")
+
+
+MB = 1024 * 1024
+COPY_BUFFER_SIZE = MB
+
+
+def _read_umask():
+    # The umask can only be read by setting it, so it is read once on import
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Extracted files are created by mkstemp() as 0600, they are given the mode
+# ZipFile.extract() would have created them with
+FILE_MODE = 0o666 & ~_read_umask()
+
+
+def member_name(info):
+    """
+    Returns the relative path a zip member is extracted to, with absolute paths,
+    drive letters and ".." components removed the same way ZipFile.extract does, or
+    an empty string if nothing is left.
+    """
+    name = info.filename.replace("/", os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    parts = (p for p in name.split(os.path.sep) if p not in ("", ".", ".."))
+    return os.path.sep.join(parts)
+
+
+class ParallelZipExtractor:
+    """
+    Extracts zip files with the members inflated in parallel on a pool of threads,
+    zlib releases the GIL while it decompresses so each thread can use a core. The
+    pool is shared by every extraction so "workers" is the CPU budget for
+    extraction as a whole, separate from the number of concurrent downloads. Each
+    member is written to a temporary file next to its destination and only renamed
+    into place once every member has been extracted and its CRC checked.
+    """
+
+    TEMP_PREFIX = ".bandcampsync-extract-"
+
+    def __init__(self, workers=0):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.archives = 0
+        self.extracted_bytes = 0
+        self.extract_seconds = 0.0
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="bandcampsync-extract",
+                )
+            return self.executor
+
+    def _extract_member(self, zip_path, info, target):
+        """
+        Extracts a member to a temporary file, hashing it as it is written. Returns
+        the temporary path and the hex digest.
+        """
+        fd, temp_path = mkstemp(dir=target.parent, prefix=self.TEMP_PREFIX)
+        member_hash = new_hash()
+        try:
+            os.fchmod(fd, FILE_MODE)
+            with (
+                os.fdopen(fd, "wb") as dest,
+                ZipFile(zip_path) as z,
+                z.open(info) as source,
+            ):
+                while True:
+                    block = source.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    member_hash.update(block)
+                    dest.write(block)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, member_hash.hexdigest()
+
+    def _run(self, zip_path, members):
+        """
+        Extracts (info, target) pairs largest first so a long member does not start
+        last, returns the temporary paths and digests in the same order.
+        """
+        order = sorted(
+            range(len(members)), key=lambda i: members[i][0].file_size, reverse=True
+        )
+        if self.workers == 1 or len(members) < 2:
+            extracted = {}
+            try:
+                for i in order:
+                    extracted[i] = self._extract_member(zip_path, *members[i])
+            except BaseException:
+                self._remove(path for path, digest in extracted.values())
+                raise
+            return [extracted[i] for i in range(len(members))]
+        executor = self._executor()
+        futures = {
+            i: executor.submit(self._extract_member, zip_path, *members[i])
+            for i in order
+        }
+        _, not_done = wait(futures.values(), return_when=FIRST_EXCEPTION)
+        if not_done:
+            # A member failed, wait for the members already being extracted so
+            # their temporary files can be removed
+            for future in not_done:
+                future.cancel()
+            wait(not_done)
+        failed = [f for f in futures.values() if not f.cancelled() and f.exception()]
+        if failed:
+            self._remove(
+                f.result()[0]
+                for f in futures.values()
+                if not f.cancelled() and not f.exception()
+            )
+            raise failed[0].exception()
+        return [futures[i].result() for i in range(len(members))]
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def extract(self, zip_path, dest_dir, member_path=None):
+        """
+        Extracts every member of the zip file at "zip_path" into "dest_dir", or to
+        the path returned by "member_path" for the member's relative path if it is
+        set, such as a file in the media directory. Returns the extracted paths
+        with the hex digest of each file's content, as (path, digest) pairs.
+        Raises the errors of ZipFile and zlib if the zip file is not valid, in which
+        case no files are extracted.
+        """
+        started = monotonic()
+        dest_dir = Path(dest_dir)
+        members = []
+        with ZipFile(zip_path) as z:
+            for info in z.infolist():
+                name = member_name(info)
+                if not name:
+                    continue
+                target = Path(member_path(name)) if member_path else dest_dir / name
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                members.append((info, target))
+        extracted = []
+        for (temp_path, digest), (info, target) in zip(
+            self._run(zip_path, members), members
+        ):
+            os.replace(temp_path, target)
+            extracted.append((target, digest))
+        seconds = monotonic() - started
+        size = sum(info.file_size for info, target in members)
+        with self.lock:
+            self.archives += 1
+            self.extracted_bytes += size
+            self.extract_seconds += seconds
+        log.info(
+            f"Extracted {len(members)} files, {size / MB:.1f} MB in {seconds:.1f}s "
+            f"({self._rate(size, seconds)}) with up to {self.workers} threads"
+        )
+        return extracted
+
+    @staticmethod
+    def _rate(size, seconds):
+        if seconds <= 0:
+            return "-"
+        return f"{size / MB / seconds:.1f} MB/s"
+
+    @property
+    def extract_rate(self):
+        return self._rate(self.extracted_bytes, self.extract_seconds)
+
+    def log_stats(self):
+        if not self.archives:
+            return
+        log.info(
+            f"Extracted {self.archives} zip files, "
+            f"{self.extracted_bytes / MB:.1f} MB at {self.extract_rate}"
+        )
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,287 @@
+import json
+import os
+import re
+from pathlib import Path
+from time import time
+from .logger import get_logger
+
+
+log = get_logger("journal")
+
+
+CONTENT_RANGE_PATTERN = re.compile(r"^\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$", re.I)
+
+
+def parse_content_range(value):
+    """
+    Parses a "Content-Range: bytes 100-199/1000" header value into a (start, end,
+    total) tuple. The total is None if it is not known. Returns None if the value
+    cannot be parsed.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    match = CONTENT_RANGE_PATTERN.match(value)
+    if not match:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == "*" else int(total)
+
+
+class PartialDownload:
+    """
+    A download written to a partial file that is kept between attempts and runs.
+    A small journal next to the partial file records the download URL, the total
+    length, the ETag and Last-Modified validators and how many bytes have been
+    written, so an interrupted download can be resumed with a Range request instead
+    of starting from the first byte again. Data is flushed to disk before the
+    journal records it, so after a crash the journal never claims more than has
+    been written. Stored in the following format:
+
+        {
+            "version": 1,
+            "url": "https://p4.bcbits.com/download/album/...",
+            "etag": "\"abc123\"",
+            "last_modified": "Mon, 02 Feb 2026 10:00:00 GMT",
+            "length": 2147483648,
+            "content_type": "application/zip",
+            "bytes_written": 1073741824,
+            "updated_at": 1700000000
+        }
+    """
+
+    JOURNAL_VERSION = 1
+    # Bytes written between journal updates, each update also syncs the partial file
+    SAVE_EVERY = 16 * 1024 * 1024
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.journal_path = Path(f"{self.path}.json")
+        self.url = None
+        self.etag = None
+        self.last_modified = None
+        self.length = 0
+        self.content_type = None
+        self.bytes_written = 0
+        self.saved_bytes = 0
+        self.load()
+
+    @property
+    def resume_offset(self):
+        """The offset to resume the download from, or 0 to start again."""
+        if self.bytes_written > 0 and self.length > 0:
+            return min(self.bytes_written, self.length)
+        return 0
+
+    @property
+    def complete(self):
+        return self.length > 0 and self.bytes_written >= self.length
+
+    def load(self):
+        if not self.journal_path.is_file():
+            return False
+        try:
+            with open(self.journal_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Failed to parse download journal "{self.journal_path}": {e}')
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.JOURNAL_VERSION:
+            log.warning(f'Ignoring incompatible download journal "{self.journal_path}"')
+            return False
+        try:
+            file_size = self.path.stat().st_size
+        except OSError:
+            file_size = 0
+        try:
+            self.length = max(0, int(data.get("length") or 0))
+            bytes_written = max(0, int(data.get("bytes_written") or 0))
+        except (TypeError, ValueError):
+            return False
+        self.url = data.get("url")
+        self.etag = data.get("etag")
+        self.last_modified = data.get("last_modified")
+        self.content_type = data.get("content_type")
+        # Anything past the last journal update may not have reached the disk
+        self.bytes_written = min(bytes_written, file_size)
+        self.saved_bytes = self.bytes_written
+        return True
+
+    def open(self):
+        """
+        Opens the partial file for writing, truncated to the bytes recorded in the
+        journal.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "r+b" if self.path.is_file() else "w+b")
+        f.seek(self.bytes_written)
+        f.truncate()
+        return f
+
+    def range_headers(self):
+        """Returns the headers to request the rest of the download."""
+        offset = self.resume_offset
+        if not offset:
+            return {}
+        headers = {"Range": f"bytes={offset}-"}
+        # Weak ETags cannot be used with If-Range
+        if self.etag and not self.etag.startswith("W/"):
+            headers["If-Range"] = self.etag
+        elif self.last_modified:
+            headers["If-Range"] = self.last_modified
+        return headers
+
+    def check_resumed(self, content_range, offset, content_length=0):
+        """
+        Checks a 206 response to a request for the download from "offset" is the
+        rest of this download. Returns a message describing the problem, or None if
+        the response can be used.
+        """
+        parsed = parse_content_range(content_range)
+        if parsed is None:
+            return f"invalid Content-Range: {content_range}"
+        start, end, total = parsed
+        if start != offset:
+            return f"range starts at {start}, expected {offset}"
+        if total is not None and total != self.length:
+            return f"total length is {total}, expected {self.length}"
+        if end + 1 != self.length:
+            return f"range ends at {end}, expected {self.length - 1}"
+        if content_length and content_length != end + 1 - start:
+            return f"Content-Length {content_length} does not match the range"
+        return None
+
+    def start(self, url, length, content_type, offset=0):
+        """Records the start of a download, or of the rest of a resumed download."""
+        self.url = url
+        self.content_type = content_type
+        if not offset:
+            self.length = max(0, int(length or 0))
+            self.etag = None
+            self.last_modified = None
+            self.bytes_written = 0
+            self.saved_bytes = 0
+        self.save()
+
+    def record_headers(self, headers):
+        """Records the ETag and Last-Modified validators of a response."""
+        if not headers:
+            return
+        try:
+            etag = headers.get("ETag")
+            last_modified = headers.get("Last-Modified")
+        except (ValueError, KeyError):
+            return
+        if etag:
+            self.etag = etag
+        if last_modified:
+            self.last_modified = last_modified
+
+    def written(self, size, target):
+        """
+        Records bytes written to the target. Every SAVE_EVERY bytes the target is
+        synced to disk and the journal is updated.
+        """
+        self.bytes_written += size
+        if self.bytes_written - self.saved_bytes >= self.SAVE_EVERY:
+            self.sync(target)
+
+    def sync(self, target):
+        """Syncs the target to disk and records the bytes written in the journal."""
+        try:
+            target.flush()
+            os.fsync(target.fileno())
+        except (AttributeError, OSError, ValueError):
+            pass
+        self.save()
+
+    def save(self):
+        data = {
+            "version": self.JOURNAL_VERSION,
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "length": self.length,
+            "content_type": self.content_type,
+            "bytes_written": self.bytes_written,
+            "updated_at": int(time()),
+        }
+        temp_journal_path = Path(f"{self.journal_path}.tmp")
+        try:
+            with open(temp_journal_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            temp_journal_path.replace(self.journal_path)
+        except OSError as e:
+            log.error(f'Failed to write download journal "{self.journal_path}": {e}')
+            return False
+        self.saved_bytes = self.bytes_written
+        return True
+
+    def reset(self):
+        """Discards the partial download so the next attempt starts again."""
+        self.url = None
+        self.etag = None
+        self.last_modified = None
+        self.length = 0
+        self.content_type = None
+        self.bytes_written = 0
+        self.saved_bytes = 0
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def remove(self):
+        """Removes the partial file and its journal."""
+        self.reset()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class DownloadJournal:
+    """
+    A directory of partial downloads, one per item and encoding, so downloads that
+    were in flight when a sync was interrupted are resumed by the next run.
+    """
+
+    PARTIAL_SUFFIX = ".part"
+    MAX_AGE = 7 * 86400
+
+    def __init__(self, dir_path):
+        self.dir_path = Path(dir_path)
+
+    def partial(self, item_id, encoding):
+        safe_encoding = re.sub(r"[^A-Za-z0-9_-]", "", str(encoding))
+        name = f"{item_id}-{safe_encoding}{self.PARTIAL_SUFFIX}"
+        return PartialDownload(self.dir_path / name)
+
+    def pending(self):
+        """Returns the partial downloads that can be resumed."""
+        if not self.dir_path.is_dir():
+            return []
+        partials = []
+        for path in sorted(self.dir_path.glob(f"*{self.PARTIAL_SUFFIX}")):
+            partial = PartialDownload(path)
+            if partial.resume_offset:
+                partials.append(partial)
+        return partials
+
+    def prune(self, max_age=MAX_AGE):
+        """Removes partial files and journals that have not been updated recently."""
+        if not self.dir_path.is_dir():
+            return 0
+        removed = 0
+        cutoff = time() - max_age
+        for path in self.dir_path.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError as e:
+                log.warning(f'Failed to remove stale partial download "{path}": {e}')
+        if removed:
+            log.info(
+                f'Removed {removed} stale partial download files from "{self.dir_path}"'
+            )
+        return removed
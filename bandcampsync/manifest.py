@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import time
+from .logger import get_logger
+from .ratelimit import TokenBucket
+
+
+log = get_logger("manifest")
+
+
+MB = 1024 * 1024
+HASH_ALGORITHM = "sha256"
+READ_BLOCK_SIZE = MB
+
+
+def new_hash():
+    return hashlib.new(HASH_ALGORITHM)
+
+
+def hash_file(path, bucket=None):
+    """
+    Returns the size and hex digest of the file at "path". If "bucket" is set it is
+    a TokenBucket measured in MB that reads are throttled by.
+    """
+    file_hash = new_hash()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            if bucket is not None:
+                bucket.acquire(len(block) / MB)
+            file_hash.update(block)
+            size += len(block)
+    return size, file_hash.hexdigest()
+
+
+class StreamHasher:
+    """
+    Hashes a download as it is written, passed to a download as an observer. If the
+    download is not streamed from its first byte the hasher is aborted and has no
+    digest, the file then has to be hashed once it is complete.
+    """
+
+    def __init__(self):
+        self.hash = new_hash()
+        self.size = 0
+        self.aborted = False
+
+    def feed(self, data):
+        if not self.aborted:
+            self.hash.update(data)
+            self.size += len(data)
+
+    def abort(self, reason=None):
+        self.aborted = True
+
+    def hexdigest(self):
+        return None if self.aborted else self.hash.hexdigest()
+
+
+class AlbumManifest:
+    """
+    A record of the files installed for an item, stored in the item directory so
+    the files can be verified later. Each file has its size, modification time and
+    hash. Stored in the following format:
+
+        {
+            "version": 1,
+            "item_id": 123,
+            "algorithm": "sha256",
+            "created_at": 1700000000,
+            "verified_at": 1700000000,
+            "files": {
+                "Track Name.flac": {"size": 1234, "mtime_ns": 1700..., "sha256": "..."},
+                ...
+            }
+        }
+
+    File names are relative to the item directory.
+    """
+
+    MANIFEST_FILENAME = "bandcamp_manifest.json"
+    MANIFEST_VERSION = 1
+
+    def __init__(self, dir_path, item_id=None):
+        self.dir_path = Path(dir_path)
+        self.item_id = item_id
+        self.files = {}
+        self.created_at = int(time())
+        self.verified_at = None
+
+    @property
+    def file_path(self):
+        return self.dir_path / self.MANIFEST_FILENAME
+
+    @classmethod
+    def load(cls, dir_path):
+        """Returns the manifest in "dir_path", or None if it is missing or invalid."""
+        manifest = cls(dir_path)
+        try:
+            with open(manifest.file_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Failed to parse manifest "{manifest.file_path}": {e}')
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != cls.MANIFEST_VERSION
+            or data.get("algorithm") != HASH_ALGORITHM
+            or not isinstance(data.get("files"), dict)
+        ):
+            log.warning(f'Ignoring incompatible manifest "{manifest.file_path}"')
+            return None
+        manifest.item_id = data.get("item_id")
+        manifest.created_at = data.get("created_at", manifest.created_at)
+        manifest.verified_at = data.get("verified_at")
+        manifest.files = {
+            name: entry
+            for name, entry in data["files"].items()
+            if isinstance(entry, dict) and entry.get(HASH_ALGORITHM)
+        }
+        return manifest
+
+    def add(self, path, digest=None):
+        """
+        Adds an installed file with its hex digest, or hashes the file if the
+        digest is not known.
+        """
+        path = Path(path)
+        stat = path.stat()
+        if digest is None:
+            digest = hash_file(path)[1]
+        self.files[path.relative_to(self.dir_path).as_posix()] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            HASH_ALGORITHM: digest,
+        }
+
+    def save(self):
+        data = {
+            "version": self.MANIFEST_VERSION,
+            "item_id": self.item_id,
+            "algorithm": HASH_ALGORITHM,
+            "created_at": self.created_at,
+            "verified_at": self.verified_at,
+            "files": self.files,
+        }
+        temp_file_path = Path(f"{self.file_path}.tmp")
+        try:
+            with open(temp_file_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+                f.write("\n")
+            temp_file_path.replace(self.file_path)
+        except OSError:
+            if temp_file_path.exists():
+                try:
+                    temp_file_path.unlink()
+                except OSError:
+                    pass
+            raise
+        return True
+
+    def verify(self, bucket=None, stats=None):
+        """
+        Checks the files in the manifest, only files whose size or modification
+        time has changed since they were recorded are hashed again. Files whose
+        hash still matches have their new modification time recorded. Returns a
+        list of problems, empty if every file is intact.
+        """
+        problems = []
+        for name, entry in self.files.items():
+            path = self.dir_path / name
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                problems.append(f"{name}: missing")
+                continue
+            if stat.st_size != entry.get("size"):
+                problems.append(
+                    f"{name}: size is {stat.st_size}, expected {entry.get('size')}"
+                )
+                continue
+            if stat.st_mtime_ns == entry.get("mtime_ns"):
+                if stats is not None:
+                    stats.add_skipped()
+                continue
+            size, digest = hash_file(path, bucket)
+            if stats is not None:
+                stats.add_hashed(size)
+            if digest != entry[HASH_ALGORITHM]:
+                problems.append(f"{name}: {HASH_ALGORITHM} does not match")
+                continue
+            entry["mtime_ns"] = stat.st_mtime_ns
+        self.verified_at = int(time())
+        return problems
+
+
+class VerifyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.albums = 0
+        self.hashed_files = 0
+        self.hashed_bytes = 0
+        self.skipped_files = 0
+
+    def add_hashed(self, size):
+        with self.lock:
+            self.hashed_files += 1
+            self.hashed_bytes += size
+
+    def add_skipped(self):
+        with self.lock:
+            self.skipped_files += 1
+
+
+class LibraryVerifier:
+    """
+    Verifies every item in a media directory that has a manifest, in parallel on
+    "workers" threads. Reads are throttled to "rate" MB/s across all threads so a
+    large library can be checked without saturating its disks, 0 is unlimited.
+    Only changed files are read, see AlbumManifest.verify().
+    """
+
+    def __init__(self, media_dir, workers=1, rate=0, save=True):
+        self.media_dir = Path(media_dir)
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate)
+        self.save = save
+        self.stats = VerifyStats()
+
+    def manifest_dirs(self):
+        """Returns the item directories that have a manifest."""
+        dirs = []
+        for artist_dir in os.scandir(self.media_dir):
+            if artist_dir.name.startswith(".") or not artist_dir.is_dir():
+                continue
+            for item_dir in os.scandir(artist_dir.path):
+                if not item_dir.is_dir():
+                    continue
+                item_path = Path(item_dir.path)
+                if (item_path / AlbumManifest.MANIFEST_FILENAME).is_file():
+                    dirs.append(item_path)
+        return dirs
+
+    def _verify(self, dir_path):
+        manifest = AlbumManifest.load(dir_path)
+        if manifest is None:
+            return None, []
+        try:
+            problems = manifest.verify(self.bucket, self.stats)
+        except OSError as e:
+            problems = [f"failed to read files: {e}"]
+        if self.save and not problems:
+            try:
+                manifest.save()
+            except OSError as e:
+                log.warning(f'Failed to update manifest "{manifest.file_path}": {e}')
+        return manifest, problems
+
+    def run(self):
+        """
+        Verifies the library and returns a dict of the damaged item IDs with the
+        directory and problems found for each.
+        """
+        dirs = self.manifest_dirs()
+        log.info(f"Verifying {len(dirs)} items in {self.media_dir}")
+        damaged = {}
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="bandcampsync-verify"
+        ) as executor:
+            for dir_path, (manifest, problems) in zip(
+                dirs, executor.map(self._verify, dirs)
+            ):
+                if manifest is None:
+                    continue
+                self.stats.albums += 1
+                if not problems:
+                    continue
+                log.warning(
+                    f'Damaged item (id:{manifest.item_id}) in "{dir_path}": '
+                    f"{'; '.join(problems)}"
+                )
+                if manifest.item_id is not None:
+                    damaged[manifest.item_id] = (dir_path, problems)
+        log.info(
+            f"Verified {self.stats.albums} items: {self.stats.hashed_files} changed "
+            f"files hashed ({self.stats.hashed_bytes / MB:.1f} MB), "
+            f"{self.stats.skipped_files} unchanged files skipped, "
+            f"{len(damaged)} damaged"
+        )
+        return damaged
@@ -21,6 +21,7 @@ class LocalMedia:
     """
 
     ITEM_INDEX_FILENAME = "bandcamp_item_id.txt"
+    INTERNAL_PREFIX = ".bandcampsync"
 
     def __init__(
         self,
@@ -62,6 +63,9 @@ class LocalMedia:
 
     def index(self):
         for child1 in self.media_dir.iterdir():
+            # Skip the staging and partial download directories
+            if child1.name.startswith(self.INTERNAL_PREFIX):
+                continue
             if child1.is_dir():
                 for child2 in child1.iterdir():
                     if child2.is_dir():
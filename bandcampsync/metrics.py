@@ -0,0 +1,345 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import mkstemp
+from time import monotonic
+from .logger import get_logger
+
+
+log = get_logger("metrics")
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Bucket upper bounds in seconds for HTTP requests, and for whole items which can
+# take minutes to download
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ITEM_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+class Metric:
+    """
+    A metric with a value for each combination of label values. Metrics are thread
+    safe so they can be updated by every worker thread and rendered by the metrics
+    server at the same time.
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} requires labels: {', '.join(self.labelnames)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        """Returns (label values, extra labels, suffix, value) tuples to render."""
+        with self.lock:
+            return [(key, (), "", value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for key, extra, suffix, value in self.samples():
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} can only be increased")
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Counts observations into buckets by upper bound, the values are stored as
+    [bucket counts, sum, count] and the buckets are rendered cumulatively.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def get(self, **labels):
+        """Returns the number of observations."""
+        with self.lock:
+            entry = self.values.get(self._key(labels))
+            return entry[2] if entry else 0
+
+    def samples(self):
+        with self.lock:
+            values = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self.values.items()
+            )
+        samples = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(float(bound))),)
+                samples.append((key, le, "_bucket", cumulative))
+            samples.append((key, (), "_sum", total))
+            samples.append((key, (), "_count", count))
+        return samples
+
+
+class MetricsRegistry:
+    """A set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Writes the metrics to "path" for the node_exporter textfile collector. The
+        file is written to a temporary file in the same directory and renamed into
+        place so the collector never reads a partial file.
+        """
+        path = Path(path)
+        fd, temp_path = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wt", encoding="utf-8") as f:
+                f.write(self.render())
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    "bandcampsync_requests_total",
+    "Requests made to Bandcamp by endpoint and response status code",
+    ("endpoint", "status"),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "bandcampsync_request_duration_seconds",
+    "Latency of requests made to Bandcamp by endpoint",
+    ("endpoint",),
+)
+COLLECTION_PAGES = REGISTRY.counter(
+    "bandcampsync_collection_pages_fetched_total",
+    "Pages of the collection loaded from Bandcamp",
+)
+DOWNLOADED_BYTES = REGISTRY.counter(
+    "bandcampsync_downloaded_bytes_total",
+    "Bytes received from the network by downloads",
+)
+DOWNLOADS = REGISTRY.counter(
+    "bandcampsync_downloads_total",
+    "Completed or interrupted download transfers",
+)
+ITEM_DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "bandcampsync_item_download_duration_seconds",
+    "Time taken to download an item",
+    buckets=ITEM_BUCKETS,
+)
+ITEM_INSTALL_SECONDS = REGISTRY.histogram(
+    "bandcampsync_item_extract_duration_seconds",
+    "Time taken to extract or copy a downloaded item into the media directory",
+    buckets=ITEM_BUCKETS,
+)
+ITEMS = REGISTRY.counter(
+    "bandcampsync_items_total",
+    "Items by the status they were given in the collection snapshot",
+    ("status",),
+)
+RETRIES = REGISTRY.counter(
+    "bandcampsync_retries_total",
+    "Failed attempts to sync an item that were retried, by error",
+    ("error",),
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "bandcampsync_queue_depth",
+    "Items waiting to be synced",
+)
+CHECKPOINT_ADVANCES = REGISTRY.counter(
+    "bandcampsync_checkpoint_advances_total",
+    "Times the collection checkpoint was written",
+)
+CHECKPOINT_TIMESTAMP = REGISTRY.gauge(
+    "bandcampsync_checkpoint_timestamp_seconds",
+    "Unix time the collection checkpoint was last written",
+)
+RUNS = REGISTRY.counter(
+    "bandcampsync_runs_total",
+    "Completed synchronisations, by whether they had errors",
+    ("result",),
+)
+RUN_SECONDS = REGISTRY.gauge(
+    "bandcampsync_last_run_duration_seconds",
+    "Time taken by the last synchronisation",
+)
+RUN_TIMESTAMP = REGISTRY.gauge(
+    "bandcampsync_last_run_timestamp_seconds",
+    "Unix time the last synchronisation finished",
+)
+
+
+def observe_request(endpoint, started, status):
+    """
+    Records a request to Bandcamp that was sent at monotonic time "started", with
+    the status code of the response or "error" if no response was received.
+    """
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    REQUEST_SECONDS.observe(monotonic() - started, endpoint=endpoint)
+
+
+def observe_transfer(transfer):
+    """Records the network side of a download transfer from its TransferStats."""
+    DOWNLOADS.inc(transfer.downloads)
+    DOWNLOADED_BYTES.inc(transfer.network_bytes)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+class MetricsServer:
+    """
+    Serves the metrics of "registry" over HTTP at /metrics from a daemon thread,
+    for Prometheus to scrape while the service is running. Port 0 picks a free
+    port, which is available as self.port once started.
+    """
+
+    def __init__(self, port, address="0.0.0.0", registry=REGISTRY):
+        handler = type("Handler", (MetricsHandler,), {"registry": registry})
+        self.server = ThreadingHTTPServer((address, port), handler)
+        self.server.daemon_threads = True
+        self.address, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            name="bandcampsync-metrics",
+            daemon=True,
+        )
+        self.thread.start()
+        log.info(f"Serving metrics on http://{self.address}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
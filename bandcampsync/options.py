@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import date
-from typing import Optional
+from typing import Dict, Optional
 
 
 @dataclass
@@ -18,6 +18,29 @@ class BandcampSyncOptions:
     concurrency: int = 1
     max_retries: int = 3
     retry_wait: int = 5
+    retry_max_wait: int = 0
     skip_item_index: bool = False
     sync_ignore_file: bool = False
     skip_hidden: bool = False
+    page_size: int = 100
+    adaptive_page_size: bool = False
+    download_cache_ttl: int = 3600
+    stream_purchases: bool = False
+    auth_cache_ttl: int = 172800
+    api_rate: float = 0
+    download_rate: float = 0
+    engine: str = "threads"
+    threaded_writer: bool = False
+    download_segments: int = 1
+    segment_min_size: int = 64
+    extract_while_downloading: bool = False
+    extract_workers: int = 0
+    verify: bool = False
+    verify_rate: float = 0
+    metrics_file: Optional[Path] = None
+    min_free_space: int = 0
+    bandwidth: float = 0
+    bandwidth_schedule: str = ""
+    schedule: str = "newest"
+    # Other formats synced in the same run, each to its own directory
+    format_dirs: Dict[str, Path] = field(default_factory=dict)
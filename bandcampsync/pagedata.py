@@ -0,0 +1,89 @@
+import json
+import re
+from html import unescape as html_unescape
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Matches the attributes of a single HTML start tag, allowing for quoted attribute
+# values that contain ">" characters
+TAG_ATTRS_REGEX = re.compile(
+    r"<([a-zA-Z][a-zA-Z0-9]*)"
+    r"((?:\s+[^\s=/>]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?)*)"
+    r"\s*/?>"
+)
+ATTR_REGEX = re.compile(
+    r"([^\s=/>]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+)))?"
+)
+
+
+def json_loads(data):
+    """
+    Decodes JSON with orjson if it is installed, otherwise with the standard library.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _unescape_attr(value):
+    if "&" not in value:
+        return value
+    # JSON blobs are mostly &quot; entities, which are far quicker to replace
+    # directly than through html.unescape()
+    value = value.replace("&quot;", '"')
+    if "&" not in value:
+        return value
+    return html_unescape(value)
+
+
+def _parse_attrs(attrs_str):
+    attrs = {}
+    for name, dquoted, squoted, unquoted in ATTR_REGEX.findall(attrs_str):
+        value = dquoted or squoted or unquoted
+        attrs.setdefault(name.lower(), _unescape_attr(value))
+    return attrs
+
+
+def find_tag_attrs(html, marker, tag="div"):
+    """
+    Finds the first start tag of type "tag" that contains the string "marker" in its
+    attributes and returns its attributes as a dict, without building a DOM. Returns
+    None if no such tag can be found, in which case callers should fall back to a
+    full HTML parser.
+    """
+    if not isinstance(html, str):
+        return None
+    tag_open = f"<{tag}"
+    pos = html.find(marker)
+    while pos != -1:
+        tag_start = html.rfind(tag_open, 0, pos)
+        if tag_start == -1:
+            return None
+        match = TAG_ATTRS_REGEX.match(html, tag_start)
+        if match and match.group(1).lower() == tag and pos < match.end():
+            return _parse_attrs(match.group(2))
+        pos = html.find(marker, pos + len(marker))
+    return None
+
+
+def extract_data_blob(html, id_name="pagedata"):
+    """
+    Returns the decoded JSON of the data-blob attribute of <div id="{id_name}"> in
+    the HTML, or None if it could not be located or decoded.
+    """
+    attrs = find_tag_attrs(html, f'id="{id_name}"')
+    if not attrs or attrs.get("id") != id_name:
+        return None
+    encoded_pagedata = attrs.get("data-blob")
+    if not encoded_pagedata:
+        return None
+    # Attribute values are unescaped once when parsed, the blob itself contains a
+    # second layer of HTML entities (the same as the bs4 path handles)
+    try:
+        return json_loads(_unescape_attr(encoded_pagedata))
+    except ValueError:
+        return None
@@ -0,0 +1,353 @@
+import asyncio
+import re
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+from .logger import get_logger
+
+
+log = get_logger("ratelimit")
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header value, which is either a number of seconds or an
+    HTTP date, into a number of seconds to wait. Returns None if it is not valid.
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. Tokens are refilled at "rate" per second up to
+    "burst" tokens. Callers reserve tokens in the order they arrive and the balance
+    may go negative, so waiting callers are served first come, first served. A rate
+    of 0 or None means the bucket is unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.updated = monotonic()
+        self.rate = 0.0
+        self.burst = 0.0
+        self.set_rate(rate, burst)
+        self.tokens = self.burst
+
+    @property
+    def unlimited(self):
+        return not self.rate
+
+    def set_rate(self, rate, burst=None, fill=False):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate or 0)
+            self.burst = float(burst if burst else max(1.0, self.rate))
+            self.tokens = self.burst if fill else min(self.tokens, self.burst)
+
+    def _refill(self):
+        now = monotonic()
+        if self.rate:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        """
+        Reserves tokens and returns the number of seconds the caller must wait
+        before using them.
+        """
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+BANDWIDTH_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_bandwidth(value):
+    """
+    Parses a bandwidth in bytes per second, such as "2MB", "512K" or "1048576",
+    with an optional "/s" suffix. Returns 0 for unlimited and raises ValueError if
+    it is not valid.
+    """
+    match = re.fullmatch(
+        r"\s*([0-9.]+)\s*([KMG]?)B?(?:/S)?\s*", str(value or "0").upper()
+    )
+    if not match:
+        raise ValueError(f"Invalid bandwidth: {value}")
+    try:
+        return float(match.group(1)) * BANDWIDTH_UNITS[match.group(2)]
+    except ValueError as e:
+        raise ValueError(f"Invalid bandwidth: {value}") from e
+
+
+class BandwidthSchedule:
+    """
+    Bandwidth limits by local time of day, parsed from a comma separated list of
+    "HH:MM-HH:MM=BANDWIDTH" windows, such as "01:00-07:00=0,18:00-23:00=1MB" for
+    unlimited bandwidth overnight and 1 MB/s in the evening. Windows may wrap past
+    midnight. Outside every window the default bandwidth applies.
+    """
+
+    def __init__(self, windows=()):
+        self.windows = list(windows)
+
+    @staticmethod
+    def _parse_time(value):
+        try:
+            hours, minutes = value.strip().split(":")
+            hours, minutes = int(hours), int(minutes)
+        except ValueError as e:
+            raise ValueError(f"Invalid time in bandwidth schedule: {value}") from e
+        if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 1440:
+            raise ValueError(f"Invalid time in bandwidth schedule: {value}")
+        return hours * 60 + minutes
+
+    @classmethod
+    def parse(cls, spec):
+        windows = []
+        for window in (spec or "").split(","):
+            if not window.strip():
+                continue
+            try:
+                times, bandwidth = window.split("=")
+                start, end = times.split("-")
+            except ValueError as e:
+                raise ValueError(f"Invalid bandwidth schedule window: {window}") from e
+            windows.append(
+                (
+                    cls._parse_time(start),
+                    cls._parse_time(end),
+                    parse_bandwidth(bandwidth),
+                )
+            )
+        return cls(windows)
+
+    def __bool__(self):
+        return bool(self.windows)
+
+    def bandwidth_at(self, when, default=0):
+        """Returns the bandwidth for the datetime "when", the first window wins."""
+        minute = when.hour * 60 + when.minute
+        for start, end, bandwidth in self.windows:
+            if start <= end:
+                if start <= minute < end:
+                    return bandwidth
+            elif minute >= start or minute < end:
+                return bandwidth
+        return default
+
+
+class BandwidthLimiter:
+    """
+    Limits the combined bandwidth of all downloads to "bandwidth" bytes per second,
+    or to the bandwidth in "schedule" for the current local time. Downloads reserve
+    each chunk they receive from a shared token bucket first come, first served, so
+    active downloads take turns and share the bandwidth evenly. Blocking while a
+    chunk is received also stops reading from the connection, so the server slows
+    down rather than the data piling up in memory. The schedule is checked again
+    every CHECK_SECONDS so a long sync follows it through the day. A bandwidth of 0
+    is unlimited.
+    """
+
+    CHECK_SECONDS = 30
+    # Bytes that can be received at once, as seconds of the bandwidth, kept short
+    # so one download cannot take the whole bucket
+    BURST_SECONDS = 0.25
+
+    def __init__(self, bandwidth=0, schedule=None, clock=None):
+        self.default = float(bandwidth or 0)
+        self.schedule = schedule or BandwidthSchedule()
+        self.clock = clock or datetime.now
+        self.bucket = TokenBucket()
+        self.lock = threading.Lock()
+        self.bandwidth = None
+        self.checked = 0.0
+        self._check(force=True)
+
+    @property
+    def enabled(self):
+        return bool(self.default or self.schedule)
+
+    def _check(self, force=False):
+        now = monotonic()
+        with self.lock:
+            if not force and now - self.checked < self.CHECK_SECONDS:
+                return
+            self.checked = now
+            bandwidth = self.schedule.bandwidth_at(self.clock(), self.default)
+            if bandwidth == self.bandwidth:
+                return
+            # Coming from unlimited bandwidth the bucket starts full
+            fill = not self.bandwidth
+            self.bandwidth = bandwidth
+        self.bucket.set_rate(
+            bandwidth, burst=max(64 * 1024, bandwidth * self.BURST_SECONDS), fill=fill
+        )
+        if bandwidth:
+            log.info(
+                f"Limiting download bandwidth to {bandwidth / 1024 / 1024:.2f} MB/s"
+            )
+        elif not force:
+            log.info("Download bandwidth is no longer limited")
+
+    def reserve(self, size):
+        """
+        Reserves "size" bytes and returns the number of seconds to wait before
+        receiving them.
+        """
+        if not self.enabled:
+            return 0.0
+        self._check()
+        return self.bucket.reserve(size)
+
+
+class RateLimiter:
+    """
+    A rate limiter shared by all worker threads. Requests to bandcamp.com pages and
+    APIs ("api") and to the download CDN ("download") have separate token buckets,
+    and the bytes received by downloads are limited by "bandwidth", a
+    BandwidthLimiter, if it is set.
+    When any response is a 429 or 503 all requests are paused globally, for as long
+    as the Retry-After header asks or with an exponential backoff if it is missing.
+    Pauses are never longer than BACKOFF_MAX, however long Retry-After asks for.
+    """
+
+    THROTTLE_STATUS_CODES = (429, 503)
+    BACKOFF_INITIAL = 5.0
+    BACKOFF_MAX = 300.0
+
+    def __init__(self, api_rate=None, download_rate=None, bandwidth=None):
+        self.buckets = {
+            "api": TokenBucket(api_rate),
+            "download": TokenBucket(download_rate),
+        }
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.backoff_until = 0.0
+        self.throttled_count = 0
+        self.consecutive_throttles = 0
+
+    def backoff_remaining(self):
+        with self.lock:
+            return max(0.0, self.backoff_until - monotonic())
+
+    def wait(self, budget="api"):
+        """
+        Blocks until any global backoff has passed and a token is available in the
+        named budget. Returns the total number of seconds waited.
+        """
+        waited = 0.0
+        while True:
+            remaining = self.backoff_remaining()
+            if remaining <= 0:
+                break
+            sleep(remaining)
+            waited += remaining
+        waited += self.buckets[budget].acquire()
+        return waited
+
+    async def wait_async(self, budget="api"):
+        """
+        The same as wait() but sleeps without blocking the event loop.
+        """
+        waited = 0.0
+        while True:
+            remaining = self.backoff_remaining()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+            waited += remaining
+        wait = self.buckets[budget].reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return waited + wait
+
+    def throttle(self, size):
+        """
+        Blocks until "size" bytes can be received under the bandwidth limit.
+        Returns the number of seconds waited.
+        """
+        if self.bandwidth is None:
+            return 0.0
+        wait = self.bandwidth.reserve(size)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    async def throttle_async(self, size):
+        """The same as throttle() but sleeps without blocking the event loop."""
+        if self.bandwidth is None:
+            return 0.0
+        wait = self.bandwidth.reserve(size)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def backoff(self, seconds):
+        with self.lock:
+            backoff_until = monotonic() + seconds
+            if backoff_until > self.backoff_until:
+                self.backoff_until = backoff_until
+                log.warning(
+                    f"Rate limited by Bandcamp, pausing requests for {seconds:.1f}s"
+                )
+
+    def update(self, status_code, headers=None):
+        """
+        Updates the limiter with a response status code and headers. Returns True if
+        the response was a rate limiting response.
+        """
+        if status_code not in self.THROTTLE_STATUS_CODES:
+            with self.lock:
+                self.consecutive_throttles = 0
+            return False
+        retry_after = None
+        if headers is not None:
+            try:
+                retry_after = parse_retry_after(headers.get("Retry-After"))
+            except (AttributeError, KeyError):
+                retry_after = None
+        with self.lock:
+            self.throttled_count += 1
+            self.consecutive_throttles += 1
+            if retry_after is None:
+                retry_after = min(
+                    self.BACKOFF_MAX,
+                    self.BACKOFF_INITIAL * 2 ** (self.consecutive_throttles - 1),
+                )
+        if retry_after > self.BACKOFF_MAX:
+            log.warning(
+                f"Retry-After of {retry_after:.1f}s is longer than the maximum "
+                f"backoff, pausing requests for {self.BACKOFF_MAX:.1f}s instead"
+            )
+            retry_after = self.BACKOFF_MAX
+        self.backoff(retry_after)
+        return True
@@ -0,0 +1,81 @@
+import asyncio
+import heapq
+import itertools
+import random
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter. The delay before retry "attempt" (0 for the
+    first retry) grows from "base" seconds by "factor" each attempt up to "cap"
+    seconds, then a random delay between half of that and all of it is used so
+    items that failed together do not all retry at the same moment.
+    """
+
+    def __init__(self, base, cap, factor=2, jitter=random.random):
+        self.base = max(0, base)
+        self.cap = max(self.base, cap)
+        self.factor = max(1, factor)
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        ceiling = min(self.cap, self.base * self.factor ** max(0, attempt))
+        return ceiling / 2 + ceiling / 2 * self.jitter()
+
+
+class RetryPolicy:
+    """
+    Chooses the backoff for a failed attempt by the class of its error, the first
+    of "backoffs", as (error class, Backoff) pairs, that matches the error is used,
+    otherwise "default".
+    """
+
+    def __init__(self, backoffs, default):
+        self.backoffs = list(backoffs)
+        self.default = default
+
+    def delay(self, error, attempt):
+        for error_class, backoff in self.backoffs:
+            if isinstance(error, error_class):
+                return backoff.delay(attempt)
+        return self.default.delay(attempt)
+
+
+class DownloadSlots:
+    """
+    Limits the number of items syncing at once, like asyncio.Semaphore except that
+    waiters with a lower priority value are given a free slot first, in the order
+    they started waiting. Items waiting to retry give up their slot while they
+    wait and take the next free one ahead of items that have not started, so a
+    retry is not left until every other item has been synced.
+    """
+
+    PRIORITY_RETRY = 0
+    PRIORITY_NEW = 1
+
+    def __init__(self, size):
+        self.free = max(1, size)
+        self.waiters = []
+        self.counter = itertools.count()
+
+    async def acquire(self, priority=PRIORITY_NEW):
+        if self.free > 0 and not self.waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over as the waiter was cancelled
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
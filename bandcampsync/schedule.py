@@ -0,0 +1,24 @@
+import heapq
+
+
+def estimate_makespan(sizes, workers):
+    """
+    Returns the most bytes any one of "workers" concurrent downloads has to
+    download when "sizes" are started in order, each on the first download slot to
+    become free, assuming download time is proportional to size.
+    """
+    loads = [0] * max(1, workers)
+    for size in sizes:
+        heapq.heapreplace(loads, loads[0] + (size or 0))
+    return max(loads)
+
+
+def largest_first(entries):
+    """
+    Orders (item, size) pairs largest first, the longest processing time first
+    heuristic, which keeps the busiest download slot within 4/3 of the shortest
+    possible. Items with the same size, or no known size, keep their order, so with
+    items given newest first ties are broken newest first. Items without a known
+    size are started last.
+    """
+    return sorted(entries, key=lambda entry: entry[1] or 0, reverse=True)
@@ -0,0 +1,156 @@
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from curl_cffi import requests
+from .logger import get_logger
+
+
+log = get_logger("sessions")
+
+
+class PooledSession:
+    """
+    A keep-alive session checked out of a SessionPool. Requests made through it
+    are counted by the pool as either opening a new connection or reusing one.
+    """
+
+    __slots__ = ("pool", "group", "session", "last_connection")
+
+    def __init__(self, pool, group, session):
+        self.pool = pool
+        self.group = group
+        self.session = session
+        self.last_connection = None
+
+    def request(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        self.pool._record(self, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+
+class SessionPool:
+    """
+    A pool of keep-alive HTTP sessions shared by all worker threads. Sessions are
+    grouped by host, one group for bandcamp.com pages, APIs and download stats and
+    one for the bcbits.com download CDN, so a connection opened for one item is reused for the next
+    item, stat request or retry to the same host. Up to "size" idle sessions are
+    kept per group, which should match the number of concurrent downloads.
+
+    Sessions do not keep cookies between requests, callers that need cookies must
+    pass them with each request.
+    """
+
+    GROUP_BANDCAMP = "bandcamp"
+    GROUP_CDN = "cdn"
+    BANDCAMP_DOMAIN = "bandcamp.com"
+
+    def __init__(self, size=1, impersonate="chrome"):
+        self.size = max(1, int(size or 1))
+        self.impersonate = impersonate
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.created = 0
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    @classmethod
+    def host_group(cls, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if host == cls.BANDCAMP_DOMAIN or host.endswith(f".{cls.BANDCAMP_DOMAIN}"):
+            return cls.GROUP_BANDCAMP
+        return cls.GROUP_CDN
+
+    def _new_session(self, group):
+        # The session is only ever used by the thread that checked it out, so the
+        # curl handle does not need to be thread local, which would otherwise open
+        # a new connection whenever the session moved between worker threads
+        session = requests.Session(
+            impersonate=self.impersonate,
+            use_thread_local_curl=False,
+            discard_cookies=True,
+        )
+        with self.lock:
+            self.created += 1
+        return PooledSession(self, group, session)
+
+    def checkout(self, url):
+        group = self.host_group(url)
+        with self.lock:
+            idle = self.idle.get(group)
+            if idle:
+                return idle.pop()
+        return self._new_session(group)
+
+    def checkin(self, pooled_session):
+        with self.lock:
+            idle = self.idle.setdefault(pooled_session.group, [])
+            if len(idle) < self.size:
+                idle.append(pooled_session)
+                return True
+        pooled_session.close()
+        return False
+
+    @contextmanager
+    def session(self, url):
+        pooled_session = self.checkout(url)
+        try:
+            yield pooled_session
+        finally:
+            self.checkin(pooled_session)
+
+    def request(self, method, url, **kwargs):
+        with self.session(url) as pooled_session:
+            return pooled_session.request(method, url, **kwargs)
+
+    def _record(self, pooled_session, response):
+        # A reused connection has the same local and remote address as the last
+        # request made by the same session
+        connection = (
+            getattr(response, "primary_ip", ""),
+            getattr(response, "primary_port", 0),
+            getattr(response, "local_port", 0),
+        )
+        reused = connection[2] and connection == pooled_session.last_connection
+        pooled_session.last_connection = connection
+        with self.lock:
+            self.requests += 1
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": self.created,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        if not stats["requests"]:
+            return
+        log.info(
+            f"Made {stats['requests']} HTTP requests over {stats['new_connections']} "
+            f"connections ({stats['reused_connections']} reused, "
+            f"{stats['sessions']} sessions)"
+        )
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for sessions in idle.values():
+            for pooled_session in sessions:
+                pooled_session.close()
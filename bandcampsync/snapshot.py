@@ -0,0 +1,238 @@
+import json
+import threading
+from pathlib import Path
+from time import time
+from .bandcamp import BandcampItem
+from .logger import get_logger
+from .metrics import ITEMS
+
+
+log = get_logger("snapshot")
+
+
+class CollectionSnapshot:
+    """
+    A persistent snapshot of the whole Bandcamp collection, newest purchase first,
+    with the sync status of each item. Once a complete snapshot exists only the
+    collection pages newer than its newest item ("head") need to be fetched, and
+    items that are not resolved yet, such as failed downloads, are synced from the
+    snapshot no matter how old they are. Download URLs are signed and expire, so
+    only whether an item has a download is stored and the URL is resolved again
+    before an item is synced from the snapshot. Stored in the following format:
+
+        {
+            "version": 1,
+            "complete": true,
+            "updated_at": 1700000000,
+            "items": [
+                {
+                    "item_id": 123,
+                    "token": "1700000000:123:a::",
+                    "sale_item_type": "a",
+                    "sale_item_id": 456,
+                    "purchased": "06 Feb 2026 19:06:47 GMT",
+                    "hidden": true,
+                    "downloadable": true,
+                    "status": "downloaded",
+                    ...
+                }
+            ]
+        }
+
+    Items also store the other BandcampItem fields needed to sync them without
+    loading the collection again. Fields that are empty or false are not stored.
+    """
+
+    SNAPSHOT_VERSION = 1
+    STATUS_DOWNLOADED = "downloaded"
+    STATUS_UNAVAILABLE = "unavailable"
+    STATUS_FAILED = "failed"
+    STATUS_SKIPPED = "skipped"
+    STATUS_PREORDER = "preorder"
+    # Older than the collection checkpoint, so synced by an earlier run
+    STATUS_CHECKPOINTED = "checkpointed"
+    # Older than --until-date, synced from the snapshot if the date is changed
+    STATUS_FILTERED = "filtered"
+    # Items with these statuses are not synced again
+    RESOLVED_STATUSES = frozenset(
+        (STATUS_DOWNLOADED, STATUS_UNAVAILABLE, STATUS_CHECKPOINTED)
+    )
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self.entries = []
+        self.entries_by_id = {}
+        self.complete = False
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def usable(self):
+        """True if the snapshot covers the whole collection."""
+        return self.complete and len(self.entries) > 0
+
+    def load(self):
+        if not self.file_path.is_file():
+            return False
+        try:
+            with open(self.file_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f'Failed to parse collection snapshot "{self.file_path}": {e}')
+            return False
+        if not isinstance(data, dict) or data.get("version") != self.SNAPSHOT_VERSION:
+            log.warning(f'Ignoring incompatible collection snapshot "{self.file_path}"')
+            return False
+        entries = data.get("items")
+        if not isinstance(entries, list):
+            return False
+        self.entries = [
+            e for e in entries if isinstance(e, dict) and e.get("item_id") is not None
+        ]
+        for entry in self.entries:
+            # Written before download URLs were left out of the snapshot
+            if entry.pop("download_url", None):
+                entry["downloadable"] = True
+        self.entries_by_id = {e["item_id"]: e for e in self.entries}
+        self.complete = data.get("complete") is True
+        log.info(
+            f"Loaded collection snapshot of {len(self.entries)} items from "
+            f'"{self.file_path}"'
+        )
+        return True
+
+    def contains(self, item):
+        return getattr(item, "item_id", None) in self.entries_by_id
+
+    def set_status(self, item, status):
+        """Records the sync status of an item in this run."""
+        item_id = getattr(item, "item_id", None)
+        if item_id is None:
+            return
+        with self.lock:
+            self.statuses[item_id] = status
+        ITEMS.inc(status=status)
+
+    def requeue(self, item_ids):
+        """
+        Marks items as failed so they are synced from the snapshot again, such as
+        items with damaged files. Returns the number of items marked.
+        """
+        requeued = 0
+        with self.lock:
+            for item_id in item_ids:
+                entry = self.entries_by_id.get(item_id)
+                if entry is not None:
+                    entry["status"] = self.STATUS_FAILED
+                    requeued += 1
+        return requeued
+
+    def is_resolved(self, entry):
+        return entry.get("status") in self.RESOLVED_STATUSES
+
+    def has_unknown_items(self):
+        """
+        True if any item in the snapshot has never been checked by a sync. Items
+        skipped by the checkpoint, --until-date or the ignores have a status.
+        """
+        return any(not e.get("status") for e in self.entries)
+
+    def unresolved_items(self):
+        """
+        Returns the snapshot items that still need to be synced as BandcampItems,
+        newest first. Items without a download are never returned. The items have
+        no download URL, which has to be resolved again before they are synced.
+        """
+        items = []
+        for entry in self.entries:
+            if self.is_resolved(entry) or not entry.get("downloadable"):
+                continue
+            items.append(BandcampItem(entry))
+        return items
+
+    @staticmethod
+    def _entry(item):
+        entry = {k: v for k, v in item.as_dict().items() if v}
+        # Recomputed for duplicate titles each run
+        entry.pop("folder_suffix", None)
+        # Signed and expires, so only whether there is one is kept
+        if entry.pop("download_url", None):
+            entry["downloadable"] = True
+        return entry
+
+    def merge(self, items, complete=True):
+        """
+        Merges the collection items loaded in this run, newest first, into the
+        snapshot. Loaded items are newer than or replace the snapshot items with the
+        same ID, and the statuses recorded in this run replace the stored ones.
+        Items that are not BandcampItems are ignored. Set "complete" to False if
+        older purchases that still need to be synced may not have been loaded.
+        """
+        with self.lock:
+            loaded = []
+            loaded_ids = set()
+            for item in items:
+                if not isinstance(item, BandcampItem) or item.item_id in loaded_ids:
+                    continue
+                entry = self._entry(item)
+                previous = self.entries_by_id.get(item.item_id)
+                if previous:
+                    # The item pagination stopped at has no download URL resolved
+                    if previous.get("downloadable"):
+                        entry["downloadable"] = True
+                    if previous.get("status"):
+                        entry["status"] = previous["status"]
+                loaded.append(entry)
+                loaded_ids.add(item.item_id)
+            entries = loaded + [
+                e for e in self.entries if e["item_id"] not in loaded_ids
+            ]
+            for entry in entries:
+                status = self.statuses.get(entry["item_id"])
+                if status:
+                    entry["status"] = status
+                elif not entry.get("status") and not entry.get("downloadable"):
+                    # Physical purchases and items without a digital download
+                    entry["status"] = self.STATUS_UNAVAILABLE
+            self.entries = entries
+            self.entries_by_id = {e["item_id"]: e for e in entries}
+            self.complete = complete
+
+    def counts(self):
+        """Returns the number of snapshot items with each status."""
+        counts = {}
+        for entry in self.entries:
+            status = entry.get("status") or "unknown"
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def save(self):
+        data = {
+            "version": self.SNAPSHOT_VERSION,
+            "complete": self.complete,
+            "updated_at": int(time()),
+            "items": self.entries,
+        }
+        temp_file_path = Path(f"{self.file_path}.tmp")
+        try:
+            with open(temp_file_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            temp_file_path.replace(self.file_path)
+        except (OSError, TypeError, ValueError) as e:
+            log.error(f'Failed to write collection snapshot "{self.file_path}": {e}')
+            if temp_file_path.exists():
+                try:
+                    temp_file_path.unlink()
+                except OSError:
+                    pass
+            return False
+        counts = ", ".join(f"{v} {k}" for k, v in sorted(self.counts().items()))
+        log.info(
+            f"Saved collection snapshot of {len(self.entries)} items to "
+            f'"{self.file_path}" ({counts})'
+        )
+        return True
@@ -0,0 +1,119 @@
+from .logger import get_logger
+
+
+log = get_logger("sniff")
+
+
+KIND_ZIP = "zip"
+KIND_FLAC = "flac"
+KIND_OGG = "ogg"
+KIND_MP3 = "mp3"
+KIND_MP4 = "mp4"
+KIND_AIFF = "aiff"
+KIND_WAV = "wav"
+KIND_HTML = "html"
+
+AUDIO_KINDS = frozenset((KIND_FLAC, KIND_OGG, KIND_MP3, KIND_MP4, KIND_AIFF, KIND_WAV))
+
+# The kind of single file each Bandcamp encoding is downloaded as
+ENCODING_KINDS = {
+    "flac": KIND_FLAC,
+    "mp3-v0": KIND_MP3,
+    "mp3-320": KIND_MP3,
+    "vorbis": KIND_OGG,
+    "aac-hi": KIND_MP4,
+    "alac": KIND_MP4,
+    "wav": KIND_WAV,
+    "aiff-lossless": KIND_AIFF,
+}
+
+HTML_PREFIXES = (b"<!doctype html", b"<html", b"<head", b"<body", b"<!--")
+
+
+def _is_mpeg_frame(data):
+    return len(data) >= 2 and data[0] == 0xFF and (data[1] & 0xE0) == 0xE0
+
+
+def sniff(data):
+    """
+    Returns the kind of file that starts with "data" from its magic bytes, one of
+    the KIND_* constants, or None if it is not recognised. The first 64 bytes are
+    enough for every kind except audio with an ID3 tag, which is only recognised if
+    the data continues past the tag.
+    """
+    data = bytes(data)
+    if data.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return KIND_ZIP
+    if data.startswith(b"fLaC"):
+        return KIND_FLAC
+    if data.startswith(b"OggS"):
+        return KIND_OGG
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return KIND_WAV
+    if data[:4] == b"FORM" and data[8:12] in (b"AIFF", b"AIFC"):
+        return KIND_AIFF
+    if data[4:8] == b"ftyp":
+        return KIND_MP4
+    if data.startswith(b"ID3") and len(data) >= 10:
+        # The tag size is a 28 bit "syncsafe" integer, plus a footer if flagged
+        size = 10 + (
+            (data[6] & 0x7F) << 21
+            | (data[7] & 0x7F) << 14
+            | (data[8] & 0x7F) << 7
+            | (data[9] & 0x7F)
+        )
+        if data[5] & 0x10:
+            size += 10
+        after_tag = data[size : size + 4]
+        if after_tag.startswith(b"fLaC"):
+            return KIND_FLAC
+        if _is_mpeg_frame(after_tag):
+            return KIND_MP3
+        return None
+    if _is_mpeg_frame(data):
+        return KIND_MP3
+    text = data.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(HTML_PREFIXES):
+        return KIND_HTML
+    return None
+
+
+class ContentSniffer:
+    """
+    Classifies a download from the magic bytes of the first chunk of its body, so a
+    sync can choose how to install it before it has finished and stop downloading
+    content it does not expect. "expected" is the set of kinds that can be used, or
+    None to accept anything. HTML is never expected.
+    """
+
+    def __init__(self, expected=None):
+        self.expected = frozenset(expected) if expected else None
+        self.kind = None
+        self.sniffed = False
+
+    @classmethod
+    def for_encoding(cls, encoding):
+        """
+        Returns a sniffer for a download in a Bandcamp encoding, which is either a
+        zip archive or a single file of the encoding's kind.
+        """
+        kind = ENCODING_KINDS.get(encoding)
+        return cls(expected=(KIND_ZIP, kind) if kind else None)
+
+    def sniff(self, data):
+        self.kind = sniff(data)
+        self.sniffed = True
+        if self.kind:
+            log.debug(f"Download content is: {self.kind}")
+        return self.kind
+
+    @property
+    def is_html(self):
+        return self.kind == KIND_HTML
+
+    def problem(self):
+        """Returns a description of unexpected content, or None if it can be used."""
+        if self.kind is None or self.expected is None or self.kind in self.expected:
+            return None
+        expected = ", ".join(sorted(self.expected))
+        return f"content is {self.kind}, expected one of: {expected}"
@@ -0,0 +1,141 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from .logger import get_logger
+
+
+log = get_logger("space")
+
+
+MB = 1024 * 1024
+
+
+class DiskSpaceUnavailable(ValueError):
+    pass
+
+
+class SpaceReservation:
+    """
+    Disk space reserved by DiskSpaceAdmission.reserve() for one download, released
+    when the download has been installed or has failed. Can be used as a context
+    manager.
+    """
+
+    def __init__(self, admission, needs):
+        self.admission = admission
+        self.needs = needs
+
+    def release(self):
+        needs, self.needs = self.needs, {}
+        if needs:
+            self.admission._release(needs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
+
+
+class DiskSpaceAdmission:
+    """
+    Admits downloads only once there is free space for them on every filesystem
+    they write to, so concurrent downloads of large items wait for each other rather
+    than all failing when a filesystem fills up. Space is reserved per filesystem
+    while an item downloads and installs and counts against the free space reported
+    for it, less "headroom" bytes that are always left free. An item waits while
+    other reservations on the same filesystem are being used and fails with
+    DiskSpaceUnavailable if it does not fit even with no other reservations.
+    """
+
+    # Free space is checked again this often while waiting, in case it was freed
+    # by something other than a download finishing
+    RECHECK_SECONDS = 30
+
+    def __init__(self, headroom=0, disk_free=None):
+        self.headroom = max(0, int(headroom))
+        self.disk_free = disk_free or self._disk_free
+        self.condition = threading.Condition()
+        # Reserved bytes by filesystem device ID
+        self.reserved = {}
+
+    @staticmethod
+    def _disk_free(path):
+        return shutil.disk_usage(path).free
+
+    @staticmethod
+    def _existing(path):
+        path = Path(path)
+        while not path.exists() and path.parent != path:
+            path = path.parent
+        return path
+
+    def _devices(self, needs):
+        """
+        Combines the bytes needed by path into bytes needed by filesystem, as
+        {device: (path, size)}.
+        """
+        devices = {}
+        for path, size in needs.items():
+            if size <= 0:
+                continue
+            path = self._existing(path)
+            device = os.stat(path).st_dev
+            known_path, known_size = devices.get(device, (path, 0))
+            devices[device] = (known_path, known_size + size)
+        return devices
+
+    def _shortfall(self, devices):
+        """
+        Returns (device, path, size, available) for the first filesystem without room for
+        the reservation, or None if they all have room. Called with the condition
+        held.
+        """
+        for device, (path, size) in devices.items():
+            available = (
+                self.disk_free(path) - self.reserved.get(device, 0) - self.headroom
+            )
+            if size > available:
+                return device, path, size, available
+        return None
+
+    def reserve(self, needs, name=""):
+        """
+        Reserves the bytes needed by a download, as {path: bytes} for each
+        directory it writes to, waiting until there is room for all of them.
+        Returns a SpaceReservation.
+        """
+        devices = self._devices(needs)
+        if not devices:
+            return SpaceReservation(self, {})
+        waited = False
+        with self.condition:
+            while True:
+                shortfall = self._shortfall(devices)
+                if shortfall is None:
+                    break
+                device, path, size, available = shortfall
+                if not self.reserved.get(device):
+                    # Nothing else is using the filesystem, waiting will not help
+                    raise DiskSpaceUnavailable(
+                        f"{name} needs {size / MB:.1f} MB on the filesystem of "
+                        f'"{path}" but only {max(0, available) / MB:.1f} MB is free'
+                    )
+                if not waited:
+                    log.info(
+                        f"Waiting for {size / MB:.1f} MB of free space on the "
+                        f'filesystem of "{path}" to download {name}'
+                    )
+                    waited = True
+                self.condition.wait(self.RECHECK_SECONDS)
+            for device, (path, size) in devices.items():
+                self.reserved[device] = self.reserved.get(device, 0) + size
+        reserved = {device: size for device, (path, size) in devices.items()}
+        return SpaceReservation(self, reserved)
+
+    def _release(self, reserved):
+        with self.condition:
+            for device, size in reserved.items():
+                self.reserved[device] = max(0, self.reserved.get(device, 0) - size)
+            self.condition.notify_all()
@@ -0,0 +1,108 @@
+import errno
+import os
+import secrets
+import shutil
+from pathlib import Path
+from .download import move_file
+from .logger import get_logger
+
+
+log = get_logger("staging")
+
+
+class StagingArea:
+    """
+    A directory on the same filesystem as the media directory where each item is
+    assembled before it is published to the media directory with a single rename,
+    so media servers never see a partially installed item and files are never
+    copied between filesystems. Staged items are stored in the following format:
+
+        /media_dir/.bandcampsync-staging/
+        /media_dir/.bandcampsync-staging/<item_id>-<random>/track1.flac
+        /media_dir/.bandcampsync-staging/<item_id>-<random>/bandcamp_item_id.txt
+
+    If "temp_dir_root" is set and on the same filesystem as the media directory
+    the staging directory is created in it instead.
+    """
+
+    STAGING_DIRNAME = ".bandcampsync-staging"
+
+    def __init__(self, media_dir, temp_dir_root=None):
+        self.media_dir = Path(media_dir)
+        root = self.media_dir
+        if temp_dir_root:
+            if self._same_device(temp_dir_root, self.media_dir):
+                root = Path(temp_dir_root)
+            else:
+                log.info(
+                    f'Temporary directory "{temp_dir_root}" is on a different '
+                    f"filesystem to the media directory, staging items in the "
+                    f"media directory instead"
+                )
+        self.dir_path = root / self.STAGING_DIRNAME
+
+    @staticmethod
+    def _same_device(a, b):
+        try:
+            return os.stat(a).st_dev == os.stat(b).st_dev
+        except OSError:
+            return False
+
+    def clean(self):
+        """Removes items left behind by an interrupted sync."""
+        if not self.dir_path.is_dir():
+            return 0
+        removed = 0
+        for path in self.dir_path.iterdir():
+            self.discard(path)
+            removed += 1
+        if removed:
+            log.info(f'Removed {removed} interrupted items from "{self.dir_path}"')
+        return removed
+
+    def new_item_dir(self, item):
+        """
+        Returns a new empty directory to assemble an item in. It is created with
+        mkdir() rather than mkdtemp() so it follows the umask like any other
+        directory in the media directory, as it becomes the published item.
+        """
+        self.dir_path.mkdir(parents=True, exist_ok=True)
+        while True:
+            staged_dir = self.dir_path / f"{item.item_id}-{secrets.token_hex(4)}"
+            try:
+                staged_dir.mkdir()
+            except FileExistsError:
+                continue
+            return staged_dir
+
+    @staticmethod
+    def discard(staged_dir):
+        """Removes a staged item, if it has not been published."""
+        shutil.rmtree(staged_dir, ignore_errors=True)
+
+    def publish(self, staged_dir, local_path):
+        """
+        Moves a staged item to "local_path" in the media directory. If the item
+        directory does not exist yet it is published with one atomic rename,
+        otherwise each staged file replaces the file of the same name in it.
+        """
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(staged_dir, local_path)
+            log.info(f'Published "{local_path}"')
+            return
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY, errno.EXDEV):
+                raise
+        log.info(f'Merging into existing directory "{local_path}"')
+        self._merge(Path(staged_dir), local_path)
+        self.discard(staged_dir)
+
+    def _merge(self, src_dir, dest_dir):
+        dest_dir.mkdir(exist_ok=True)
+        for path in src_dir.iterdir():
+            dest = dest_dir / path.name
+            if path.is_dir() and dest.is_dir():
+                self._merge(path, dest)
+            else:
+                move_file(path, dest)
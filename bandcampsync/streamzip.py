@@ -0,0 +1,432 @@
+import os
+import struct
+import zlib
+from pathlib import Path
+from .logger import get_logger
+from .manifest import new_hash
+
+
+log = get_logger("streamzip")
+
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+ZIP64_END_OF_CENTRAL_DIRECTORY = b"PK\x06\x06"
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = b"PK\x06\x07"
+END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+
+LOCAL_FILE_HEADER_STRUCT = struct.Struct("<4sHHHHHIIIHH")
+CENTRAL_DIRECTORY_HEADER_STRUCT = struct.Struct("<4sHHHHHHIIIHHHHHII")
+
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+
+
+class StreamingZipError(ValueError):
+    pass
+
+
+def _decode_name(raw, flags):
+    if flags & FLAG_UTF8:
+        return raw.decode("utf-8", errors="replace")
+    return raw.decode("cp437")
+
+
+def _zip64_sizes(extra, size, compressed_size):
+    """
+    Returns the sizes from the zip64 extended information extra field, which only
+    holds the sizes that are 0xFFFFFFFF in the header, uncompressed size first.
+    """
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, position)
+        position += 4
+        if header_id == ZIP64_EXTRA_ID:
+            field = extra[position : position + length]
+            values = [
+                struct.unpack_from("<Q", field, offset)[0]
+                for offset in range(0, len(field) - 7, 8)
+            ]
+            if size == ZIP64_LIMIT and values:
+                size = values.pop(0)
+            if compressed_size == ZIP64_LIMIT and values:
+                compressed_size = values.pop(0)
+            return size, compressed_size, True
+        position += length
+    return size, compressed_size, False
+
+
+class _Member:
+    def __init__(self, name, flags, method, crc, compressed_size, size, zip64):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.zip64 = zip64
+        self.temp_path = None
+        self.path = None
+        self.hash = new_hash()
+        self.file = None
+        self.decompressor = None
+        self.actual_crc = 0
+        self.compressed_read = 0
+        self.written = 0
+
+    @property
+    def has_data_descriptor(self):
+        return bool(self.flags & FLAG_DATA_DESCRIPTOR)
+
+
+class StreamingZipExtractor:
+    """
+    Extracts a zip archive while it is being downloaded. Each block of the download
+    is passed to feed() in order from the first byte, members are decompressed as
+    their bytes arrive and written to temporary files in "dest_dir". Member sizes
+    and CRCs are checked against the local file headers or the data descriptors
+    that follow members of archives written as a stream, zip64 sizes are supported.
+    Once the central directory at the end of the archive has arrived and matches
+    the extracted members the extraction is "finished" and commit() renames every
+    member to its final name, given by "member_path" for each member name.
+
+    Members are only streamed if it is safe to, archives with encrypted or stored
+    members of unknown size, unsupported compression, subdirectories or anything
+    else unexpected stop the extraction, which can then be done from the central
+    directory of the complete download as before. abort() removes the temporary
+    files of an extraction that did not finish or is not wanted. The extractor
+    never raises from feed(), so it can be fed from a download writer.
+    """
+
+    STATE_SIGNATURE = "signature"
+    STATE_DATA = "data"
+    STATE_DESCRIPTOR = "descriptor"
+    STATE_FINISHED = "finished"
+    STATE_COMMITTED = "committed"
+    STATE_STOPPED = "stopped"
+    TEMP_PREFIX = ".bandcampsync-extract-"
+    # Largest block of decompressed data held in memory at once
+    MAX_OUTPUT_SIZE = 1024 * 1024
+
+    def __init__(self, dest_dir, member_path=None):
+        self.dest_dir = Path(dest_dir)
+        self.member_path = member_path or (lambda name: self.dest_dir / name)
+        self.buffer = bytearray()
+        self.state = self.STATE_SIGNATURE
+        self.members = []
+        self.central_directory = []
+        self.member = None
+        self.created_dest_dir = False
+        self.stop_reason = None
+        self.bytes_fed = 0
+        self.extracted_bytes = 0
+
+    @property
+    def finished(self):
+        return self.state == self.STATE_FINISHED
+
+    @property
+    def stopped(self):
+        return self.state == self.STATE_STOPPED
+
+    def feed(self, data):
+        if self.state not in (
+            self.STATE_SIGNATURE,
+            self.STATE_DATA,
+            self.STATE_DESCRIPTOR,
+        ):
+            return
+        self.bytes_fed += len(data)
+        self.buffer += data
+        try:
+            while self._step():
+                pass
+        except StreamingZipError as e:
+            self.abort(str(e))
+        except (OSError, zlib.error, struct.error, UnicodeDecodeError) as e:
+            self.abort(f"{type(e).__name__}: {e}")
+
+    def _step(self):
+        if self.state == self.STATE_SIGNATURE:
+            return self._read_record()
+        if self.state == self.STATE_DATA:
+            return self._read_data()
+        if self.state == self.STATE_DESCRIPTOR:
+            return self._read_descriptor()
+        return False
+
+    def _read_record(self):
+        if len(self.buffer) < 4:
+            return False
+        signature = bytes(self.buffer[:4])
+        if signature == LOCAL_FILE_HEADER:
+            if self.central_directory:
+                raise StreamingZipError("local file header after central directory")
+            return self._read_local_file_header()
+        if signature == CENTRAL_DIRECTORY_HEADER:
+            return self._read_central_directory_header()
+        if signature == ZIP64_END_OF_CENTRAL_DIRECTORY:
+            if len(self.buffer) < 12:
+                return False
+            (record_size,) = struct.unpack_from("<Q", self.buffer, 4)
+            return self._consume(12 + record_size)
+        if signature == ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR:
+            return self._consume(20)
+        if signature == END_OF_CENTRAL_DIRECTORY:
+            if len(self.buffer) < 22:
+                return False
+            (comment_length,) = struct.unpack_from("<H", self.buffer, 20)
+            if not self._consume(22 + comment_length):
+                return False
+            self._finish()
+            return False
+        if not self.members and signature[:2] != b"PK":
+            # Not a zip archive, such as a single track
+            self.abort(None)
+            return False
+        raise StreamingZipError(f"unexpected record signature {signature!r}")
+
+    def _consume(self, size):
+        if len(self.buffer) < size:
+            return False
+        del self.buffer[:size]
+        return True
+
+    def _read_local_file_header(self):
+        header_size = LOCAL_FILE_HEADER_STRUCT.size
+        if len(self.buffer) < header_size:
+            return False
+        (
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            size,
+            name_length,
+            extra_length,
+        ) = LOCAL_FILE_HEADER_STRUCT.unpack_from(self.buffer)
+        total_size = header_size + name_length + extra_length
+        if len(self.buffer) < total_size:
+            return False
+        name = _decode_name(
+            bytes(self.buffer[header_size : header_size + name_length]), flags
+        )
+        extra = bytes(self.buffer[header_size + name_length : total_size])
+        size, compressed_size, zip64 = _zip64_sizes(extra, size, compressed_size)
+        del self.buffer[:total_size]
+        member = _Member(name, flags, method, crc, compressed_size, size, zip64)
+        if flags & FLAG_ENCRYPTED:
+            raise StreamingZipError(f"member is encrypted: {name}")
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise StreamingZipError(f"unsupported compression method {method}: {name}")
+        if method == METHOD_STORED and member.has_data_descriptor:
+            # The end of the member data cannot be found without its size
+            raise StreamingZipError(f"stored member of unknown size: {name}")
+        if method == METHOD_DEFLATED:
+            member.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._open_member(member)
+        self.members.append(member)
+        self.member = member
+        self.state = self.STATE_DATA
+        return True
+
+    def _open_member(self, member):
+        # Bandcamp archives are flat, anything else is extracted as before
+        if "/" in member.name or "\\" in member.name or member.name in ("", ".", ".."):
+            raise StreamingZipError(f"member is not a plain file name: {member.name}")
+        if not self.dest_dir.is_dir():
+            self.dest_dir.mkdir(parents=True, exist_ok=True)
+            self.created_dest_dir = True
+        member.temp_path = self.dest_dir / f"{self.TEMP_PREFIX}{len(self.members)}"
+        member.file = open(member.temp_path, "wb")
+
+    def _write_member(self, data):
+        if not data:
+            return
+        member = self.member
+        member.actual_crc = zlib.crc32(data, member.actual_crc)
+        member.hash.update(data)
+        member.written += len(data)
+        self.extracted_bytes += len(data)
+        member.file.write(data)
+
+    def _read_data(self):
+        member = self.member
+        decompressor = member.decompressor
+        if decompressor is None:
+            remaining = member.compressed_size - member.compressed_read
+            if remaining > 0:
+                if not self.buffer:
+                    return False
+                data = bytes(self.buffer[:remaining])
+                del self.buffer[: len(data)]
+                member.compressed_read += len(data)
+                self._write_member(data)
+                if member.compressed_read < member.compressed_size:
+                    return False
+            return self._end_member_data()
+        if not self.buffer:
+            return False
+        if member.has_data_descriptor:
+            # The compressed data ends where the deflate stream does
+            data = bytes(self.buffer)
+        else:
+            data = bytes(self.buffer[: member.compressed_size - member.compressed_read])
+        del self.buffer[: len(data)]
+        while data and not decompressor.eof:
+            self._write_member(decompressor.decompress(data, self.MAX_OUTPUT_SIZE))
+            member.compressed_read += len(data) - len(decompressor.unconsumed_tail)
+            data = decompressor.unconsumed_tail
+        if decompressor.eof:
+            unused = decompressor.unused_data
+            member.compressed_read -= len(unused)
+            # Everything after the compressed data is the next record
+            self.buffer[:0] = unused + data
+            return self._end_member_data()
+        if (
+            not member.has_data_descriptor
+            and member.compressed_read >= member.compressed_size
+        ):
+            raise StreamingZipError(f"compressed data is truncated: {member.name}")
+        return False
+
+    def _end_member_data(self):
+        member = self.member
+        member.file.close()
+        if member.has_data_descriptor:
+            self.state = self.STATE_DESCRIPTOR
+            return True
+        self._check_member(member.crc, member.compressed_size, member.size)
+        return True
+
+    def _read_descriptor(self):
+        member = self.member
+        offset = 4 if bytes(self.buffer[:4]) == DATA_DESCRIPTOR else 0
+        actual = (member.actual_crc, member.compressed_read, member.written)
+        if len(self.buffer) < offset + 12:
+            return False
+        values = struct.unpack_from("<III", self.buffer, offset)
+        if values == actual and not member.zip64:
+            del self.buffer[: offset + 12]
+            self._check_member(*values)
+            return True
+        if len(self.buffer) < offset + 20:
+            return False
+        values = struct.unpack_from("<IQQ", self.buffer, offset)
+        del self.buffer[: offset + 20]
+        self._check_member(*values)
+        return True
+
+    def _check_member(self, crc, compressed_size, size):
+        member = self.member
+        actual = (member.actual_crc, member.compressed_read, member.written)
+        if (crc, compressed_size, size) != actual:
+            raise StreamingZipError(
+                f"member does not match its header (crc, compressed size, size) "
+                f"{(crc, compressed_size, size)} != {actual}: {member.name}"
+            )
+        member.crc = crc
+        member.compressed_size = compressed_size
+        member.size = size
+        member.decompressor = None
+        self.member = None
+        self.state = self.STATE_SIGNATURE
+
+    def _read_central_directory_header(self):
+        header_size = CENTRAL_DIRECTORY_HEADER_STRUCT.size
+        if len(self.buffer) < header_size:
+            return False
+        fields = CENTRAL_DIRECTORY_HEADER_STRUCT.unpack_from(self.buffer)
+        flags = fields[3]
+        crc, compressed_size, size = fields[7:10]
+        name_length, extra_length, comment_length = fields[10:13]
+        total_size = header_size + name_length + extra_length + comment_length
+        if len(self.buffer) < total_size:
+            return False
+        name = _decode_name(
+            bytes(self.buffer[header_size : header_size + name_length]), flags
+        )
+        extra = bytes(
+            self.buffer[
+                header_size + name_length : header_size + name_length + extra_length
+            ]
+        )
+        size, compressed_size, _ = _zip64_sizes(extra, size, compressed_size)
+        del self.buffer[:total_size]
+        self.central_directory.append((name, crc, compressed_size, size))
+        return True
+
+    def _finish(self):
+        extracted = [(m.name, m.crc, m.compressed_size, m.size) for m in self.members]
+        if extracted != self.central_directory:
+            raise StreamingZipError(
+                "central directory does not match the extracted members"
+            )
+        self.state = self.STATE_FINISHED
+        log.debug(
+            f"Extracted {len(self.members)} members while downloading to "
+            f'"{self.dest_dir}"'
+        )
+
+    def commit(self):
+        """
+        Renames the extracted members to their final paths. Returns the list of
+        paths written, each member's "path" and "hash" of its content are also set.
+        """
+        if not self.finished:
+            raise StreamingZipError("extraction has not finished")
+        paths = []
+        for member in self.members:
+            path = Path(self.member_path(member.name))
+            log.info(f'Extracted file: "{path}"')
+            os.replace(member.temp_path, path)
+            member.temp_path = None
+            member.path = path
+            paths.append(path)
+        self.state = self.STATE_COMMITTED
+        return paths
+
+    def abort(self, reason=None):
+        """
+        Stops the extraction and removes its temporary files, unless the members
+        have already been committed. The reason is logged if there is one.
+        """
+        if self.state == self.STATE_COMMITTED:
+            return
+        if self.state != self.STATE_STOPPED and reason:
+            log.info(
+                f'Stopped extracting zip while downloading to "{self.dest_dir}": '
+                f"{reason}"
+            )
+        self.state = self.STATE_STOPPED
+        if self.stop_reason is None:
+            self.stop_reason = reason
+        self.buffer = bytearray()
+        self.member = None
+        for member in self.members:
+            if member.file is not None and not member.file.closed:
+                member.file.close()
+            if member.temp_path is not None:
+                try:
+                    member.temp_path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log.warning(f'Failed to remove "{member.temp_path}": {e}')
+                member.temp_path = None
+        if self.created_dest_dir:
+            try:
+                self.dest_dir.rmdir()
+            except OSError:
+                pass
+            self.created_dest_dir = False
@@ -1,36 +1,166 @@
 import asyncio
 import json
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime, timezone
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
 from .options import BandcampSyncOptions
 from .logger import get_logger
-from .bandcamp import Bandcamp, BandcampError, BandcampDownloadUnavailable
+from .bandcamp import (
+    Bandcamp,
+    BandcampItem,
+    BandcampError,
+    BandcampDownloadUnavailable,
+    BandcampRateLimited,
+    parse_purchase_datetime,
+)
+from .cache import AuthCache, DownloadPageCache, user_cache_dir
 from .ignores import Ignores
 from .media import LocalMedia
 from .notify import NotifyURL
+from .extract import ParallelZipExtractor
 from .download import (
     download_file,
+    download_file_segmented,
     unzip_file,
     move_file,
-    copy_file,
     mask_sig,
     is_zip_file,
     DownloadInvalidContentType,
     DownloadBadStatusCode,
     DownloadExpired,
+    DownloadRateLimited,
+    DownloadInvalidArchive,
+    MAX_BLOCK_SIZE,
+    WRITER_QUEUE_DEPTH,
+)
+from .journal import DownloadJournal
+from .manifest import AlbumManifest, LibraryVerifier, StreamHasher
+from .metrics import (
+    CHECKPOINT_ADVANCES,
+    CHECKPOINT_TIMESTAMP,
+    ITEM_DOWNLOAD_SECONDS,
+    ITEM_INSTALL_SECONDS,
+    QUEUE_DEPTH,
+    REGISTRY,
+    RETRIES,
+    RUN_SECONDS,
+    RUN_TIMESTAMP,
+    RUNS,
 )
+from .ratelimit import BandwidthLimiter, BandwidthSchedule, RateLimiter
+from .retry import Backoff, DownloadSlots, RetryPolicy
+from .schedule import estimate_makespan, largest_first
+from .snapshot import CollectionSnapshot
+from .space import DiskSpaceAdmission, DiskSpaceUnavailable
+from .sniff import AUDIO_KINDS, KIND_ZIP, ContentSniffer
+from .staging import StagingArea
+from .streamzip import StreamingZipExtractor
+from .sessions import SessionPool
+from .writer import MB, BufferPool, TransferStats
+from .aio import AsyncBandcamp, download_file_async, new_async_session
 
 
 log = get_logger("sync")
 
 
+# Errors that fail a single attempt to sync an item, see Syncer._handle_sync_error()
+SYNC_ERRORS = (
+    BandcampError,
+    DownloadBadStatusCode,
+    DownloadInvalidContentType,
+    DownloadExpired,
+    DiskSpaceUnavailable,
+)
+
+
+def parse_formats(value, dir_path):
+    """
+    Parses a list of formats to sync such as "flac,mp3-v0=/music/mp3", each format
+    optionally followed by the directory to sync it to. Formats without a directory
+    are synced to "dir_path". Returns the first format with its directory and a
+    dict of any other formats to their directories. Raises ValueError if a format
+    is given twice or two formats would be synced to the same directory.
+    """
+    formats = {}
+    for entry in value.split(","):
+        media_format, _, path = (part.strip() for part in entry.partition("="))
+        if not media_format:
+            if entry.strip():
+                raise ValueError(f'Missing format before "={path}"')
+            continue
+        if media_format in formats:
+            raise ValueError(f"Format given more than once: {media_format}")
+        formats[media_format] = Path(path).resolve() if path else Path(dir_path)
+    if not formats:
+        raise ValueError("No format given")
+    if len({path.resolve() for path in formats.values()}) != len(formats):
+        raise ValueError("Each format must be synced to a different directory")
+    (media_format, format_dir), *others = formats.items()
+    return media_format, format_dir, dict(others)
+
+
+class ItemSync:
+    """
+    The progress of syncing an item across attempts. The URLs resolved by each
+    stage and the size listed on the download page are kept so a retry can start
+    from the stage that failed, rather than fetching the download page and
+    checking the download again when only the transfer failed.
+    """
+
+    # Fetch the download page for the download URL
+    STAGE_RESOLVE = "resolve"
+    # Check the download URL for the URL of the file
+    STAGE_STAT = "stat"
+    # Download and install the file
+    STAGE_TRANSFER = "transfer"
+
+    def __init__(self, item, media_format, local_path):
+        self.item = item
+        self.media_format = media_format
+        self.local_path = local_path
+        self.attempt = 0
+        self.stage = self.STAGE_RESOLVE
+        # The last stage retried from the URLs already resolved, if it fails again
+        # the item starts over from the download page
+        self.retried_stage = None
+        self.initial_download_url = None
+        self.download_file_url = None
+        # The size listed on the download page, None if it is not listed
+        self.size = None
+        # Seconds to wait before the next attempt, None to retry straight away
+        self.delay = None
+
+
 class Syncer:
     STATE_FILENAME = ".bandcampsync-state.json"
+    # Download page caches were kept in the media directory by older versions
+    LEGACY_CACHE_FILENAME = ".bandcampsync-cache.json"
+    AUTH_CACHE_FILENAME = ".bandcampsync-auth.json"
+    SNAPSHOT_FILENAME = ".bandcampsync-collection.json"
+    PARTIAL_DIRNAME = ".bandcampsync-partial"
     STATE_VERSION = 1
+    ENGINES = ("threads", "async")
+    SCHEDULES = ("newest", "largest")
 
-    def __init__(self, options: BandcampSyncOptions, auto_run: bool = True):
+    def __init__(
+        self,
+        options: BandcampSyncOptions,
+        auto_run: bool = True,
+        primary=None,
+        load_collection: bool = True,
+        zip_extractor=None,
+    ):
+        """
+        Set "primary" to another Syncer to sync a second format in the same run, the
+        collection, download page cache and limits of the primary are shared and
+        the collection is not loaded again. Set "load_collection" to False to load
+        the collection later. Set "zip_extractor" to a ParallelZipExtractor shared
+        with other Syncers, which its owner logs and closes.
+        """
+        self.started = time.monotonic()
         self.ignores = Ignores(
             ign_file_path=options.ign_file_path, ign_patterns=options.ign_patterns
         )
@@ -45,19 +175,81 @@ class Syncer:
         self.concurrency = max(1, options.concurrency)
         self.max_retries = max(1, options.max_retries)
         self.retry_wait = max(0, options.retry_wait)
+        # Without a maximum wait every retry waits retry_wait seconds
+        self.retry_policy = None
+        if options.retry_max_wait > 0:
+            retry_max_wait = max(self.retry_wait, options.retry_max_wait)
+            self.retry_policy = RetryPolicy(
+                [
+                    # A failed transfer resumes from the partial file and the CDN
+                    # usually recovers quickly
+                    (
+                        DownloadBadStatusCode,
+                        Backoff(self.retry_wait, retry_max_wait, factor=2),
+                    ),
+                    # Errors from Bandcamp itself more often mean the site is
+                    # overloaded, so back off faster
+                    (
+                        BandcampError,
+                        Backoff(self.retry_wait, retry_max_wait, factor=4),
+                    ),
+                ],
+                default=Backoff(self.retry_wait, retry_max_wait),
+            )
         self.skip_hidden = options.skip_hidden
+        self.stream_purchases = options.stream_purchases
+        self.metrics_file = options.metrics_file
+        if options.engine not in self.ENGINES:
+            raise ValueError(
+                f"Invalid engine: {options.engine} (must be one of: "
+                f"{', '.join(self.ENGINES)})"
+            )
+        self.engine = options.engine
+        if options.schedule not in self.SCHEDULES:
+            raise ValueError(
+                f"Invalid schedule: {options.schedule} (must be one of: "
+                f"{', '.join(self.SCHEDULES)})"
+            )
+        self.schedule = options.schedule
+        # Created for the duration of sync_items()
+        self.executor = None
+        self.async_bandcamp = None
+        self.slots = None
 
         self.show_id_file_warning = False
         self.new_items_downloaded = False
+        # Where each item was published in this run, by item id
+        self.published_paths = {}
         self.had_sync_errors = False
         self.sync_errors = []
         self._warned_missing_purchase_date = False
 
         self.use_collection_checkpoint = not self.until_date
-        self.collection_checkpoint_token = self._load_collection_checkpoint()
-        index_local_media = not self.collection_checkpoint_token
-        if not index_local_media:
-            log.info("Collection checkpoint loaded; skipping initial local media index")
+        self.collection_snapshot = CollectionSnapshot(
+            self.media_dir / self.SNAPSHOT_FILENAME
+        )
+        # With a complete snapshot only purchases newer than it are loaded. Without
+        # one, such as on the first run, pagination stops at the checkpoint and
+        # the snapshot is written from the purchases loaded. The checkpoint is
+        # still saved every run as a fallback for when the snapshot is unreadable
+        self.use_collection_snapshot = self.collection_snapshot.usable
+        # Set when pagination stops at --until-date, older purchases may not be in
+        # the collection snapshot so it is not marked as complete
+        self.stopped_at_until_date = False
+        if self.use_collection_snapshot:
+            self.collection_checkpoint_token = None
+            index_local_media = self.collection_snapshot.has_unknown_items()
+            if not index_local_media:
+                log.info(
+                    "Collection snapshot loaded; skipping initial local media index"
+                )
+        else:
+            self.collection_checkpoint_token = self._load_collection_checkpoint()
+            index_local_media = not self.collection_checkpoint_token
+            if not index_local_media:
+                log.info(
+                    "Collection checkpoint loaded; skipping initial local media index"
+                )
         self.local_media = LocalMedia(
             media_dir=options.dir_path,
             ignores=self.ignores,
@@ -66,9 +258,91 @@ class Syncer:
             index_on_init=index_local_media,
         )
 
-        self.bandcamp = Bandcamp(cookies=options.cookies)
-        self.bandcamp.verify_authentication()
-        self.bandcamp.load_purchases(stop_when=self._should_stop_loading_purchase)
+        # Downloads are written to partial files that can be resumed after a
+        # restart, in the temporary directory if one is set so downloads stay off
+        # the media filesystem, otherwise in the media directory
+        partial_root = self.temp_dir_root or self.media_dir
+        self.download_journal = DownloadJournal(
+            Path(partial_root) / self.PARTIAL_DIRNAME
+        )
+        if not self.dry_run:
+            self.download_journal.prune()
+            pending = self.download_journal.pending()
+            if pending:
+                log.info(f"Found {len(pending)} interrupted downloads to resume")
+
+        # Items are assembled on the same filesystem as the media directory and
+        # published with a rename once they are complete
+        self.staging = StagingArea(self.media_dir, temp_dir_root=self.temp_dir_root)
+        if not self.dry_run:
+            self.staging.clean()
+
+        if primary is not None:
+            self.download_cache = primary.download_cache
+            self.rate_limiter = primary.rate_limiter
+        else:
+            # The cache holds signed download URLs so it is kept out of the media
+            # directory, in the temporary directory if one is set
+            cache_dir = self.temp_dir_root or user_cache_dir()
+            self.download_cache = DownloadPageCache(
+                DownloadPageCache.path_for(cache_dir, self.media_dir),
+                ttl=options.download_cache_ttl,
+            )
+            if not self.dry_run:
+                self._remove_legacy_cache()
+            # Shared by all worker threads so concurrent requests stay under the
+            # limits and a 429 or 503 response pauses every worker, not only the one
+            # that got it. The bandwidth limit is shared fairly between all downloads
+            bandwidth = BandwidthLimiter(
+                options.bandwidth, BandwidthSchedule.parse(options.bandwidth_schedule)
+            )
+            self.rate_limiter = RateLimiter(
+                api_rate=options.api_rate,
+                download_rate=options.download_rate,
+                bandwidth=bandwidth if bandwidth.enabled else None,
+            )
+        # Large files can be downloaded over several connections at once
+        self.download_segments = max(1, options.download_segments)
+        self.segment_min_size = max(0, options.segment_min_size) * MB
+        # Keep-alive sessions reused across items, one per concurrent download or
+        # download segment
+        self.session_pool = SessionPool(size=self.concurrency * self.download_segments)
+        # Write buffers shared by all downloads, with a writer thread each download
+        # can have a full queue of buffers plus the one being filled
+        self.threaded_writer = bool(options.threaded_writer)
+        self.extract_while_downloading = bool(options.extract_while_downloading)
+        buffers_per_download = WRITER_QUEUE_DEPTH + 1 if self.threaded_writer else 1
+        self.buffer_pool = BufferPool(
+            MAX_BLOCK_SIZE, max_buffers=self.concurrency * buffers_per_download
+        )
+        self.transfer_stats = TransferStats()
+        # Downloads wait for free space on the filesystems they write to
+        if primary is not None:
+            self.disk_space = primary.disk_space
+        else:
+            self.disk_space = DiskSpaceAdmission(headroom=options.min_free_space * MB)
+        # Zip files are extracted on a pool of threads shared by all downloads
+        self.owns_zip_extractor = zip_extractor is None
+        if zip_extractor is None:
+            zip_extractor = ParallelZipExtractor(workers=options.extract_workers)
+        self.zip_extractor = zip_extractor
+        # Items found damaged by verification are downloaded again
+        self.damaged_item_ids = set()
+        if options.verify:
+            self._verify_library(options.verify_rate)
+        if primary is not None:
+            self.bandcamp = primary.bandcamp
+        else:
+            self.bandcamp = self._new_bandcamp(options)
+            self.bandcamp.verify_authentication()
+            if self.stream_purchases:
+                log.info(
+                    "Purchases will be synced as they are loaded from the collection"
+                )
+            elif load_collection:
+                self.bandcamp.load_purchases(
+                    stop_when=self.should_stop_loading_purchase
+                )
 
         if self.until_date:
             log.info(
@@ -82,10 +356,66 @@ class Syncer:
             asyncio.run(self.sync_items())
             self.notify()
 
+    def _new_bandcamp(self, options):
+        if self.dry_run:
+            auth_cache = None
+        else:
+            auth_cache = AuthCache(
+                self.media_dir / self.AUTH_CACHE_FILENAME, ttl=options.auth_cache_ttl
+            )
+        return Bandcamp(
+            cookies=options.cookies,
+            per_page=options.page_size,
+            adaptive_per_page=options.adaptive_page_size,
+            # Loading purchases newer than the snapshot usually needs a single
+            # page, so do not request the next page ahead
+            pipeline=not self.use_collection_snapshot,
+            download_cache=self.download_cache,
+            auth_cache=auth_cache,
+            rate_limiter=self.rate_limiter,
+            session_pool=self.session_pool,
+        )
+
+    def _verify_library(self, rate):
+        """
+        Verifies the files of downloaded items against their manifests, using the
+        same number of threads as extraction, and queues damaged items to be
+        downloaded again.
+        """
+        verifier = LibraryVerifier(
+            self.media_dir,
+            workers=self.zip_extractor.workers,
+            rate=rate,
+            save=not self.dry_run,
+        )
+        damaged = verifier.run()
+        if not damaged:
+            return
+        self.damaged_item_ids.update(damaged)
+        self.collection_snapshot.requeue(damaged)
+        if self.collection_checkpoint_token:
+            # Damaged items can be older than the checkpoint
+            log.info("Ignoring the collection checkpoint to download damaged items")
+            self.collection_checkpoint_token = None
+
     @property
     def state_file_path(self):
         return self.media_dir / self.STATE_FILENAME
 
+    def _remove_legacy_cache(self):
+        """Removes a download page cache left in the media directory."""
+        legacy_path = self.media_dir / self.LEGACY_CACHE_FILENAME
+        try:
+            legacy_path.unlink()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            log.warning(
+                f'Failed to remove old download page cache "{legacy_path}": {e}'
+            )
+            return
+        log.info(f'Removed old download page cache "{legacy_path}"')
+
     @staticmethod
     def _item_token(item):
         token = getattr(item, "token", None)
@@ -148,6 +478,8 @@ class Syncer:
                 json.dump(state, f, indent=2, sort_keys=True)
                 f.write("\n")
             temp_state_file.replace(state_file)
+            CHECKPOINT_ADVANCES.inc()
+            CHECKPOINT_TIMESTAMP.set(time.time())
             log.info(f'Updated collection checkpoint: "{state_file}"')
         except OSError as e:
             log.error(f'Failed to write collection checkpoint "{state_file}": {e}')
@@ -157,6 +489,16 @@ class Syncer:
                 except OSError:
                     pass
 
+    def _save_collection_snapshot(self):
+        if self.dry_run:
+            log.info("Dry run enabled: not updating collection snapshot")
+            return
+        self.collection_snapshot.merge(
+            self.bandcamp.collection_items, complete=not self.stopped_at_until_date
+        )
+        if self.collection_snapshot.usable:
+            self.collection_snapshot.save()
+
     def _record_sync_error(self, message):
         self.had_sync_errors = True
         self.sync_errors.append(message)
@@ -169,17 +511,33 @@ class Syncer:
         for error in self.sync_errors:
             log.warning(f"  - {error}")
 
-    def _should_stop_loading_purchase(self, item):
-        if self.until_date:
-            purchase_dt = self._parse_purchase_datetime(item)
-            if purchase_dt is not None and purchase_dt.date() < self.until_date:
+    def should_stop_loading_purchase(self, item):
+        """
+        Returns whether loading the collection can stop at "item", the first
+        purchase in the snapshot, older than --until-date or at the checkpoint.
+        """
+        if self.use_collection_snapshot:
+            if self.collection_snapshot.contains(item):
+                log.info("Reached collection snapshot, stopping pagination")
                 return True
+            return False
+        if self._is_before_until_date(item):
+            self.stopped_at_until_date = True
+            self.collection_snapshot.set_status(
+                item, CollectionSnapshot.STATUS_FILTERED
+            )
+            return True
         if self.collection_checkpoint_token:
             token = self._item_token(item)
             if token and token == self.collection_checkpoint_token:
                 log.info(
                     "Reached last known collection checkpoint, stopping pagination"
                 )
+                # The older purchases were synced by earlier runs, so the snapshot
+                # written from the purchases loaded is complete
+                self.collection_snapshot.set_status(
+                    item, CollectionSnapshot.STATUS_CHECKPOINTED
+                )
                 return True
         return False
 
@@ -187,26 +545,98 @@ class Syncer:
         purchased = getattr(item, "purchased", None)
         if not purchased or not isinstance(purchased, str):
             return None
-        if purchased.endswith(" GMT"):
-            try:
-                dt = datetime.strptime(purchased, "%d %b %Y %H:%M:%S GMT")
-                return dt.replace(tzinfo=timezone.utc)
-            except ValueError:
-                pass
+        if isinstance(item, BandcampItem):
+            # Parsed once and cached on the item
+            purchase_dt = item.purchased_datetime
+        else:
+            purchase_dt = parse_purchase_datetime(purchased)
+        if purchase_dt is None and not self._warned_missing_purchase_date:
+            log.warning(
+                f'Unable to parse purchase date "{purchased}". '
+                "Date cutoffs may not behave as expected."
+            )
+            self._warned_missing_purchase_date = True
+        return purchase_dt
+
+    def _is_before_until_date(self, item):
+        if not self.until_date:
+            return False
+        purchase_dt = self._parse_purchase_datetime(item)
+        return purchase_dt is not None and purchase_dt.date() < self.until_date
+
+    def _snapshot_purchases(self, loaded_items):
+        """
+        Returns the purchases from the collection snapshot that still need to be
+        synced and were not loaded in this run. Purchases that share an artist and
+        title with another purchase are given a folder suffix, as when the whole
+        collection is loaded.
+        """
+        if not self.use_collection_snapshot:
+            return []
+        loaded_ids = {item.item_id for item in loaded_items}
+        items = []
+        for item in self.collection_snapshot.unresolved_items():
+            if item.item_id in loaded_ids:
+                continue
+            # Items that would be skipped again are left out before their download
+            # URLs are resolved
+            if self._is_before_until_date(item):
+                self.collection_snapshot.set_status(
+                    item, CollectionSnapshot.STATUS_FILTERED
+                )
+            elif self._is_skipped(item):
+                self.collection_snapshot.set_status(
+                    item, CollectionSnapshot.STATUS_SKIPPED
+                )
+            else:
+                items.append(item)
+        if items:
+            items = self._resolve_snapshot_download_urls(items)
+        titles = {}
+        for item in list(loaded_items) + items:
+            titles.setdefault((item.band_name, item.item_title), []).append(item)
+        # Resolved snapshot items are not synced but still share titles
+        synced_ids = loaded_ids | {item.item_id for item in items}
+        resolved_titles = {
+            (entry.get("band_name"), entry.get("item_title"))
+            for entry in self.collection_snapshot.entries
+            if entry["item_id"] not in synced_ids and entry.get("downloadable")
+        }
+        for title, title_group in titles.items():
+            if len(title_group) > 1 or title in resolved_titles:
+                for item in title_group:
+                    item.folder_suffix = f" [{item.item_id}]"
+        if items:
+            log.info(f"Syncing {len(items)} unresolved purchases from the snapshot")
+        return items
+
+    def _resolve_snapshot_download_urls(self, items):
+        """
+        Returns the snapshot items to sync with their download URLs resolved from
+        the collection, the snapshot does not keep them as they expire. Items
+        without a download any more are marked as unavailable.
+        """
+        log.info(
+            f"Resolving download URLs for {len(items)} purchases from the snapshot"
+        )
         try:
-            dt = datetime.strptime(purchased, "%d %b %Y %H:%M:%S %Z")
-            return dt.replace(tzinfo=timezone.utc)
-        except ValueError:
-            if not self._warned_missing_purchase_date:
-                log.warning(
-                    f'Unable to parse purchase date "{purchased}". '
-                    "Date cutoffs may not behave as expected."
+            resolved = self.bandcamp.resolve_download_urls(items)
+        except BandcampError as e:
+            self._record_sync_error(
+                f"Failed to resolve download URLs for purchases from the snapshot: {e}"
+            )
+            return []
+        resolved_ids = {item.item_id for item in resolved}
+        for item in items:
+            if item.item_id not in resolved_ids:
+                self.collection_snapshot.set_status(
+                    item, CollectionSnapshot.STATUS_UNAVAILABLE
                 )
-                self._warned_missing_purchase_date = True
-        return None
+        return resolved
 
     def _ordered_purchases(self):
         items = list(self.bandcamp.purchases)
+        items += self._snapshot_purchases(items)
         if not items:
             return []
         indexed = []
@@ -229,13 +659,18 @@ class Syncer:
         indexed.sort(key=sort_key, reverse=True)
         return [item for _, item, _ in indexed]
 
-    def _select_items_to_sync(self):
+    def select_items_to_sync(self):
+        """
+        Returns the loaded purchases to sync in order, those that pass the
+        checkpoint and date filters. The status of the others is recorded in the
+        collection snapshot.
+        """
         items = self._ordered_purchases()
         if not items:
             return []
 
         selected = []
-        for item in items:
+        for position, item in enumerate(items):
             token = self._item_token(item)
             if (
                 self.collection_checkpoint_token
@@ -243,42 +678,50 @@ class Syncer:
                 and token == self.collection_checkpoint_token
             ):
                 log.info("Stopping at collection checkpoint item")
+                self._set_filtered_status(
+                    items[position:], CollectionSnapshot.STATUS_CHECKPOINTED
+                )
                 break
 
-            if self.until_date:
-                purchase_dt = self._parse_purchase_datetime(item)
-                if purchase_dt is not None and purchase_dt.date() < self.until_date:
-                    log.info(
-                        f"Stopping before items older than {self.until_date.isoformat()}"
-                    )
-                    break
+            if self._is_before_until_date(item):
+                log.info(
+                    f"Stopping before items older than {self.until_date.isoformat()}"
+                )
+                self._set_filtered_status(
+                    items[position:], CollectionSnapshot.STATUS_FILTERED
+                )
+                break
 
             selected.append(item)
         return selected
 
-    def sync_item(
-        self,
-        item,
-        encoding=None,
-    ) -> bool:
-        """Syncs a single item (purchase).
-
-        Returns:
-            bool: indicating new media was downloaded
+    def _set_filtered_status(self, items, status):
         """
-        media_format = encoding or self.media_format
-
-        local_path = self.local_media.get_path_for_purchase(item)
+        Records the status of items that are not synced because of the checkpoint
+        or --until-date, so the snapshot does not keep them as never checked.
+        """
+        for item in items:
+            self.collection_snapshot.set_status(item, status)
 
+    def _should_download_item(self, item, local_path, media_format) -> bool:
+        """
+        Checks whether an item needs to be downloaded, logging why it is skipped
+        if not.
+        """
         # Check if any "ignore" pattern matches the band name
         if self.skip_hidden and item.hidden:
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_SKIPPED)
             log.info(
                 f'Item is hidden, skipping: "{item.band_name} / {item.item_title}" '
                 f"(id:{item.item_id})"
             )
             return False
 
-        if self.ignores.is_ignored(item):
+        # Items with damaged files are downloaded again even though they are
+        # already in the ignore file or the media directory
+        damaged = item.item_id in self.damaged_item_ids
+        if not damaged and self.ignores.is_ignored(item):
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_SKIPPED)
             if not self.show_id_file_warning and self.local_media.is_locally_downloaded(
                 item, local_path
             ):
@@ -286,197 +729,888 @@ class Syncer:
             return False
 
         if item.is_preorder:
+            self.collection_snapshot.set_status(
+                item, CollectionSnapshot.STATUS_PREORDER
+            )
             log.info(
                 f'Item is a preorder, skipping: "{item.band_name} / {item.item_title}" '
                 f"(id:{item.item_id})"
             )
             return False
 
-        elif self.local_media.is_locally_downloaded(item, local_path):
+        elif not damaged and self.local_media.is_locally_downloaded(item, local_path):
+            self.collection_snapshot.set_status(
+                item, CollectionSnapshot.STATUS_DOWNLOADED
+            )
             log.info(
                 f'Already locally downloaded, skipping: "{item.band_name} / {item.item_title}" '
                 f"(id:{item.item_id})"
             )
             return False
 
+        if damaged:
+            log.info(
+                f'Damaged media item, will download again: "{item.band_name} / '
+                f'{item.item_title}" (id:{item.item_id}) in "{media_format}"'
+            )
         else:
             log.info(
                 f'New media item, will download: "{item.band_name} / {item.item_title}" '
                 f'(id:{item.item_id}) in "{media_format}"'
             )
-            if self.dry_run:
-                log.info(
-                    f'DRY RUN: would download "{item.band_name} / {item.item_title}" '
-                    f"(id:{item.item_id})"
+        if self.dry_run:
+            log.info(
+                f'DRY RUN: would download "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id})"
+            )
+            return False
+        return True
+
+    def _install_download(
+        self,
+        item,
+        temp_file_path,
+        download_content_type,
+        local_path,
+        staged_dir,
+        media_format,
+        extractor=None,
+        content_kind=None,
+        hasher=None,
+    ):
+        """
+        Extracts or links a completed download into the item's staging directory,
+        then publishes it to "local_path" in the media directory and records the
+        item as downloaded. A zip file that a StreamingZipExtractor finished
+        extracting while it downloaded only has its extracted files renamed,
+        otherwise it is extracted from its central directory. The kind of content
+        sniffed from the download, if known, decides how it is installed without
+        opening the file again. The installed files are recorded in the item's
+        manifest with the hashes computed while they were downloaded or extracted.
+
+        Returns:
+            True if the item was installed, False if the download is not usable and
+            None if the attempt should be retried
+        """
+        installed_files = {}
+        if extractor is not None and extractor.finished:
+            log.info(
+                f'Extracted {len(extractor.members)} files from "{temp_file_path}" '
+                f"while downloading"
+            )
+            try:
+                extractor.commit()
+            except OSError as e:
+                log.error(f"Failed to move extracted files into {staged_dir}: {e}")
+                return None
+            for member in extractor.members:
+                installed_files[member.path] = member.hash.hexdigest()
+        elif content_kind == KIND_ZIP or (
+            content_kind is None and is_zip_file(temp_file_path)
+        ):
+            log.info(
+                f'Decompressing downloaded zip "{temp_file_path}" to "{staged_dir}"'
+            )
+            try:
+                extracted = unzip_file(
+                    str(temp_file_path),
+                    staged_dir,
+                    extractor=self.zip_extractor,
+                    member_path=lambda name: self._staged_member_path(staged_dir, name),
+                )
+            except DownloadInvalidArchive as e:
+                self._record_sync_error(
+                    f'Downloaded zip for "{item.band_name} / {item.item_title}" '
+                    f"(id:{item.item_id}) is not valid: {e}, skipping"
+                )
+                self.collection_snapshot.set_status(
+                    item, CollectionSnapshot.STATUS_FAILED
                 )
                 return False
-            for attempt in range(self.max_retries):
+            except OSError as e:
+                log.error(f'Failed to extract "{temp_file_path}" to {staged_dir}: {e}')
+                return None
+            for path, digest in extracted:
+                installed_files[Path(path)] = digest
+        elif (
+            content_kind in AUDIO_KINDS
+            or item.item_type == "track"
+            or download_content_type.startswith("audio/")
+            # Bandcamp may serve Ogg Vorbis as application/ogg.
+            or download_content_type == "application/ogg"
+        ):
+            slug = item.item_title
+            if item.url_hints and isinstance(item.url_hints, dict):
+                slug = item.url_hints.get("slug", item.item_title)
+            format_extension = self.local_media.clean_format(media_format)
+            file_dest = self.local_media.get_path_for_file(
+                staged_dir, f"{slug}.{format_extension}"
+            )
+            log.info(f'Staging single track: "{temp_file_path}" as "{file_dest}"')
+            # Moved rather than linked, a link would leave the published track
+            # sharing its inode with a partial file that a resumed download writes
+            try:
+                move_file(temp_file_path, file_dest)
+            except OSError as e:
+                log.error(f"Failed to move {temp_file_path} to {file_dest}: {e}")
+                return None
+            installed_files[file_dest] = hasher.hexdigest() if hasher else None
+        else:
+            self._record_sync_error(
+                f'Downloaded file for "{item.band_name} / {item.item_title}" (id:{item.item_id}) '
+                f'at "{temp_file_path}" is not a zip archive or a single track, skipping'
+            )
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_FAILED)
+            return False
+
+        self._write_manifest(item, staged_dir, installed_files)
+        if not self.ign_file_path:
+            try:
+                self.local_media.write_bandcamp_id(item, staged_dir)
+            except (OSError, ValueError) as e:
+                self._record_sync_error(
+                    f'Failed to write bandcamp item id for "{item.band_name} / {item.item_title}" '
+                    f'(id:{item.item_id}) to "{local_path}": {e}'
+                )
+        try:
+            self.staging.publish(staged_dir, local_path)
+        except OSError as e:
+            log.error(
+                f'Failed to move "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id}) from {staged_dir} to {local_path}: {e}"
+            )
+            return None
+        self.published_paths[item.item_id] = local_path
+        if self.ign_file_path:
+            # We assume that if you use an "ignore" file once, you'll
+            # keep using it forever (e.g. Docker).
+            # If you don't, you'll get a warning for the missing ID file
+            # on the items downloaded in the current session.
+            if item.item_id not in self.ignores.ids:
+                self.ignores.add(item)
+
+        self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_DOWNLOADED)
+        self.new_items_downloaded = True
+        return True
+
+    def _staged_member_path(self, staged_dir, name):
+        """
+        Returns the path a zip member is extracted to in a staged item, the first
+        component of its name is cleaned as for any other file in the media
+        directory.
+        """
+        parts = Path(name).parts
+        return self.local_media.get_path_for_file(staged_dir, parts[0]).joinpath(
+            *parts[1:]
+        )
+
+    def _write_manifest(self, item, item_dir, files):
+        """
+        Writes the manifest of the files installed for an item in "item_dir", files
+        without a known digest are hashed.
+        """
+        if not files:
+            return
+        manifest = AlbumManifest(item_dir, item_id=item.item_id)
+        try:
+            for path, digest in files.items():
+                manifest.add(path, digest)
+            manifest.save()
+        except (OSError, ValueError) as e:
+            log.warning(
+                f'Failed to write manifest for "{item.band_name} / {item.item_title}" '
+                f'(id:{item.item_id}) to "{item_dir}": {e}'
+            )
+
+    def _retry_delay(self, error, attempt):
+        if self.retry_policy is None:
+            return self.retry_wait
+        return self.retry_policy.delay(error, attempt)
+
+    def _handle_sync_error(self, sync, error):
+        """
+        Logs or records a failed attempt to sync an item and sets the stage the
+        next attempt starts from and the seconds to wait before it in sync.delay,
+        None to retry straight away.
+
+        Returns:
+            bool: whether to retry the item
+        """
+        item, attempt = sync.item, sync.attempt
+        if isinstance(error, BandcampDownloadUnavailable):
+            log.info(
+                f'No download available for "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id}): {error}. Skipping."
+            )
+            self.collection_snapshot.set_status(
+                item, CollectionSnapshot.STATUS_UNAVAILABLE
+            )
+            return False
+        if isinstance(error, DiskSpaceUnavailable):
+            self._record_sync_error(
+                f'Not enough disk space for "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id}): {error}. Skipping."
+            )
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_FAILED)
+            return False
+        if isinstance(error, DownloadExpired):
+            self.bandcamp.invalidate_item_downloads(item)
+            self._record_sync_error(
+                f'Download expired and requires email confirmation on Bandcamp for "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id}), skipping"
+            )
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_FAILED)
+            return False
+        if attempt >= self.max_retries - 1:
+            if not isinstance(error, (BandcampRateLimited, DownloadRateLimited)):
+                self.bandcamp.invalidate_item_downloads(item)
+            self._record_sync_error(
+                f"All {self.max_retries} attempts failed for {item.band_name} / {item.item_title}: {error}. Skipping."
+            )
+            self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_FAILED)
+            return False
+        RETRIES.inc(error=type(error).__name__)
+        if isinstance(error, (BandcampRateLimited, DownloadRateLimited)):
+            # The rate limiter has already paused all requests for as long as
+            # Bandcamp asked, so retry the same stage without the fixed wait and
+            # keep any cached download URL as it is still valid
+            log.warning(
+                f"Attempt {attempt + 1} failed for {item.band_name} / {item.item_title}: {error}. "
+                f"Retrying after the rate limit backoff..."
+            )
+            sync.delay = None
+            return True
+        sync.delay = self._retry_delay(error, attempt)
+        retry_in = f"{round(sync.delay, 1):g} seconds"
+        if sync.stage != sync.STAGE_RESOLVE and sync.retried_stage != sync.stage:
+            # Retry only the stage that failed with the URLs already resolved, a
+            # failed transfer resumes from the partial file
+            sync.retried_stage = sync.stage
+            log.warning(
+                f"Attempt {attempt + 1} failed for {item.band_name} / {item.item_title} "
+                f"at the {sync.stage} stage: {error}. Retrying the {sync.stage} in "
+                f"{retry_in}..."
+            )
+            return True
+        # The stage has already been retried or the cached download URL may have
+        # expired, fetch the download page again on the next attempt
+        self.bandcamp.invalidate_item_downloads(item)
+        sync.stage = sync.STAGE_RESOLVE
+        sync.retried_stage = None
+        log.warning(
+            f"Attempt {attempt + 1} failed for {item.band_name} / {item.item_title}: {error}. "
+            f"Retrying in {retry_in}..."
+        )
+        return True
+
+    def _retry_immediately(self, sync):
+        """
+        Counts an attempt that failed without an error, which has already been
+        logged. Returns None to retry it straight away, or False once every
+        attempt has been made and the item is recorded as failed.
+        """
+        sync.attempt += 1
+        sync.delay = None
+        if sync.attempt < self.max_retries:
+            return None
+        item = sync.item
+        self._record_sync_error(
+            f"All {self.max_retries} attempts failed for {item.band_name} / {item.item_title}. Skipping."
+        )
+        self.collection_snapshot.set_status(item, CollectionSnapshot.STATUS_FAILED)
+        return False
+
+    def _new_item_sync(self, item, encoding=None):
+        """
+        Returns an ItemSync to download an item in "encoding", or the configured
+        format, or None if it does not need to be downloaded.
+        """
+        media_format = encoding or self.media_format
+        local_path = self.local_media.get_path_for_purchase(item)
+        if not self._should_download_item(item, local_path, media_format):
+            return None
+        return ItemSync(item, media_format, local_path)
+
+    def sync_item(
+        self,
+        item,
+        encoding=None,
+    ) -> bool:
+        """Syncs a single item (purchase), waiting in this thread between attempts.
+
+        Returns:
+            bool: indicating new media was downloaded
+        """
+        sync = self._new_item_sync(item, encoding)
+        if sync is None:
+            return False
+        while True:
+            result = self._sync_attempt(sync)
+            if result is not None:
+                return result
+            if sync.delay is not None:
+                time.sleep(sync.delay)
+
+    def _sync_attempt(self, sync):
+        """
+        Makes one attempt to sync an item, starting from the stage the last attempt
+        failed in.
+
+        Returns:
+            bool: indicating new media was downloaded, or None if the item is to be
+            retried after sync.delay
+        """
+        item, media_format, local_path = sync.item, sync.media_format, sync.local_path
+        try:
+            if sync.stage == sync.STAGE_RESOLVE:
+                sync.initial_download_url, sync.size = self.bandcamp.get_download_file(
+                    item, encoding=media_format
+                )
+                sync.stage = sync.STAGE_STAT
+            if sync.stage == sync.STAGE_STAT:
+                sync.download_file_url = self.bandcamp.check_download_stat(
+                    item, sync.initial_download_url
+                )
+                sync.stage = sync.STAGE_TRANSFER
+            download_file_url = sync.download_file_url
+            partial = self.download_journal.partial(item.item_id, media_format)
+            with self._reserve_space(item, sync.size, partial):
+                staged_dir = self._new_staged_dir(item)
+                if staged_dir is None:
+                    return self._retry_immediately(sync)
+                extractor = self._new_extractor(staged_dir)
+                hasher = self._new_hasher(item)
+                sniffer = ContentSniffer.for_encoding(media_format)
                 try:
-                    initial_download_url = self.bandcamp.get_download_file_url(
-                        item, encoding=media_format
-                    )
-                    download_file_url = self.bandcamp.check_download_stat(
-                        item, initial_download_url
+                    started = time.monotonic()
+                    with partial.open() as temp_file:
+                        log.info(
+                            f'Downloading item "{item.band_name} / {item.item_title}" (id:{item.item_id}) '
+                            f"from {mask_sig(download_file_url)} to {temp_file.name}"
+                        )
+                        download_content_type = self._download_file(
+                            download_file_url,
+                            temp_file,
+                            partial,
+                            self._observers(extractor, hasher),
+                            sniffer,
+                        )
+                    ITEM_DOWNLOAD_SECONDS.observe(time.monotonic() - started)
+                    started = time.monotonic()
+                    installed = self._install_download(
+                        item,
+                        partial.path,
+                        download_content_type,
+                        local_path,
+                        staged_dir,
+                        media_format,
+                        extractor,
+                        sniffer.kind,
+                        hasher,
                     )
+                    ITEM_INSTALL_SECONDS.observe(time.monotonic() - started)
+                finally:
+                    if extractor is not None:
+                        extractor.abort()
+                    self.staging.discard(staged_dir)
+                if installed is None:
+                    return self._retry_immediately(sync)
+                partial.remove()
+                return installed
+        except SYNC_ERRORS as e:
+            if not self._handle_sync_error(sync, e):
+                return False
+            sync.attempt += 1
+            return None
 
-                    with NamedTemporaryFile(
-                        mode="w+b", delete=True, dir=self.temp_dir_root
-                    ) as temp_file:
+    def _reserve_space(self, item, size, partial):
+        """
+        Waits until there is free space to download and install an item of "size"
+        bytes, or the length recorded by an earlier attempt if the size is not
+        known, and returns the SpaceReservation. Zip files are extracted next to the
+        download so need about twice their size. Raises DiskSpaceUnavailable if the
+        item can never fit.
+        """
+        size = size or partial.length
+        if not size:
+            return self.disk_space.reserve({})
+        needs = {self.download_journal.dir_path: max(0, size - partial.bytes_written)}
+        if item.item_type != "track":
+            needs[self.staging.dir_path] = size
+        return self.disk_space.reserve(
+            needs, name=f'"{item.band_name} / {item.item_title}"'
+        )
+
+    def _new_staged_dir(self, item):
+        """
+        Returns a new staging directory for an item, or None if it could not be
+        created.
+        """
+        try:
+            return self.staging.new_item_dir(item)
+        except OSError as e:
+            log.error(
+                f"Failed to create staging directory in {self.staging.dir_path}: {e}"
+            )
+            return None
+
+    def _new_extractor(self, staged_dir):
+        """
+        Returns a StreamingZipExtractor to extract a download into staged_dir while
+        it downloads, or None if zip files are extracted after downloading.
+        """
+        if not self.extract_while_downloading:
+            return None
+        return StreamingZipExtractor(
+            staged_dir,
+            member_path=lambda name: self.local_media.get_path_for_file(
+                staged_dir, name
+            ),
+        )
+
+    @staticmethod
+    def _new_hasher(item):
+        """
+        Returns a StreamHasher for a download that is installed as it is, which is
+        a single track. Albums are zip files and their extracted files are hashed
+        as they are extracted instead.
+        """
+        if item.item_type == "track":
+            return StreamHasher()
+        return None
+
+    @staticmethod
+    def _observers(*observers):
+        observers = [o for o in observers if o is not None]
+        return observers or None
+
+    def _download_file(self, url, target, partial, observers=None, sniffer=None):
+        if self.download_segments > 1:
+            return download_file_segmented(
+                url,
+                target,
+                segments=self.download_segments,
+                min_size=self.segment_min_size,
+                segment_retries=self.max_retries,
+                rate_limiter=self.rate_limiter,
+                session_pool=self.session_pool,
+                partial=partial,
+                threaded=self.threaded_writer,
+                buffer_pool=self.buffer_pool,
+                stats=self.transfer_stats,
+                observers=observers,
+                sniffer=sniffer,
+            )
+        return download_file(
+            url,
+            target,
+            rate_limiter=self.rate_limiter,
+            session_pool=self.session_pool,
+            partial=partial,
+            threaded=self.threaded_writer,
+            buffer_pool=self.buffer_pool,
+            stats=self.transfer_stats,
+            observers=observers,
+            sniffer=sniffer,
+        )
+
+    async def async_sync_item(self, item, encoding=None) -> bool:
+        """Syncs a single item (purchase) with the async engine, waiting on the
+        event loop between attempts.
+
+        Returns:
+            bool: indicating new media was downloaded
+        """
+        sync = self._new_item_sync(item, encoding)
+        if sync is None:
+            return False
+        while True:
+            result = await self._async_sync_attempt(sync)
+            if result is not None:
+                return result
+            if sync.delay is not None:
+                await asyncio.sleep(sync.delay)
+
+    async def _async_sync_attempt(self, sync):
+        """
+        Makes one attempt to sync an item with the async engine, the same as
+        _sync_attempt(). Requests and downloads run on the event loop, file writes
+        and extraction run in self.executor.
+        """
+        item, media_format, local_path = sync.item, sync.media_format, sync.local_path
+        loop = asyncio.get_running_loop()
+        try:
+            if sync.stage == sync.STAGE_RESOLVE:
+                (
+                    sync.initial_download_url,
+                    sync.size,
+                ) = await self.async_bandcamp.get_download_file(
+                    item, encoding=media_format
+                )
+                sync.stage = sync.STAGE_STAT
+            if sync.stage == sync.STAGE_STAT:
+                sync.download_file_url = await self.async_bandcamp.check_download_stat(
+                    item, sync.initial_download_url
+                )
+                sync.stage = sync.STAGE_TRANSFER
+            download_file_url = sync.download_file_url
+            partial = self.download_journal.partial(item.item_id, media_format)
+            # Waiting for space blocks, so do not hold up the write executor
+            reservation = await loop.run_in_executor(
+                None, self._reserve_space, item, sync.size, partial
+            )
+            with reservation:
+                staged_dir = await loop.run_in_executor(
+                    self.executor, self._new_staged_dir, item
+                )
+                if staged_dir is None:
+                    return self._retry_immediately(sync)
+                extractor = self._new_extractor(staged_dir)
+                hasher = self._new_hasher(item)
+                sniffer = ContentSniffer.for_encoding(media_format)
+                try:
+                    started = time.monotonic()
+                    temp_file = await loop.run_in_executor(self.executor, partial.open)
+                    try:
                         log.info(
                             f'Downloading item "{item.band_name} / {item.item_title}" (id:{item.item_id}) '
                             f"from {mask_sig(download_file_url)} to {temp_file.name}"
                         )
-                        download_content_type = download_file(
-                            download_file_url, temp_file
+                        download_content_type = await download_file_async(
+                            download_file_url,
+                            temp_file,
+                            self.async_bandcamp.session,
+                            rate_limiter=self.rate_limiter,
+                            write_executor=self.executor,
+                            partial=partial,
+                            preallocate_file=self.threaded_writer,
+                            stats=self.transfer_stats,
+                            observers=self._observers(extractor, hasher),
+                            sniffer=sniffer,
                         )
-                        temp_file.seek(0)
-                        temp_file_path = Path(temp_file.name)
-                        if is_zip_file(temp_file_path):
-                            with TemporaryDirectory(dir=self.temp_dir_root) as temp_dir:
-                                log.info(
-                                    f'Decompressing downloaded zip "{temp_file.name}" to "{temp_dir}"'
-                                )
-                                unzip_file(temp_file.name, temp_dir)
-                                temp_path = Path(temp_dir)
-                                try:
-                                    local_path.mkdir(parents=True, exist_ok=True)
-                                except OSError as e:
-                                    self._record_sync_error(
-                                        f"Failed to create directory: {local_path} ({e}), skipping file extraction"
-                                    )
-                                    continue
-                                for file_path in temp_path.iterdir():
-                                    file_dest = self.local_media.get_path_for_file(
-                                        local_path, file_path.name
-                                    )
-                                    log.info(
-                                        f'Moving extracted file: "{file_path}" to "{file_dest}"'
-                                    )
-                                    try:
-                                        move_file(file_path, file_dest)
-                                    except OSError as e:
-                                        self._record_sync_error(
-                                            f"Failed to move {file_path} to {file_dest}: {e}"
-                                        )
-                        elif (
-                            item.item_type == "track"
-                            or download_content_type.startswith("audio/")
-                            # Bandcamp may serve Ogg Vorbis as application/ogg.
-                            or download_content_type == "application/ogg"
-                        ):
-                            slug = item.item_title
-                            if item.url_hints and isinstance(item.url_hints, dict):
-                                slug = item.url_hints.get("slug", item.item_title)
-                            format_extension = self.local_media.clean_format(
-                                media_format
-                            )
-                            try:
-                                local_path.mkdir(parents=True, exist_ok=True)
-                            except OSError as e:
-                                self._record_sync_error(
-                                    f"Failed to create directory: {local_path} ({e}), skipping file write"
-                                )
-                                continue
-                            file_dest = self.local_media.get_path_for_file(
-                                local_path, f"{slug}.{format_extension}"
-                            )
-                            log.info(
-                                f'Copying single track: "{temp_file_path}" to "{file_dest}"'
-                            )
-                            try:
-                                copy_file(temp_file_path, file_dest)
-                            except OSError as e:
-                                self._record_sync_error(
-                                    f"Failed to copy {temp_file_path} to {file_dest}: {e}"
-                                )
-                        else:
-                            self._record_sync_error(
-                                f'Downloaded file for "{item.band_name} / {item.item_title}" (id:{item.item_id}) '
-                                f'at "{temp_file_path}" is not a zip archive or a single track, skipping'
-                            )
-                            return False
+                    finally:
+                        await loop.run_in_executor(self.executor, temp_file.close)
+                    ITEM_DOWNLOAD_SECONDS.observe(time.monotonic() - started)
+                    started = time.monotonic()
+                    installed = await loop.run_in_executor(
+                        self.executor,
+                        self._install_download,
+                        item,
+                        partial.path,
+                        download_content_type,
+                        local_path,
+                        staged_dir,
+                        media_format,
+                        extractor,
+                        sniffer.kind,
+                        hasher,
+                    )
+                    ITEM_INSTALL_SECONDS.observe(time.monotonic() - started)
+                finally:
+                    if extractor is not None:
+                        await loop.run_in_executor(self.executor, extractor.abort)
+                    await loop.run_in_executor(
+                        self.executor, self.staging.discard, staged_dir
+                    )
+                if installed is None:
+                    return self._retry_immediately(sync)
+                await loop.run_in_executor(self.executor, partial.remove)
+                return installed
+        except SYNC_ERRORS as e:
+            if not self._handle_sync_error(sync, e):
+                return False
+            sync.attempt += 1
+            return None
+
+    async def _sync_streamed_purchases(self):
+        """
+        Syncs purchases as they are loaded from the collection so downloads start
+        while later pages are still being fetched. Pagination runs in a thread and
+        feeds a queue of items synced in up to self.concurrency slots. Items are synced in
+        collection order rather than sorted by purchase date, followed by any
+        unresolved purchases from the collection snapshot.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        synced = 0
 
-                        if self.ign_file_path:
-                            # We assume that if you use an "ignore" file once, you'll
-                            # keep using it forever (e.g. Docker).
-                            # If you don't, you'll get a warning for the missing ID file
-                            # on the items downloaded in the current session.
-                            self.ignores.add(item)
-                        else:
-                            try:
-                                self.local_media.write_bandcamp_id(item, local_path)
-                            except (OSError, ValueError) as e:
-                                self._record_sync_error(
-                                    f'Failed to write bandcamp item id for "{item.band_name} / {item.item_title}" '
-                                    f'(id:{item.item_id}) to "{local_path}": {e}'
-                                )
-
-                        self.new_items_downloaded = True
-                        return True
-
-                except BandcampDownloadUnavailable as e:
-                    log.info(
-                        f'No download available for "{item.band_name} / {item.item_title}" '
-                        f"(id:{item.item_id}): {e}. Skipping."
+        def load_purchases():
+            try:
+                for item in self.bandcamp.iter_purchases(
+                    stop_when=self.should_stop_loading_purchase
+                ):
+                    QUEUE_DEPTH.inc()
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                for item in self._snapshot_purchases(self.bandcamp.purchases):
+                    QUEUE_DEPTH.inc()
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        async def consume():
+            nonlocal synced
+            tasks = []
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                # Pagination stops at the checkpoint and --until-date, but
+                # purchases from the snapshot can be older than --until-date
+                if self._is_before_until_date(item):
+                    self.collection_snapshot.set_status(
+                        item, CollectionSnapshot.STATUS_FILTERED
                     )
-                    return False
-                except (
-                    BandcampError,
-                    DownloadBadStatusCode,
-                    DownloadInvalidContentType,
-                ) as e:
-                    if attempt < self.max_retries - 1:
-                        log.warning(
-                            f"Attempt {attempt + 1} failed for {item.band_name} / {item.item_title}: {e}. "
-                            f"Retrying in {self.retry_wait} seconds..."
+                    QUEUE_DEPTH.dec()
+                    continue
+                synced += 1
+                log.info(
+                    f"Queued item {synced} to sync ({len(self.bandcamp.purchases)} "
+                    f"purchases loaded so far)"
+                )
+                # Each item waits for a free slot, so an item waiting to retry
+                # does not hold up the items after it
+                tasks.append(
+                    asyncio.create_task(self.sync_item_in_engine(item, queued=True))
+                )
+            await asyncio.gather(*tasks)
+
+        log.info(f"Syncing purchases as they load with concurrency {self.concurrency}")
+        producer = loop.run_in_executor(None, load_purchases)
+        await asyncio.gather(producer, consume())
+        self._move_suffixed_items()
+        if not synced:
+            log.info("No purchases to sync after applying filters")
+
+    def _move_suffixed_items(self):
+        """
+        Moves items that were published before a later purchase with the same
+        artist and title was loaded, which gave them a folder suffix, to the
+        directory with the suffix.
+        """
+        for item in self.bandcamp.purchases:
+            published_path = self.published_paths.get(item.item_id)
+            if published_path is None:
+                continue
+            local_path = self.local_media.get_path_for_purchase(item)
+            if local_path == published_path:
+                continue
+            log.info(
+                f'Moving "{item.band_name} / {item.item_title}" (id:{item.item_id}) '
+                f'from "{published_path}" to "{local_path}" as another purchase '
+                f"shares its artist and title"
+            )
+            try:
+                self.staging.publish(published_path, local_path)
+            except OSError as e:
+                self._record_sync_error(
+                    f'Failed to move "{item.band_name} / {item.item_title}" '
+                    f"(id:{item.item_id}) from {published_path} to {local_path}: {e}"
+                )
+                continue
+            self.published_paths[item.item_id] = local_path
+
+    async def _sync_selected_purchases(self):
+        """Syncs the loaded purchases that pass the checkpoint and date filters."""
+        items = self.select_items_to_sync()
+        if self.schedule == "largest":
+            items = await self._schedule_largest_first(items)
+        total_items = len(items)
+        if not items:
+            log.info("No purchases to sync after applying filters")
+        else:
+            # self.slots limits the concurrency, with a single slot the next item
+            # is synced while an item waits to retry
+            tasks = [
+                self.sync_item_in_engine(item, queued=True, progress=(i, total_items))
+                for i, item in enumerate(items, 1)
+            ]
+            QUEUE_DEPTH.set(total_items)
+            log.info(f"Syncing {total_items} items with concurrency {self.concurrency}")
+
+            # Wait for all tasks to complete
+            await asyncio.gather(*tasks)
+
+    def _is_skipped(self, item):
+        """
+        Returns whether an item is skipped because it is hidden or ignored, the same
+        checks as _should_download_item() without logging or recording anything.
+        """
+        if self.skip_hidden and item.hidden:
+            return True
+        if item.item_id in self.damaged_item_ids:
+            return False
+        return self.ignores.is_ignored(item)
+
+    def _is_pending(self, item):
+        """
+        Returns whether an item will be downloaded, the same checks as
+        _should_download_item() without logging or recording anything.
+        """
+        if item.is_preorder or self._is_skipped(item):
+            return False
+        if item.item_id in self.damaged_item_ids:
+            return True
+        local_path = self.local_media.get_path_for_purchase(item)
+        return not self.local_media.is_locally_downloaded(item, local_path)
+
+    async def _get_download_sizes(self, items):
+        """
+        Returns the size of each item's download from its download page, or None
+        if it is not known. The download pages are cached so they are not fetched
+        again when the items are synced.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def get_size(item):
+            async with semaphore:
+                try:
+                    if self.engine == "async":
+                        return await self.async_bandcamp.get_download_file_size(
+                            item, encoding=self.media_format
                         )
-                        time.sleep(self.retry_wait)
-                        continue
-                    else:
-                        self._record_sync_error(
-                            f"All {self.max_retries} attempts failed for {item.band_name} / {item.item_title}: {e}. Skipping."
+                    return await loop.run_in_executor(
+                        self.executor,
+                        self.bandcamp.get_download_file_size,
+                        item,
+                        self.media_format,
+                    )
+                except BandcampError as e:
+                    # Errors are handled when the item is synced
+                    log.debug(f"No download size for item id:{item.item_id}: {e}")
+                    return None
+
+        return await asyncio.gather(*[get_size(item) for item in items])
+
+    async def _schedule_largest_first(self, items):
+        """
+        Orders the items to download largest first so a large item is not left to
+        download on its own at the end of the sync while the other download slots
+        are idle. Items that will not be downloaded are kept first as they are
+        skipped straight away.
+        """
+        if self.concurrency < 2 or self.dry_run:
+            return items
+        if not self.download_cache.enabled:
+            log.info(
+                "The download page cache is disabled, syncing newest first rather "
+                "than fetching every download page twice"
+            )
+            return items
+        skipped, pending = [], []
+        for item in items:
+            (pending if self._is_pending(item) else skipped).append(item)
+        if len(pending) < 2:
+            return items
+        log.info(f"Fetching the download size of {len(pending)} items to schedule")
+        sizes = await self._get_download_sizes(pending)
+        newest_first = list(zip(pending, sizes))
+        scheduled = largest_first(newest_first)
+        before = estimate_makespan(sizes, self.concurrency)
+        after = estimate_makespan([size for _, size in scheduled], self.concurrency)
+        log.info(
+            f"Scheduled {len(scheduled)} items largest first over {self.concurrency} "
+            f"downloads, the busiest downloads {after / MB:.1f} MB rather than "
+            f"{before / MB:.1f} MB newest first"
+        )
+        for position, (item, size) in enumerate(scheduled, 1):
+            size_text = f"{size / MB:.1f} MB" if size else "unknown size"
+            log.info(
+                f'  {position}. "{item.band_name} / {item.item_title}" '
+                f"(id:{item.item_id}): {size_text}"
+            )
+        return skipped + [item for item, _ in scheduled]
+
+    async def sync_item_in_engine(self, item, queued=False, progress=None):
+        """
+        Syncs an item in one of self.slots. An attempt that fails and will be
+        retried gives up its slot to another item while it waits, then takes the
+        next free slot ahead of the items that have not started. Set "queued" if
+        the item is counted in QUEUE_DEPTH until it starts, and "progress" to the
+        (position, total) of the item to log when it starts.
+        """
+        loop = asyncio.get_running_loop()
+        sync = None
+        priority = DownloadSlots.PRIORITY_NEW
+        while True:
+            await self.slots.acquire(priority)
+            try:
+                if queued:
+                    QUEUE_DEPTH.dec()
+                    queued = False
+                if progress is not None:
+                    position, total = progress
+                    percent = (position / total) * 100 if total else 0
+                    log.info(f"Syncing item {position} of {total} ({percent:.1f}%)")
+                    progress = None
+                if self.engine == "async":
+                    if sync is None:
+                        sync = self._new_item_sync(item)
+                        if sync is None:
+                            return False
+                    result = await self._async_sync_attempt(sync)
+                else:
+                    # Run in the executor since it's blocking I/O
+                    if sync is None:
+                        sync = await loop.run_in_executor(
+                            self.executor, self._new_item_sync, item
                         )
-                        return False
-                except DownloadExpired:
-                    self._record_sync_error(
-                        f'Download expired and requires email confirmation on Bandcamp for "{item.band_name} / {item.item_title}" '
-                        f"(id:{item.item_id}), skipping"
+                        if sync is None:
+                            return False
+                    result = await loop.run_in_executor(
+                        self.executor, self._sync_attempt, sync
                     )
-                    return False
-        return False
+            finally:
+                self.slots.release()
+            if result is not None:
+                return result
+            if sync.delay is not None:
+                await asyncio.sleep(sync.delay)
+            priority = DownloadSlots.PRIORITY_RETRY
+
+    def _executor_workers(self):
+        if self.engine == "async":
+            # Only file writes and extraction run in threads with the async engine
+            return min(self.concurrency, (os.cpu_count() or 1) + 4)
+        # One thread per concurrent download, the default executor is capped at
+        # min(32, cpu_count + 4) threads which would silently limit concurrency
+        return self.concurrency
 
     async def sync_items(self):
         """Syncs all items with optional concurrency."""
-        items = self._select_items_to_sync()
-        total_items = len(items)
-        if not items:
-            log.info("No purchases to sync after applying filters")
-        else:
-            if self.concurrency == 1:
-                # Sequential processing
-                for i, item in enumerate(items, 1):
-                    percent = (i / total_items) * 100 if total_items else 0
-                    log.info(f"Syncing item {i} of {total_items} ({percent:.1f}%)")
-                    self.sync_item(item)
+        self.start_sync()
+        try:
+            if self.stream_purchases:
+                await self._sync_streamed_purchases()
             else:
-                # Concurrent processing with semaphore to limit concurrency
-                semaphore = asyncio.Semaphore(self.concurrency)
-
-                async def sync_with_semaphore(_item):
-                    async with semaphore:
-                        # Run sync_item in executor since it's blocking I/O
-                        loop = asyncio.get_event_loop()
-                        await loop.run_in_executor(None, self.sync_item, _item)
+                await self._sync_selected_purchases()
+        finally:
+            await self.stop_sync()
+        self.finish_sync()
+        self.record_run_metrics()
 
-                # Create tasks for all items
-                tasks = [sync_with_semaphore(item) for item in items]
-                log.info(
-                    f"Syncing {total_items} items with concurrency {self.concurrency}"
-                )
+    def start_sync(self):
+        """Creates the executor and, for the async engine, the HTTP session."""
+        self.executor = ThreadPoolExecutor(
+            max_workers=self._executor_workers(), thread_name_prefix="bandcampsync"
+        )
+        self.slots = DownloadSlots(self.concurrency)
+        if self.engine == "async":
+            async_session = new_async_session(max_clients=self.concurrency)
+            self.async_bandcamp = AsyncBandcamp(self.bandcamp, async_session)
+            log.info(f"Using the async engine with concurrency {self.concurrency}")
 
-                # Wait for all tasks to complete
-                await asyncio.gather(*tasks)
+    async def stop_sync(self):
+        """Closes the HTTP session of the async engine and shuts the executor down."""
+        if self.async_bandcamp is not None:
+            await self.async_bandcamp.session.close()
+            self.async_bandcamp = None
+        self.executor.shutdown(wait=True)
+        self.executor = None
 
+    def finish_sync(self):
+        """Logs the outcome of the sync and saves the state for the next run."""
         # We don't need to show this warning if we're running the ignorefile sync script
         if self.show_id_file_warning and not self.sync_ignore_file:
             log.warning(
@@ -499,6 +1633,31 @@ class Syncer:
 
         self._log_sync_error_summary()
         self._save_collection_checkpoint()
+        self._save_collection_snapshot()
+        if not self.dry_run:
+            self.download_cache.save()
+        self.transfer_stats.log_stats()
+        if self.owns_zip_extractor:
+            self.zip_extractor.log_stats()
+            self.zip_extractor.close()
+        self.session_pool.log_stats()
+        self.session_pool.close()
+
+    def record_run_metrics(self, had_sync_errors=None):
+        """Records the outcome of the run and writes the metrics file if one is set."""
+        if had_sync_errors is None:
+            had_sync_errors = self.had_sync_errors
+        RUNS.inc(result="errors" if had_sync_errors else "success")
+        RUN_SECONDS.set(time.monotonic() - self.started)
+        RUN_TIMESTAMP.set(time.time())
+        QUEUE_DEPTH.set(0)
+        if not self.metrics_file:
+            return
+        try:
+            REGISTRY.write_textfile(self.metrics_file)
+            log.info(f'Wrote metrics to "{self.metrics_file}"')
+        except OSError as e:
+            log.error(f'Failed to write metrics file "{self.metrics_file}": {e}')
 
     def notify(self):
         if self.dry_run:
@@ -507,3 +1666,139 @@ class Syncer:
         if self.new_items_downloaded and self.notify_url is not None:
             notify = NotifyURL(self.notify_url)
             notify.notify()
+
+
+class MultiFormatSyncer:
+    """
+    Syncs the collection in several formats in one pass, the first format to
+    options.dir_path and the others to the directories in options.format_dirs.
+    Every format has its own Syncer so the local media index, checkpoint and
+    collection snapshot are kept per directory, while the collection is loaded once
+    and each item's download page is fetched once and shared through the download
+    page cache. The formats an item is needed in are downloaded concurrently, each
+    format limited by its own download slots. Each format's Syncer is driven through
+    its public start_sync(), sync_item_in_engine(), stop_sync() and finish_sync()
+    methods, the same steps as Syncer.sync_items().
+    """
+
+    def __init__(self, options: BandcampSyncOptions, auto_run: bool = True):
+        if options.stream_purchases:
+            log.info("Purchases are not streamed when syncing several formats")
+        if options.schedule != "newest":
+            log.info("Items are synced newest first when syncing several formats")
+        formats = {options.media_format: options.dir_path, **options.format_dirs}
+        # One extraction pool for every format so extract_workers is the budget
+        # for the whole sync
+        self.zip_extractor = ParallelZipExtractor(workers=options.extract_workers)
+        self.syncers = []
+        for media_format, dir_path in formats.items():
+            format_options = replace(
+                options,
+                media_format=media_format,
+                dir_path=dir_path,
+                format_dirs={},
+                stream_purchases=False,
+                schedule="newest",
+            )
+            if self.syncers:
+                # The ignore file records the items downloaded to the first
+                # directory, the other directories are indexed by their ID files
+                format_options = replace(
+                    format_options,
+                    ign_file_path=None,
+                    skip_item_index=False,
+                    sync_ignore_file=False,
+                    metrics_file=None,
+                )
+            log.info(f'Syncing format "{media_format}" to: {dir_path}')
+            self.syncers.append(
+                Syncer(
+                    format_options,
+                    auto_run=False,
+                    primary=self.syncers[0] if self.syncers else None,
+                    load_collection=False,
+                    zip_extractor=self.zip_extractor,
+                )
+            )
+        self.primary = self.syncers[0]
+        if not self.primary.download_cache.enabled:
+            log.warning(
+                "The download page cache is disabled, download pages will be "
+                "fetched once for every format"
+            )
+        # Loading stops once every format has reached its snapshot or checkpoint
+        self.stopped = set()
+        bandcamp = self.primary.bandcamp
+        bandcamp.pipeline = not all(s.use_collection_snapshot for s in self.syncers)
+        bandcamp.load_purchases(stop_when=self.should_stop_loading_purchase)
+
+        if auto_run:
+            asyncio.run(self.sync_items())
+            self.notify()
+
+    @property
+    def had_sync_errors(self):
+        return any(syncer.had_sync_errors for syncer in self.syncers)
+
+    @property
+    def new_items_downloaded(self):
+        return any(syncer.new_items_downloaded for syncer in self.syncers)
+
+    def should_stop_loading_purchase(self, item):
+        for i, syncer in enumerate(self.syncers):
+            if i not in self.stopped and syncer.should_stop_loading_purchase(item):
+                self.stopped.add(i)
+        return len(self.stopped) == len(self.syncers)
+
+    def select_items_to_sync(self):
+        """
+        Returns the items to sync in order, each as a list of (syncer, item) pairs
+        for the formats that passed the checkpoint and date filters.
+        """
+        targets = {}
+        for syncer in self.syncers:
+            for item in syncer.select_items_to_sync():
+                targets.setdefault(item.item_id, []).append((syncer, item))
+        return list(targets.values())
+
+    async def sync_items(self):
+        """Syncs every item in all of the formats it is needed in."""
+        for syncer in self.syncers:
+            syncer.start_sync()
+        try:
+            items = self.select_items_to_sync()
+            if not items:
+                log.info("No purchases to sync after applying filters")
+            else:
+                log.info(
+                    f"Syncing {len(items)} items in {len(self.syncers)} formats "
+                    f"with concurrency {self.primary.concurrency}"
+                )
+            # Each format waits for one of its own slots, so an item waiting to
+            # retry in one format holds up nothing else. The formats of an item
+            # that start at the same time share one fetch of its download page
+            # Progress is logged when the first format of an item starts
+            tasks = [
+                syncer.sync_item_in_engine(
+                    item,
+                    queued=True,
+                    progress=(i, len(items)) if target == 0 else None,
+                )
+                for i, targets in enumerate(items, 1)
+                for target, (syncer, item) in enumerate(targets)
+            ]
+            QUEUE_DEPTH.set(len(tasks))
+            await asyncio.gather(*tasks)
+        finally:
+            for syncer in self.syncers:
+                await syncer.stop_sync()
+        for syncer in self.syncers:
+            syncer.finish_sync()
+        self.zip_extractor.log_stats()
+        self.zip_extractor.close()
+        self.primary.record_run_metrics(had_sync_errors=self.had_sync_errors)
+
+    def notify(self):
+        # A single notification for new items in any format
+        self.primary.new_items_downloaded = self.new_items_downloaded
+        self.primary.notify()
@@ -0,0 +1,241 @@
+import io
+import os
+import threading
+from collections import deque
+from queue import Queue
+from time import monotonic
+from .logger import get_logger
+
+
+log = get_logger("writer")
+
+
+MB = 1024 * 1024
+
+
+def preallocate(target, offset, length):
+    """
+    Reserves disk space for a download of "length" bytes that is written from
+    "offset" with posix_fallocate(), so large downloads are not fragmented on disk.
+    Returns True if the space was reserved.
+    """
+    if length <= offset or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        fd = target.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+    try:
+        os.posix_fallocate(fd, offset, length - offset)
+    except OSError as e:
+        log.debug(f"Failed to preallocate {length - offset} bytes: {e}")
+        return False
+    return True
+
+
+class BufferPool:
+    """
+    A pool of reusable write buffers. Buffers are allocated as they are needed up to
+    "max_buffers", after which acquire() blocks until a buffer is released, which
+    bounds the memory used by all downloads sharing the pool.
+    """
+
+    def __init__(self, buffer_size=MB, max_buffers=4):
+        self.buffer_size = max(1, int(buffer_size))
+        self.max_buffers = max(1, int(max_buffers))
+        self.free = deque()
+        self.allocated = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.free and self.allocated >= self.max_buffers:
+                self.condition.wait()
+            if self.free:
+                return self.free.pop()
+            self.allocated += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer):
+        if len(buffer) != self.buffer_size:
+            return
+        with self.condition:
+            self.free.append(buffer)
+            self.condition.notify()
+
+
+class TransferStats:
+    """
+    Counts the bytes and time spent in each stage of downloads, receiving from the
+    network and writing to disk, so slow downloads can be attributed to one or the
+    other. Time spent waiting for the disk to keep up or for the bandwidth limit is
+    not counted as network time. Can be shared between downloads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.network_bytes = 0
+        self.network_seconds = 0.0
+        self.disk_bytes = 0
+        self.disk_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.throttle_seconds = 0.0
+
+    def add(self, other):
+        with self.lock:
+            self.downloads += other.downloads
+            self.network_bytes += other.network_bytes
+            self.network_seconds += other.network_seconds
+            self.disk_bytes += other.disk_bytes
+            self.disk_seconds += other.disk_seconds
+            self.wait_seconds += other.wait_seconds
+            self.throttle_seconds += other.throttle_seconds
+
+    def add_disk(self, size, seconds):
+        with self.lock:
+            self.disk_bytes += size
+            self.disk_seconds += seconds
+
+    @staticmethod
+    def _rate(size, seconds):
+        if seconds <= 0:
+            return "-"
+        return f"{size / MB / seconds:.1f} MB/s"
+
+    @property
+    def network_rate(self):
+        return self._rate(self.network_bytes, self.network_seconds)
+
+    @property
+    def disk_rate(self):
+        return self._rate(self.disk_bytes, self.disk_seconds)
+
+    def summary(self):
+        summary = (
+            f"{self.network_bytes / MB:.1f} MB: network {self.network_rate}, "
+            f"disk {self.disk_rate}, {self.wait_seconds:.1f}s waiting for disk"
+        )
+        if self.throttle_seconds:
+            summary += f", {self.throttle_seconds:.1f}s bandwidth limited"
+        return summary
+
+    def log_stats(self):
+        if not self.downloads:
+            return
+        log.info(f"Downloaded {self.downloads} files, {self.summary()}")
+
+
+class FileWriter:
+    """
+    Writes blocks of a download to the target file handle in the calling thread.
+    Each block is also passed to the feed() method of any "observers" once it has
+    been written, observers must copy the data they want to keep.
+    """
+
+    def __init__(
+        self, target, pool, text=False, partial=None, stats=None, observers=()
+    ):
+        self.target = target
+        self.pool = pool
+        self.text = text
+        self.partial = partial
+        self.stats = stats or TransferStats()
+        self.observers = observers or ()
+        self.written = 0
+
+    def _write(self, buffer, size):
+        view = memoryview(buffer)[:size]
+        data = bytes(view).decode() if self.text else view
+        started = monotonic()
+        self.target.write(data)
+        if self.partial:
+            self.partial.written(size, self.target)
+        self.stats.add_disk(size, monotonic() - started)
+        self.written += size
+        for observer in self.observers:
+            observer.feed(view)
+
+    def submit(self, buffer, size):
+        """Writes "size" bytes of a pooled buffer then releases the buffer."""
+        try:
+            self._write(buffer, size)
+        finally:
+            self.pool.release(buffer)
+
+    def drain(self):
+        """Waits until every submitted block has been written."""
+        pass
+
+    def close(self):
+        self.drain()
+
+
+class ThreadedFileWriter(FileWriter):
+    """
+    Writes blocks of a download to the target file handle in a separate thread, so
+    the network is not blocked while the disk catches up. At most "depth" blocks
+    are queued, after which submit() waits for the writer. An error raised while
+    writing is raised again by the next submit(), drain() or close().
+    """
+
+    def __init__(
+        self,
+        target,
+        pool,
+        text=False,
+        partial=None,
+        stats=None,
+        observers=(),
+        depth=3,
+    ):
+        super().__init__(
+            target,
+            pool,
+            text=text,
+            partial=partial,
+            stats=stats,
+            observers=observers,
+        )
+        self.queue = Queue(maxsize=max(1, int(depth)))
+        self.error = None
+        self.thread = threading.Thread(
+            target=self._run, name="bandcampsync-writer", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            block = self.queue.get()
+            try:
+                if block is None:
+                    return
+                buffer, size = block
+                try:
+                    if self.error is None:
+                        self._write(buffer, size)
+                except Exception as e:
+                    self.error = e
+                finally:
+                    self.pool.release(buffer)
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, buffer, size):
+        self._raise_error()
+        self.queue.put((buffer, size))
+
+    def drain(self):
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Measures the memory used to hold a synthetic collection of BandcampItem objects,
+compared to keeping the raw collection API payload for every item as BandcampItem
+did previously. Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/bench_item_memory.py [collection_size]
+"""
+
+import copy
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+from bandcampsync.bandcamp import BandcampItem
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "tests" / "data"
+
+
+def synthetic_payloads(count):
+    with open(DATA_DIR / "collection-item-digital-only.json", "rt") as f:
+        template = json.load(f)["items"][0]
+    for i in range(count):
+        payload = copy.deepcopy(template)
+        payload["item_id"] = i
+        payload["sale_item_id"] = i
+        payload["band_name"] = f"Band {i}"
+        payload["item_title"] = f"Album {i}"
+        payload["token"] = f"{1594085699 - i}:{i}:a::"
+        yield payload
+
+
+def measure(count, keep_raw):
+    gc.collect()
+    tracemalloc.start()
+    items = [
+        BandcampItem(payload, keep_raw=keep_raw)
+        for payload in synthetic_payloads(count)
+    ]
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return current, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f"Synthetic collection of {count} items")
+    for label, keep_raw in (("raw payload kept", True), ("compact", False)):
+        current, peak = measure(count, keep_raw)
+        print(
+            f"  {label:<18} {current / 1024 / 1024:8.1f} MiB retained "
+            f"({current / count:7.0f} bytes/item), {peak / 1024 / 1024:8.1f} MiB peak"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Compares the targeted pagedata extractor against the BeautifulSoup parser using the
+saved download pages in tests/data. Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/bench_pagedata.py [iterations]
+"""
+
+import sys
+from pathlib import Path
+from timeit import timeit
+from bs4 import BeautifulSoup
+from bandcampsync.bandcamp import Bandcamp
+from bandcampsync.download import _is_expired_download_page
+from bandcampsync.pagedata import extract_data_blob, orjson
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "tests" / "data"
+PAGES = ("download-choose-format.html", "download-expired.html")
+
+
+def soup_pagedata(html):
+    soup = BeautifulSoup(html, "html.parser")
+    return Bandcamp._extract_pagedata_from_soup(soup)
+
+
+def soup_is_expired(html):
+    soup = BeautifulSoup(html, "html.parser")
+    reauth_error = soup.select_one("div.email-reauth-error")
+    style = str(reauth_error.get("style")) or ""
+    return "display:none" not in style.replace(" ", "").lower()
+
+
+def bench(name, func, html, iterations):
+    elapsed = timeit(lambda: func(html), number=iterations)
+    per_call_ms = (elapsed / iterations) * 1000
+    print(f"  {name:<24} {per_call_ms:9.3f} ms/page")
+    return per_call_ms
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    json_decoder = "orjson" if orjson is not None else "json"
+    print(f"{iterations} iterations per benchmark, JSON decoder: {json_decoder}")
+    for page in PAGES:
+        html = (DATA_DIR / page).read_text(encoding="utf-8", errors="ignore")
+        assert extract_data_blob(html) == soup_pagedata(html)
+        print(f"{page} ({len(html)} bytes)")
+        soup_ms = bench("pagedata (bs4)", soup_pagedata, html, iterations)
+        fast_ms = bench("pagedata (fast)", extract_data_blob, html, iterations)
+        print(f"  {'speedup':<24} {soup_ms / fast_ms:9.1f}x")
+        soup_ms = bench("expired check (bs4)", soup_is_expired, html, iterations)
+        fast_ms = bench(
+            "expired check (fast)", _is_expired_download_page, html, iterations
+        )
+        print(f"  {'speedup':<24} {soup_ms / fast_ms:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
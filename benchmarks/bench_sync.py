@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Runs Syncer end to end against the local mock Bandcamp server in tests/mockserver.py
+and reports items/sec, MB/s and peak RSS for each engine and concurrency. Each run is
+a separate process so peak RSS is measured per run, and the server runs in its own
+process so it does not compete with the sync for the GIL. Run from the repository
+root:
+
+    PYTHONPATH=. python benchmarks/bench_sync.py [-j 1 4 16] [--output results.json]
+
+Results are printed as a table and, with --output, written as JSON so runs from
+different versions can be compared with --compare.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+
+def run_single(args):
+    """Runs one sync in this process and prints the result as JSON."""
+    from bandcampsync import version
+    from bandcampsync.logger import get_logger
+    from bandcampsync.options import BandcampSyncOptions
+    from bandcampsync.sync import Syncer
+    from tests.mockserver import MockBandcampConfig, MockBandcampProcess
+
+    get_logger("sync").setLevel(logging.WARNING)
+    logging.disable(logging.INFO)
+    config = MockBandcampConfig(**json.loads(args.config))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        media_dir = Path(temp_dir) / "media"
+        media_dir.mkdir()
+        options = BandcampSyncOptions(
+            cookies="identity=benchmark",
+            dir_path=media_dir,
+            temp_dir_root=Path(temp_dir),
+            concurrency=args.concurrency,
+            engine=args.engine,
+            max_retries=10,
+            retry_wait=0,
+            download_cache_ttl=0,
+            auth_cache_ttl=0,
+        )
+        with MockBandcampProcess(config) as server, server.patch_bandcamp():
+            started = time.perf_counter()
+            syncer = Syncer(options)
+            elapsed = time.perf_counter() - started
+            stats = server.stats()
+        downloaded = len(list(media_dir.glob("*/*/bandcamp_item_id.txt")))
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss_kb /= 1024
+    megabytes = stats["bytes_sent"] / 1024 / 1024
+    result = {
+        "version": version,
+        "engine": args.engine,
+        "concurrency": args.concurrency,
+        "items": downloaded,
+        "seconds": round(elapsed, 4),
+        "items_per_sec": round(downloaded / elapsed, 3) if elapsed else 0,
+        "mb_per_sec": round(megabytes / elapsed, 3) if elapsed else 0,
+        "megabytes": round(megabytes, 3),
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "server_requests": stats["requests"],
+        "server_errors": stats["errors"],
+        "sync_errors": len(syncer.sync_errors),
+    }
+    print(json.dumps(result))
+
+
+def run_benchmark(args):
+    from tests.mockserver import MockBandcampConfig
+
+    config = MockBandcampConfig(
+        items=args.items,
+        track_ratio=args.track_ratio,
+        file_size=int(args.file_size_mb * 1024 * 1024),
+        latency=args.latency,
+        bandwidth=int(args.bandwidth_mb * 1024 * 1024),
+        error_rate=args.error_rate,
+    )
+    runs = []
+    for engine in args.engine:
+        for concurrency in args.concurrency:
+            for repeat in range(args.repeat):
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        __file__,
+                        "--single",
+                        "--config",
+                        json.dumps(asdict(config)),
+                        "--engine",
+                        engine,
+                        "-j",
+                        str(concurrency),
+                    ],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                result["repeat"] = repeat
+                runs.append(result)
+                print(
+                    f"  {engine:<8} -j {concurrency:<4} {result['items']:>6} items "
+                    f"{result['seconds']:9.2f}s {result['items_per_sec']:9.2f} items/s "
+                    f"{result['mb_per_sec']:9.2f} MB/s "
+                    f"{result['peak_rss_mb']:8.1f} MB peak RSS"
+                )
+    return {
+        "benchmark": "sync",
+        "created_at": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "runs": runs,
+    }
+
+
+def best_runs(results):
+    best = {}
+    for run in results["runs"]:
+        key = (run["engine"], run["concurrency"])
+        if key not in best or run["items_per_sec"] > best[key]["items_per_sec"]:
+            best[key] = run
+    return best
+
+
+def compare(baseline, results):
+    print(f"Compared to {baseline['runs'][0]['version'] if baseline['runs'] else '?'}:")
+    baseline_runs = best_runs(baseline)
+    for key, run in sorted(best_runs(results).items()):
+        previous = baseline_runs.get(key)
+        if not previous or not previous["items_per_sec"]:
+            continue
+        change = (run["items_per_sec"] / previous["items_per_sec"] - 1) * 100
+        print(
+            f"  {key[0]:<8} -j {key[1]:<4} {previous['items_per_sec']:9.2f} -> "
+            f"{run['items_per_sec']:9.2f} items/s ({change:+.1f}%)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--config", default="{}", help=argparse.SUPPRESS)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--track-ratio", type=float, default=0.25)
+    parser.add_argument("--file-size-mb", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument(
+        "--bandwidth-mb", type=float, default=0, help="Per response, 0 is unlimited"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--engine", nargs="+", default=["threads", "async"])
+    parser.add_argument(
+        "-j", "--concurrency", nargs="+", type=int, default=[1, 4, 16, 64]
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a previous results file")
+    args = parser.parse_args()
+
+    if args.single:
+        args.engine = args.engine[0]
+        args.concurrency = args.concurrency[0]
+        return run_single(args)
+
+    print(
+        f"Syncing {args.items} items of {args.file_size_mb} MB with "
+        f"{args.latency * 1000:.0f} ms latency"
+    )
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "wt") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Wrote results to {args.output}")
+    if args.compare:
+        with open(args.compare, "rt") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+"""
+A local stand-in for bandcamp.com used by the end-to-end tests and benchmarks. It
+serves the homepage pagedata, the paginated collection_items API, download pages,
+statdownload JavaScript and zip or single track payloads, with configurable
+collection size, payload size, latency, bandwidth and error rate. Payloads support
+Range requests and can be cut off part way through to test resuming.
+
+    with MockBandcampServer(MockBandcampConfig(items=100)) as server:
+        with server.patch_bandcamp():
+            Syncer(options)
+
+Benchmarks use MockBandcampProcess instead, which runs the server in a separate
+process so it does not compete with the sync for the GIL.
+"""
+
+import argparse
+import io
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zipfile
+import zlib
+from dataclasses import asdict, dataclass
+from html import escape as html_escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+from bandcampsync.bandcamp import Bandcamp
+
+
+ENCODINGS = {
+    "flac": ("FLAC", "audio/flac", "flac"),
+    "mp3-v0": ("MP3 V0", "audio/mpeg", "mp3"),
+    "mp3-320": ("MP3 320", "audio/mpeg", "mp3"),
+    "aac-hi": ("AAC", "audio/mp4", "m4a"),
+    "vorbis": ("Ogg Vorbis", "application/ogg", "ogg"),
+    "alac": ("ALAC", "audio/mp4", "m4a"),
+    "wav": ("WAV", "audio/wav", "wav"),
+    "aiff-lossless": ("AIFF", "audio/aiff", "aiff"),
+}
+
+
+# The magic bytes each kind of track file starts with
+MAGIC = {
+    "flac": b"fLaC",
+    "mp3": b"ID3\x04\x00\x00\x00\x00\x00\x00\xff\xfb",
+    "ogg": b"OggS",
+    "m4a": b"\x00\x00\x00\x20ftypM4A ",
+    "wav": b"RIFF\x00\x00\x00\x00WAVE",
+    "aiff": b"FORM\x00\x00\x00\x00AIFF",
+}
+
+
+@dataclass
+class MockBandcampConfig:
+    # Number of purchases in the collection
+    items: int = 20
+    # Fraction of purchases that are single tracks rather than albums
+    track_ratio: float = 0.0
+    # Size in bytes of each download, albums are split into tracks_per_album files
+    file_size: int = 256 * 1024
+    tracks_per_album: int = 4
+    # Seconds added before every response
+    latency: float = 0.0
+    # Bytes per second for each response body, 0 is unlimited
+    bandwidth: int = 0
+    # Fraction of download page, stat and file requests that fail with error_status
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Fraction of file responses where the connection is closed half way through
+    interrupt_rate: float = 0.0
+    # Whether file requests with a Range header are answered with 206 responses
+    accept_ranges: bool = True
+    # Maximum number of items returned per collection page
+    max_per_page: int = 500
+    fan_id: int = 1
+    seed: int = 0
+
+
+class MockBandcampState:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.errors = 0
+        self.bytes_sent = 0
+        self.payloads = {}
+        self.base_ts = int(time.time()) - 86400
+        self.collection = [self._collection_item(i) for i in range(config.items)]
+
+    def _collection_item(self, index):
+        item_id = 1000 + index
+        is_track = index < round(self.config.items * self.config.track_ratio)
+        purchased = time.gmtime(self.base_ts - index * 3600)
+        return {
+            "band_name": f"Artist {index % 50}",
+            "item_title": f"Title {index}",
+            "item_id": item_id,
+            "fan_id": self.config.fan_id,
+            "item_type": "track" if is_track else "album",
+            "sale_item_type": "t" if is_track else "a",
+            "sale_item_id": item_id,
+            "token": f"{self.base_ts - index}:{item_id}:a::",
+            "purchased": time.strftime("%d %b %Y %H:%M:%S GMT", purchased),
+            "hidden": False,
+            "is_preorder": False,
+            "url_hints": {"slug": f"title-{index}"},
+        }
+
+    def record(self, endpoint, error=False):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if error:
+                self.errors += 1
+
+    def should_fail(self):
+        if self.config.error_rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < self.config.error_rate
+
+    def should_interrupt(self):
+        if self.config.interrupt_rate <= 0:
+            return False
+        with self.lock:
+            return self.random.random() < self.config.interrupt_rate
+
+    def payload(self, is_track, encoding):
+        key = (is_track, encoding)
+        with self.lock:
+            if key in self.payloads:
+                return self.payloads[key]
+        data_random = random.Random(self.config.seed)
+        extension = ENCODINGS.get(encoding, ("", "", "bin"))[2]
+        if is_track:
+            magic = MAGIC.get(extension, b"")
+            payload = magic + data_random.randbytes(
+                max(0, self.config.file_size - len(magic))
+            )
+        else:
+            tracks = max(1, self.config.tracks_per_album)
+            track_size = max(1, self.config.file_size // tracks)
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+                for track in range(1, tracks + 1):
+                    z.writestr(
+                        f"Artist - Title - {track:02d} Track.{extension}",
+                        data_random.randbytes(track_size),
+                    )
+            payload = buffer.getvalue()
+        with self.lock:
+            self.payloads[key] = payload
+        return payload
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+class MockBandcampHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockBandcamp/1.0"
+    # Headers and body are written separately, without TCP_NODELAY each response
+    # would stall on delayed ACKs and dominate the measured latency
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(
+        self,
+        status,
+        body,
+        content_type="text/html; charset=utf-8",
+        headers=None,
+        cut_after=None,
+    ):
+        config = self.state.config
+        if config.latency > 0:
+            time.sleep(config.latency)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if cut_after is not None:
+            # Send part of the body then drop the connection
+            body = body[:cut_after]
+            self.close_connection = True
+        if config.bandwidth > 0:
+            chunk_size = 64 * 1024
+            for offset in range(0, len(body), chunk_size):
+                chunk = body[offset : offset + chunk_size]
+                self.wfile.write(chunk)
+                time.sleep(len(chunk) / config.bandwidth)
+        else:
+            self.wfile.write(body)
+        with self.state.lock:
+            self.state.bytes_sent += len(body)
+
+    def _send_error(self, endpoint):
+        self.state.record(endpoint, error=True)
+        self._send(
+            self.state.config.error_status,
+            "error",
+            content_type="text/plain",
+            headers={"Retry-After": "0"},
+        )
+
+    def _pagedata_div(self, id_name, data):
+        # Bandcamp HTML encodes the JSON blob twice
+        blob = html_escape(html_escape(json.dumps(data), quote=True), quote=True)
+        return (
+            f'<html><body><div id="{id_name}" data-blob="{blob}"></div></body></html>'
+        )
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/__stats":
+            return self._send(
+                200, json.dumps(self.state.stats()), content_type="application/json"
+            )
+        if url.path == "/":
+            self.state.record("index")
+            pagedata = {
+                "pageContext": {
+                    "identity": {
+                        "fanId": self.state.config.fan_id,
+                        "isFanVerified": True,
+                    }
+                }
+            }
+            return self._send(200, self._pagedata_div("HomepageApp", pagedata))
+        if url.path == "/download":
+            if self.state.should_fail():
+                return self._send_error("download_page")
+            self.state.record("download_page")
+            return self._send_download_page(int(query["id"][0]))
+        if url.path in ("/statdownload/album", "/statdownload/track"):
+            if self.state.should_fail():
+                return self._send_error("statdownload")
+            self.state.record("statdownload")
+            return self._send(
+                200,
+                "var _statDL_result = { result: 'ok'};",
+                content_type="application/javascript",
+            )
+        if url.path in ("/download/album", "/download/track"):
+            if self.state.should_fail():
+                return self._send_error("file")
+            self.state.record("file")
+            is_track = url.path == "/download/track"
+            encoding = query.get("enc", ["flac"])[0]
+            if is_track:
+                content_type = ENCODINGS.get(encoding, ("", "audio/flac", ""))[1]
+            else:
+                content_type = "application/zip"
+            return self._send_payload(
+                self.state.payload(is_track, encoding), content_type
+            )
+        self.state.record("not_found")
+        return self._send(404, "not found", content_type="text/plain")
+
+    def _send_payload(self, payload, content_type):
+        etag = f'"{zlib.crc32(payload):08x}"'
+        headers = {"ETag": etag}
+        status = 200
+        body = payload
+        match = None
+        if self.state.config.accept_ranges:
+            headers["Accept-Ranges"] = "bytes"
+            match = re.match(r"^bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (not if_range or if_range == etag):
+            start = int(match.group(1))
+            end = len(payload) - 1
+            if match.group(2):
+                end = min(end, int(match.group(2)))
+            if start >= len(payload) or end < start:
+                self.state.record("file_range_invalid")
+                headers["Content-Range"] = f"bytes */{len(payload)}"
+                return self._send(416, b"", content_type=content_type, headers=headers)
+            self.state.record("file_range")
+            status = 206
+            body = payload[start : end + 1]
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(payload)}"
+        cut_after = None
+        if self.state.should_interrupt():
+            self.state.record("file_interrupted")
+            cut_after = len(body) // 2
+        return self._send(
+            status,
+            body,
+            content_type=content_type,
+            headers=headers,
+            cut_after=cut_after,
+        )
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        body = self.rfile.read(length) if length else b""
+        if url.path != "/api/fancollection/1/collection_items":
+            self.state.record("not_found")
+            return self._send(404, "not found", content_type="text/plain")
+        self.state.record("collection_items")
+        try:
+            request = json.loads(body)
+            older_than = int(str(request["older_than_token"]).split(":")[0])
+            count = max(1, min(int(request["count"]), self.state.config.max_per_page))
+        except (ValueError, KeyError, TypeError):
+            return self._send(
+                200, json.dumps({"error": True}), content_type="application/json"
+            )
+        older = [
+            item
+            for item in self.state.collection
+            if int(item["token"].split(":")[0]) < older_than
+        ]
+        page = older[:count]
+        redownload_urls = {
+            f"{item['sale_item_type']}{item['sale_item_id']}": (
+                f"{self.base_url}/download?from=collection&id={item['item_id']}"
+                f"&sig=mocksig"
+            )
+            for item in page
+        }
+        data = {
+            "items": page,
+            "redownload_urls": redownload_urls,
+            "more_available": len(older) > len(page),
+            "last_token": page[-1]["token"] if page else None,
+        }
+        return self._send(200, json.dumps(data), content_type="application/json")
+
+    def _send_download_page(self, item_id):
+        item = next((i for i in self.state.collection if i["item_id"] == item_id), None)
+        if item is None:
+            return self._send(404, "not found", content_type="text/plain")
+        download_type = item["item_type"]
+        ts = int(time.time())
+        downloads = {
+            encoding: {
+                "description": description,
+                "encoding_name": encoding,
+                "size_mb": f"{self.state.config.file_size / 1024 / 1024:.1f}MB",
+                "url": (
+                    f"{self.base_url}/download/{download_type}?enc={encoding}"
+                    f"&id={item_id}&sig=mocksig&ts={ts}.0"
+                ),
+            }
+            for encoding, (description, _, _) in ENCODINGS.items()
+        }
+        pagedata = {
+            "digital_items": [
+                {
+                    "item_id": item_id,
+                    "title": item["item_title"],
+                    "artist": item["band_name"],
+                    "downloads": downloads,
+                }
+            ]
+        }
+        return self._send(200, self._pagedata_div("pagedata", pagedata))
+
+
+class MockBandcampServer:
+    """
+    Runs the mock Bandcamp server in a background thread. Use patch_bandcamp() to
+    point the Bandcamp client at it, all other URLs are returned by the server itself.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockBandcampConfig()
+        self.state = MockBandcampState(self.config)
+        self.httpd = ThreadingHTTPServer((host, port), MockBandcampHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.thread = None
+
+    @property
+    def netloc(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self):
+        return f"http://{self.netloc}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def patch_bandcamp(self):
+        return patch.multiple(Bandcamp, BASE_PROTO="http", BASE_DOMAIN=self.netloc)
+
+    def stats(self):
+        return self.state.stats()
+
+
+class MockBandcampProcess(MockBandcampServer):
+    """
+    Runs the mock Bandcamp server in a child process. Stats are fetched from the
+    server over HTTP.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockBandcampConfig()
+        self.host = host
+        self.port = port
+        self.process = None
+        self.address = None
+
+    @property
+    def netloc(self):
+        return self.address
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                __file__,
+                "--host",
+                self.host,
+                "--port",
+                str(self.port),
+                "--config",
+                json.dumps(asdict(self.config)),
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.address = self.process.stdout.readline().strip()
+        if not self.address:
+            self.process.kill()
+            raise RuntimeError("Mock Bandcamp server process failed to start")
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process.stdout.close()
+
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/__stats") as response:
+            return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the mock Bandcamp server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--config", default="{}", help="MockBandcampConfig as JSON")
+    args = parser.parse_args()
+    server = MockBandcampServer(
+        MockBandcampConfig(**json.loads(args.config)), host=args.host, port=args.port
+    )
+    print(server.netloc, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from bandcampsync.aio import AsyncBandcamp, download_file_async, new_async_session
+from bandcampsync.bandcamp import Bandcamp, BandcampDownloadUnavailable
+from bandcampsync.cache import DownloadPageCache
+from bandcampsync.download import DownloadBadStatusCode, DownloadExpired
+
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+FILE_BODY = b"PK\x03\x04" + bytes(range(256)) * 4000
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    base_url = ""
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        content_type = "text/html; charset=utf-8"
+        status = 200
+        if self.path.startswith("/download/album"):
+            file_url = f"{self.base_url}/download/file?id=1"
+            blob = (
+                '{"digital_items":[{"item_id":1,"downloads":{"flac":{"url":"'
+                + file_url
+                + '","size_mb":"1MB"}}}]}'
+            ).replace('"', "&quot;")
+            body = f'<html><div id="pagedata" data-blob="{blob}"></div></html>'.encode()
+        elif self.path.startswith("/statdownload/file"):
+            body = b"var _statDL_result = { result: 'ok'};"
+        elif self.path.startswith("/download/file"):
+            content_type = "application/zip"
+            body = FILE_BODY
+        elif self.path == "/expired":
+            body = (DATA_DIR / "download-expired.html").read_bytes()
+        else:
+            status, body = 404, b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    StubHandler.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    StubHandler.paths = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield StubHandler.base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _item(server_url, item_id=1):
+    return Mock(
+        item_id=item_id,
+        band_name="Artist",
+        item_title="Album",
+        download_url=f"{server_url}/download/album?id={item_id}",
+    )
+
+
+def test_async_bandcamp_resolves_and_downloads(server_url, tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json")
+    bandcamp = Bandcamp("identity=test", download_cache=cache)
+
+    async def run():
+        async with new_async_session(max_clients=4) as session:
+            client = AsyncBandcamp(bandcamp, session)
+            item = _item(server_url)
+            url = await client.get_download_file_url(item, encoding="flac")
+            assert url == f"{server_url}/download/file?id=1"
+            # The download page is cached for the blocking client too
+            assert bandcamp.get_download_file_url(item, encoding="flac") == url
+            assert await client.check_download_stat(item, url) == url
+            target = BytesIO()
+            content_type = await download_file_async(url, target, session)
+            return content_type, target.getvalue()
+
+    content_type, data = asyncio.run(run())
+    assert content_type == "application/zip"
+    assert data == FILE_BODY
+    assert StubHandler.paths.count("/download/album?id=1") == 1
+
+
+def test_download_page_is_fetched_once_for_concurrent_callers(server_url, tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json")
+    bandcamp = Bandcamp("identity=test", download_cache=cache)
+
+    async def run():
+        async with new_async_session(max_clients=4) as session:
+            # One client per format, as when syncing several formats
+            clients = [AsyncBandcamp(bandcamp, session) for _ in range(3)]
+            item = _item(server_url)
+            return await asyncio.gather(
+                *[client.get_download_file_url(item) for client in clients]
+            )
+
+    assert len(set(asyncio.run(run()))) == 1
+    assert StubHandler.paths.count("/download/album?id=1") == 1
+    assert bandcamp.download_page_tasks == {}
+
+    # The blocking client shares a fetch between threads the same way
+    cache.invalidate(1)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        urls = list(
+            executor.map(
+                lambda _: bandcamp.get_download_file_url(_item(server_url)), range(3)
+            )
+        )
+    assert len(set(urls)) == 1
+    assert StubHandler.paths.count("/download/album?id=1") == 2
+
+
+def test_async_bandcamp_missing_item(server_url):
+    bandcamp = Bandcamp("identity=test")
+
+    async def run():
+        async with new_async_session() as session:
+            client = AsyncBandcamp(bandcamp, session)
+            await client.get_download_file_url(_item(server_url, item_id=2))
+
+    with pytest.raises(BandcampDownloadUnavailable):
+        asyncio.run(run())
+
+
+def test_concurrent_downloads_on_one_loop(server_url):
+    url = f"{server_url}/download/file?id=1"
+
+    async def run():
+        async with new_async_session(max_clients=8) as session:
+            targets = [BytesIO() for _ in range(24)]
+            await asyncio.gather(
+                *[
+                    download_file_async(url, target, session, write_size=64 * 1024)
+                    for target in targets
+                ]
+            )
+            return targets
+
+    targets = asyncio.run(run())
+    assert all(target.getvalue() == FILE_BODY for target in targets)
+
+
+def test_download_file_async_errors(server_url):
+    async def run(path):
+        async with new_async_session() as session:
+            await download_file_async(f"{server_url}{path}", BytesIO(), session)
+
+    with pytest.raises(DownloadBadStatusCode):
+        asyncio.run(run("/missing"))
+    with pytest.raises(DownloadExpired):
+        asyncio.run(run("/expired"))
@@ -1,9 +1,17 @@
 import json
+from datetime import datetime, timezone
 from pathlib import Path
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
-from bandcampsync.bandcamp import Bandcamp, BandcampDownloadUnavailable, BandcampItem
+from bs4 import BeautifulSoup
+from bandcampsync.bandcamp import (
+    Bandcamp,
+    BandcampDownloadUnavailable,
+    BandcampItem,
+    parse_purchase_datetime,
+    parse_size,
+)
 
 
 def _load_payload(name):
@@ -11,6 +19,11 @@ def _load_payload(name):
     return json.loads(fixture_path.read_text(encoding="utf-8", errors="ignore"))
 
 
+def _load_html(name):
+    html_path = Path(__file__).resolve().parent / "data" / name
+    return html_path.read_text(encoding="utf-8", errors="ignore")
+
+
 def _create_bandcamp():
     bandcamp = Bandcamp("identity=test")
     bandcamp.is_authenticated = True
@@ -108,9 +121,223 @@ def test_get_download_file_url_missing_downloads_is_unavailable(bandcamp):
         }
     )
     bandcamp._request = Mock()
-    bandcamp._extract_pagedata_from_soup = Mock(
+    bandcamp._extract_pagedata_from_html = Mock(
         return_value={"digital_items": [{"item_id": 123}]}
     )
 
     with pytest.raises(BandcampDownloadUnavailable):
         bandcamp.get_download_file_url(item)
+
+
+def _collection_page(item_ids, more_available=True):
+    items = [
+        {
+            "band_name": f"Band {item_id}",
+            "item_title": f"Album {item_id}",
+            "item_id": item_id,
+            "item_type": "album",
+            "sale_item_type": "p",
+            "sale_item_id": item_id,
+            "token": f"token-{item_id}",
+        }
+        for item_id in item_ids
+    ]
+    return {
+        "items": items,
+        "more_available": more_available,
+        "redownload_urls": {
+            f"p{item_id}": f"https://bandcamp.com/download?sitem_id={item_id}"
+            for item_id in item_ids
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("93.2MB", int(93.2 * 1024 * 1024)),
+        ("1.5GB", int(1.5 * 1024**3)),
+        ("512 kb", 512 * 1024),
+        ("", None),
+        ("unknown", None),
+        (None, None),
+    ],
+)
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+def test_get_download_file_size(bandcamp):
+    downloads = {"flac": {"size_mb": "10.0MB", "url": "u"}, "mp3-320": {"url": "u"}}
+    with patch.object(bandcamp, "get_item_downloads", return_value=downloads):
+        assert bandcamp.get_download_file_size(Mock(), "flac") == 10 * 1024 * 1024
+        assert bandcamp.get_download_file_size(Mock(), "mp3-320") is None
+        assert bandcamp.get_download_file_size(Mock(), "wav") is None
+
+
+def test_get_download_file_reads_one_download_page(bandcamp):
+    downloads = {"flac": {"size_mb": "10.0MB", "url": "u"}}
+    with patch.object(
+        bandcamp, "get_item_downloads", return_value=downloads
+    ) as mock_downloads:
+        assert bandcamp.get_download_file(Mock(), "flac") == ("u", 10 * 1024 * 1024)
+    mock_downloads.assert_called_once()
+
+
+def test_load_purchases_pipelines_pages(bandcamp):
+    pages = [
+        _collection_page([1, 2]),
+        _collection_page([3, 4]),
+        _collection_page([5], more_available=False),
+    ]
+    bandcamp._request = Mock(side_effect=pages)
+
+    bandcamp.load_purchases()
+
+    assert [item.item_id for item in bandcamp.purchases] == [1, 2, 3, 4, 5]
+    tokens = [
+        call.kwargs["json_data"]["older_than_token"]
+        for call in bandcamp._request.call_args_list
+    ]
+    assert tokens[1:] == ["token-2", "token-4"]
+    # The last page reports no more items, so no trailing empty page is requested
+    assert bandcamp._request.call_count == 3
+
+
+def test_load_purchases_stop_discards_prefetched_page(bandcamp):
+    pages = [_collection_page([1, 2]), _collection_page([3, 4])]
+    bandcamp._request = Mock(side_effect=pages)
+
+    bandcamp.load_purchases(stop_when=lambda item: item.item_id == 2)
+
+    assert [item.item_id for item in bandcamp.collection_items] == [1, 2]
+    assert [item.item_id for item in bandcamp.purchases] == [1]
+    assert bandcamp._request.call_count <= 2
+
+
+def test_resolve_download_urls_shares_pages(bandcamp):
+    def item(item_id):
+        return BandcampItem(
+            {
+                "band_name": f"Band {item_id}",
+                "item_title": f"Album {item_id}",
+                "item_id": item_id,
+                "sale_item_type": "p",
+                "sale_item_id": item_id,
+                "token": f"{1700000100 - item_id}:{item_id}:a::",
+            }
+        )
+
+    # Item 5 is no longer in the collection
+    pages = [_collection_page([2, 3, 4]), _collection_page([6, 7, 8])]
+    bandcamp._request = Mock(side_effect=pages)
+
+    resolved = bandcamp.resolve_download_urls([item(2), item(4), item(5), item(8)])
+
+    assert [i.item_id for i in resolved] == [2, 4, 8]
+    assert resolved[2].download_url == "https://bandcamp.com/download?sitem_id=8"
+    tokens = [
+        call.kwargs["json_data"]["older_than_token"]
+        for call in bandcamp._request.call_args_list
+    ]
+    # Each page starts just before the newest item still to resolve
+    assert tokens == ["1700000099:0:a::", "1700000096:0:a::"]
+
+
+def test_adaptive_per_page():
+    bandcamp = Bandcamp("identity=test", per_page=100, adaptive_per_page=True)
+    assert bandcamp._next_per_page(100, 0.1) == 200
+    assert bandcamp._next_per_page(400, 0.1) == Bandcamp.MAX_PER_PAGE
+    assert bandcamp._next_per_page(100, 2.0) == 100
+    assert bandcamp._next_per_page(100, 10.0) == 50
+    assert bandcamp._next_per_page(30, 10.0) == Bandcamp.MIN_PER_PAGE
+
+
+def test_extract_pagedata_matches_soup(bandcamp):
+    html = _load_html("download-choose-format.html")
+    soup = BeautifulSoup(html, "html.parser")
+
+    pagedata = bandcamp._extract_pagedata_from_html(html)
+
+    assert pagedata == bandcamp._extract_pagedata_from_soup(soup)
+    assert pagedata["digital_items"][0]["downloads"]["flac"]["url"]
+
+
+def test_extract_pagedata_attribute_order_and_quoting(bandcamp):
+    html = (
+        "<html><body><div data-blob='{&quot;a&quot;: &quot;&gt;&quot;}' "
+        'class="x" id="pagedata"></div></body></html>'
+    )
+    assert bandcamp._extract_pagedata_from_html(html) == {"a": ">"}
+
+
+def test_extract_pagedata_falls_back_to_soup(bandcamp):
+    # An unquoted id attribute is not found by the fast path
+    html = '<div id=pagedata data-blob="{&quot;a&quot;: 1}"></div>'
+    bandcamp._extract_pagedata_from_soup = Mock(return_value={"a": 1})
+
+    assert bandcamp._extract_pagedata_from_html(html) == {"a": 1}
+    bandcamp._extract_pagedata_from_soup.assert_called_once()
+
+
+def test_iter_purchases_yields_before_next_page_is_processed(bandcamp):
+    pages = [
+        _collection_page([1, 2]),
+        _collection_page([3], more_available=False),
+    ]
+    bandcamp._request = Mock(side_effect=pages)
+
+    purchases = bandcamp.iter_purchases()
+    first = next(purchases)
+
+    assert first.item_id == 1
+    assert [item.item_id for item in bandcamp.purchases] == [1]
+    assert [item.item_id for item in purchases] == [2, 3]
+
+
+def test_iter_purchases_suffixes_duplicates_when_found(bandcamp):
+    page = _collection_page([1, 2, 3], more_available=False)
+    page["items"][2]["item_title"] = page["items"][0]["item_title"]
+    page["items"][2]["band_name"] = page["items"][0]["band_name"]
+    bandcamp._request = Mock(return_value=page)
+
+    purchases = bandcamp.iter_purchases()
+    first = next(purchases)
+    assert first.folder_suffix == ""
+
+    list(purchases)
+    assert first.folder_suffix == " [1]"
+    assert bandcamp.purchases[1].folder_suffix == ""
+    assert bandcamp.purchases[2].folder_suffix == " [3]"
+
+
+def test_item_keeps_only_sync_fields(digital_item):
+    item = BandcampItem(digital_item)
+
+    assert item.band_name == digital_item["band_name"]
+    assert item.token == digital_item["token"]
+    assert item.url_hints == {"slug": digital_item["url_hints"]["slug"]}
+    assert item.folder_suffix == ""
+    assert not hasattr(item, "__dict__")
+    with pytest.raises(KeyError):
+        item.also_collected_count
+
+
+def test_item_keep_raw_exposes_payload(digital_item):
+    item = BandcampItem(digital_item, keep_raw=True)
+    assert item.also_collected_count == digital_item["also_collected_count"]
+
+
+def test_item_purchased_datetime_is_parsed_once(digital_item):
+    item = BandcampItem(digital_item)
+
+    with patch(
+        "bandcampsync.bandcamp.parse_purchase_datetime",
+        wraps=parse_purchase_datetime,
+    ) as mock_parse:
+        first = item.purchased_datetime
+        second = item.purchased_datetime
+
+    assert first == datetime(2020, 7, 7, 1, 34, 59, tzinfo=timezone.utc)
+    assert first is second
+    mock_parse.assert_called_once()
@@ -0,0 +1,267 @@
+import json
+from unittest.mock import Mock, patch
+import pytest
+
+from bandcampsync.bandcamp import (
+    Bandcamp,
+    BandcampAuthError,
+    BandcampError,
+    BandcampItem,
+)
+from bandcampsync.cache import AuthCache, DownloadPageCache
+
+
+DOWNLOADS = {
+    "flac": {
+        "size_mb": "79MB",
+        "description": "FLAC",
+        "url": "https://popplers5.bandcamp.com/download/album?enc=flac&id=1&sig=abc",
+    },
+    "mp3-v0": {
+        "size_mb": "13.6MB",
+        "description": "MP3 V0",
+        "url": "https://popplers5.bandcamp.com/download/album?enc=mp3-v0&id=1&sig=abc",
+    },
+}
+
+
+def test_put_and_get(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json")
+    cache.put(123, DOWNLOADS)
+
+    assert cache.get(123, "flac") == {
+        "url": DOWNLOADS["flac"]["url"],
+        "size_mb": "79MB",
+    }
+    assert set(cache.get(123)) == {"flac", "mp3-v0"}
+    assert cache.get(123, "wav") is None
+    assert cache.get(456) is None
+
+
+def test_persists_between_runs(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json")
+    cache.put(123, DOWNLOADS)
+    assert cache.save() is True
+
+    reloaded = DownloadPageCache(tmp_path / "cache.json")
+    assert reloaded.get(123, "flac")["url"] == DOWNLOADS["flac"]["url"]
+
+
+def test_expires_after_ttl(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", ttl=60)
+    with patch("bandcampsync.cache.time", return_value=1000):
+        cache.put(123, DOWNLOADS)
+    with patch("bandcampsync.cache.time", return_value=1059):
+        assert cache.get(123, "flac") is not None
+    with patch("bandcampsync.cache.time", return_value=1061):
+        assert cache.get(123, "flac") is None
+
+
+def test_ttl_respects_signed_url_timestamp(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", ttl=86400)
+    downloads = {"flac": {"url": "https://bcbits.com/download?ts=900.5&sig=abc"}}
+    with patch("bandcampsync.cache.time", return_value=1000):
+        cache.put(123, downloads)
+    # A long TTL does not outlive the URL, which is valid for an hour from "ts"
+    assert cache.items["123"]["expires_at"] == 900.5 + 3600 - 300
+
+
+def test_ttl_respects_signed_url_token_expiry(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", ttl=86400)
+    downloads = {"flac": {"url": "https://bcbits.com/download?token=2000_abc"}}
+    with patch("bandcampsync.cache.time", return_value=1000):
+        cache.put(123, downloads)
+    assert cache.items["123"]["expires_at"] == 2000 - 300
+
+
+def test_ttl_is_capped_without_signed_url_times(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", ttl=86400)
+    with patch("bandcampsync.cache.time", return_value=1000):
+        cache.put(123, DOWNLOADS)
+    assert cache.items["123"]["expires_at"] == 1000 + 3600 - 300
+
+
+def test_cache_file_is_private(tmp_path):
+    cache_path = DownloadPageCache.path_for(tmp_path / "cache", tmp_path / "media")
+    assert cache_path != DownloadPageCache.path_for(tmp_path / "cache", tmp_path)
+    cache = DownloadPageCache(cache_path)
+    cache.put(123, DOWNLOADS)
+    assert cache.save() is True
+    assert cache_path.stat().st_mode & 0o777 == 0o600
+
+
+def test_evicts_oldest_entries(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", max_entries=2)
+    for item_id in (1, 2, 3):
+        with patch("bandcampsync.cache.time", return_value=1000 + item_id):
+            cache.put(item_id, DOWNLOADS)
+    with patch("bandcampsync.cache.time", return_value=1010):
+        cache.save()
+
+    data = json.loads((tmp_path / "cache.json").read_text())
+    assert set(data["items"]) == {"2", "3"}
+
+
+def test_disabled_with_zero_ttl(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json", ttl=0)
+    cache.put(123, DOWNLOADS)
+    assert cache.get(123, "flac") is None
+    assert cache.save() is False
+    assert not (tmp_path / "cache.json").exists()
+
+
+def test_get_download_file_url_uses_cache(tmp_path):
+    cache = DownloadPageCache(tmp_path / "cache.json")
+    bandcamp = Bandcamp("identity=test", download_cache=cache)
+    bandcamp._request = Mock(return_value="<html></html>")
+    bandcamp._extract_pagedata_from_html = Mock(
+        return_value={"digital_items": [{"item_id": 123, "downloads": DOWNLOADS}]}
+    )
+    item = BandcampItem(
+        {
+            "band_name": "Band",
+            "item_title": "Album",
+            "item_id": 123,
+            "download_url": "https://bandcamp.com/download/test",
+        }
+    )
+
+    assert bandcamp.get_download_file_url(item, "flac") == DOWNLOADS["flac"]["url"]
+    assert (
+        bandcamp.get_download_file_url(item, "mp3-v0") == (DOWNLOADS["mp3-v0"]["url"])
+    )
+    assert bandcamp._request.call_count == 1
+
+    bandcamp.invalidate_item_downloads(item)
+    bandcamp.get_download_file_url(item, "flac")
+    assert bandcamp._request.call_count == 2
+
+
+def test_auth_cache_roundtrip(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    cache.put("hash", 123, True)
+
+    reloaded = AuthCache(tmp_path / "auth.json")
+    assert reloaded.get("hash")["user_id"] == 123
+    assert reloaded.get("other") is None
+    assert "identity" not in (tmp_path / "auth.json").read_text()
+
+
+def test_auth_cache_expires(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json", ttl=60)
+    with patch("bandcampsync.cache.time", return_value=1000):
+        cache.put("hash", 123, True)
+    with patch("bandcampsync.cache.time", return_value=1061):
+        assert cache.get("hash") is None
+
+
+def test_verify_authentication_uses_cached_identity(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    bandcamp = Bandcamp("identity=test", auth_cache=cache)
+    cache.put(bandcamp.identity_hash, 123, True)
+    bandcamp._request = Mock()
+
+    bandcamp.verify_authentication()
+
+    assert bandcamp.user_id == 123
+    assert bandcamp.is_authenticated is True
+    assert bandcamp.auth_unconfirmed is True
+    bandcamp._request.assert_not_called()
+
+
+def test_cached_identity_confirmed_by_first_collection_page(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    bandcamp = Bandcamp("identity=test", auth_cache=cache)
+    cache.put(bandcamp.identity_hash, 123, True)
+    page = {
+        "items": [{"band_name": "Band", "item_title": "Album", "item_id": 1}],
+        "more_available": False,
+        "redownload_urls": {"p1": "https://bandcamp.com/download?sitem_id=1"},
+    }
+    bandcamp._request = Mock(return_value=page)
+
+    bandcamp.verify_authentication()
+    bandcamp.load_purchases()
+
+    assert bandcamp.auth_unconfirmed is False
+    assert bandcamp._request.call_count == 1
+
+
+def test_cached_identity_falls_back_to_homepage(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    bandcamp = Bandcamp("identity=test", auth_cache=cache)
+    cache.put(bandcamp.identity_hash, 123, True)
+    page = {
+        "items": [
+            {"band_name": "Band", "item_title": "Album", "item_id": 1, "fan_id": 456}
+        ],
+        "more_available": False,
+        "redownload_urls": {"p1": "https://bandcamp.com/download?sitem_id=1"},
+    }
+    homepage = {"pageContext": {"identity": {"fanId": 456, "isFanVerified": True}}}
+    bandcamp._request = Mock(side_effect=[page, "<html></html>", page])
+    bandcamp._extract_pagedata_from_html = Mock(return_value=homepage)
+
+    bandcamp.verify_authentication()
+    bandcamp.load_purchases()
+
+    assert bandcamp.user_id == 456
+    assert bandcamp.auth_unconfirmed is False
+    assert bandcamp._request.call_args.kwargs["json_data"]["fan_id"] == 456
+    assert (
+        AuthCache(tmp_path / "auth.json").get(bandcamp.identity_hash)["user_id"] == 456
+    )
+
+
+def test_cached_identity_kept_without_redownload_urls(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    bandcamp = Bandcamp("identity=test", auth_cache=cache)
+    cache.put(bandcamp.identity_hash, 123, True)
+    page = {
+        "items": [
+            {"band_name": "Band", "item_title": "Album", "item_id": 1, "fan_id": 123}
+        ],
+        "more_available": False,
+        "redownload_urls": {},
+    }
+    bandcamp._request = Mock(return_value=page)
+
+    bandcamp.verify_authentication()
+    bandcamp.load_purchases()
+
+    # Items without downloads are not a sign of a bad session
+    assert bandcamp._request.call_count == 1
+    assert bandcamp.auth_unconfirmed is False
+    assert cache.get(bandcamp.identity_hash)["user_id"] == 123
+
+
+def test_cached_identity_kept_on_transient_errors(tmp_path):
+    cache = AuthCache(tmp_path / "auth.json")
+    bandcamp = Bandcamp("identity=test", auth_cache=cache)
+    cache.put(bandcamp.identity_hash, 123, True)
+    bandcamp._request = Mock(side_effect=BandcampError("connection reset"))
+
+    bandcamp.verify_authentication()
+    with pytest.raises(BandcampError, match="connection reset"):
+        bandcamp.load_purchases()
+
+    # Left to the normal retries rather than verified with the homepage
+    assert bandcamp._request.call_count == 1
+    assert bandcamp.auth_unconfirmed is True
+    assert cache.get(bandcamp.identity_hash)["user_id"] == 123
+
+
+@pytest.mark.parametrize(
+    "status_code,headers,url",
+    [
+        (403, {}, "https://bandcamp.com/api/fancollection/1/collection_items"),
+        (302, {"Location": "https://bandcamp.com/login?from=fan"}, None),
+        (200, {}, "https://bandcamp.com/login"),
+    ],
+)
+def test_unauthenticated_responses(status_code, headers, url):
+    bandcamp = Bandcamp("identity=test")
+    response = Mock(status_code=status_code, headers=headers, url=url, text="")
+
+    with pytest.raises(BandcampAuthError):
+        bandcamp._parse_response("https://bandcamp.com/", response)
@@ -1,6 +1,22 @@
 from pathlib import Path
 
-from bandcampsync.download import _is_expired_download_page
+import pytest
+
+from bandcampsync.download import (
+    DownloadBadStatusCode,
+    DownloadInvalidContentType,
+    _DownloadWriter,
+    _is_expired_download_page,
+    _split_range,
+    copy_file,
+    download_file,
+    download_file_segmented,
+    move_file,
+)
+from bandcampsync.journal import PartialDownload
+from bandcampsync.sessions import SessionPool
+from bandcampsync.writer import MB, TransferStats
+from tests.mockserver import MockBandcampConfig, MockBandcampServer
 
 
 def _load_fixture(name):
@@ -16,3 +32,173 @@ def test_expired_download_page():
 def test_non_expired_download_page():
     html = _load_fixture("download-choose-format.html")
     assert _is_expired_download_page(html) is False
+
+
+def test_expired_download_page_falls_back_to_soup():
+    html = '<div style="" class=email-reauth-error>expired</div>'
+    assert _is_expired_download_page(html) is True
+
+
+def test_page_without_reauth_error_is_not_expired():
+    assert _is_expired_download_page("<html><body></body></html>") is False
+
+
+@pytest.fixture
+def server():
+    config = MockBandcampConfig(items=1, track_ratio=1.0, file_size=5 * MB)
+    with MockBandcampServer(config) as server:
+        yield server
+
+
+def _file_url(server):
+    return f"{server.url}/download/track?enc=flac&id=1000&sig=mocksig&ts=1.0"
+
+
+def _download_segmented(server, path, **kwargs):
+    kwargs.setdefault("segments", 4)
+    kwargs.setdefault("min_size", 2 * MB)
+    with open(path, "w+b") as f:
+        return download_file_segmented(
+            _file_url(server), f, session_pool=SessionPool(size=4), **kwargs
+        )
+
+
+def test_split_range():
+    assert _split_range(MB, 5 * MB, 4) == [
+        (MB, 2 * MB - 1),
+        (2 * MB, 3 * MB - 1),
+        (3 * MB, 4 * MB - 1),
+        (4 * MB, 5 * MB - 1),
+    ]
+    # Segments are never smaller than a megabyte
+    assert _split_range(0, MB + 10, 8) == [(0, MB + 9)]
+    assert _split_range(5, 5, 4) == []
+
+
+def test_segmented_download(server, tmp_path):
+    stats = TransferStats()
+    partial = PartialDownload(tmp_path / "out")
+    with partial.open() as f:
+        content_type = download_file_segmented(
+            _file_url(server),
+            f,
+            segments=4,
+            min_size=2 * MB,
+            session_pool=SessionPool(size=4),
+            partial=partial,
+            stats=stats,
+        )
+    payload = server.state.payload(True, "flac")
+    assert content_type == "audio/flac"
+    assert (tmp_path / "out").read_bytes() == payload
+    # The probe request and four segments
+    assert server.stats()["requests"]["file_range"] == 5
+    assert stats.network_bytes == len(payload)
+    assert partial.complete
+
+
+def test_segmented_download_below_min_size(server, tmp_path):
+    _download_segmented(server, tmp_path / "out", min_size=16 * MB)
+    assert (tmp_path / "out").read_bytes() == server.state.payload(True, "flac")
+    assert server.stats()["requests"]["file_range"] == 2
+
+
+def test_segmented_download_without_ranges(server, tmp_path):
+    server.state.config.accept_ranges = False
+    _download_segmented(server, tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == server.state.payload(True, "flac")
+    assert "file_range" not in server.stats()["requests"]
+
+
+def test_segments_are_retried_independently(server, tmp_path, monkeypatch):
+    calls = []
+
+    def should_interrupt():
+        # Let the probe through then interrupt the next two segment responses
+        calls.append(None)
+        return len(calls) in (2, 3)
+
+    monkeypatch.setattr(server.state, "should_interrupt", should_interrupt)
+    _download_segmented(server, tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == server.state.payload(True, "flac")
+    requests = server.stats()["requests"]
+    assert requests["file_interrupted"] == 2
+    assert requests["file_range"] == 7
+
+
+def test_segmented_download_fails_when_file_changes(server, tmp_path, monkeypatch):
+    payload = server.state.payload(True, "flac")
+    calls = []
+
+    def changing_payload(is_track, encoding):
+        calls.append(None)
+        return payload if len(calls) == 1 else payload[::-1]
+
+    monkeypatch.setattr(server.state, "payload", changing_payload)
+    partial = PartialDownload(tmp_path / "out")
+    with partial.open() as f, pytest.raises(DownloadBadStatusCode):
+        download_file_segmented(
+            _file_url(server),
+            f,
+            segments=4,
+            min_size=2 * MB,
+            partial=partial,
+        )
+    assert partial.bytes_written == 0
+    assert not partial.journal_path.exists()
+
+
+def test_unwritten_body_is_not_received_in_full(server, tmp_path, monkeypatch):
+    received = []
+    write_chunk = _DownloadWriter.__call__
+
+    def counting_call(writer, chunk):
+        received.append(len(chunk))
+        return write_chunk(writer, chunk)
+
+    monkeypatch.setattr(_DownloadWriter, "__call__", counting_call)
+    with open(tmp_path / "out", "wb") as f, pytest.raises(DownloadInvalidContentType):
+        download_file(_file_url(server), f, disallow_content_type="audio/flac")
+    assert (tmp_path / "out").read_bytes() == b""
+    assert sum(received) < 2 * MB
+
+
+def test_copy_file(tmp_path):
+    data = bytes(range(256)) * 4096
+    (tmp_path / "src").write_bytes(data)
+    copy_file(tmp_path / "src", tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == data
+
+
+def test_copy_file_falls_back_without_copy_file_range(tmp_path, monkeypatch):
+    monkeypatch.delattr("os.copy_file_range", raising=False)
+    (tmp_path / "src").write_bytes(b"data")
+    copy_file(tmp_path / "src", tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == b"data"
+
+
+def test_copy_file_falls_back_when_copy_file_range_copies_nothing(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr("os.copy_file_range", lambda src, dst, count: 0, raising=False)
+    (tmp_path / "src").write_bytes(b"data")
+    copy_file(tmp_path / "src", tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == b"data"
+
+
+def test_copy_file_raises_when_copy_file_range_stops_short(tmp_path, monkeypatch):
+    sizes = iter([2, 0])
+    monkeypatch.setattr(
+        "os.copy_file_range", lambda src, dst, count: next(sizes), raising=False
+    )
+    (tmp_path / "src").write_bytes(b"data")
+    with pytest.raises(OSError, match="Copied 2 of 4 bytes"):
+        copy_file(tmp_path / "src", tmp_path / "dst")
+
+
+def test_move_file(tmp_path):
+    (tmp_path / "src").write_bytes(b"data")
+    (tmp_path / "dst").write_bytes(b"old")
+    move_file(tmp_path / "src", tmp_path / "dst")
+    assert (tmp_path / "dst").read_bytes() == b"data"
+    assert not (tmp_path / "src").exists()
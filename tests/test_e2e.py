@@ -0,0 +1,427 @@
+"""End to end sync tests against the local mock Bandcamp server."""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from bandcampsync.cache import DownloadPageCache
+from bandcampsync.download import DownloadBadStatusCode, download_file
+from bandcampsync.manifest import AlbumManifest, hash_file
+from bandcampsync import metrics
+from bandcampsync.options import BandcampSyncOptions
+from bandcampsync.snapshot import CollectionSnapshot
+from bandcampsync.staging import StagingArea
+from bandcampsync.sync import MultiFormatSyncer, Syncer
+from tests.mockserver import MockBandcampConfig, MockBandcampServer
+
+
+def _run_sync(tmp_path, config, **options):
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        syncer = Syncer(
+            BandcampSyncOptions(
+                cookies="identity=e2e",
+                dir_path=media_dir,
+                temp_dir_root=tmp_path,
+                retry_wait=0,
+                **options,
+            )
+        )
+        stats = server.stats()
+    return syncer, media_dir, stats
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_sync_collection_end_to_end(tmp_path, engine):
+    config = MockBandcampConfig(items=6, track_ratio=0.5, file_size=64 * 1024)
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, concurrency=3, engine=engine, page_size=4
+    )
+
+    assert syncer.new_items_downloaded is True
+    assert syncer.had_sync_errors is False
+    # Three single tracks and three albums of four tracks each
+    assert len(list(media_dir.glob("*/*/*.flac"))) == 3 + 3 * 4
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 6
+    assert stats["requests"]["collection_items"] == 2
+    assert stats["requests"]["download_page"] == 6
+    assert stats["requests"]["file"] == 6
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_metrics_are_recorded(tmp_path, engine):
+    # Metrics are kept for the lifetime of the process so compare before and after
+    pages = metrics.COLLECTION_PAGES.get()
+    downloaded = metrics.DOWNLOADED_BYTES.get()
+    downloads = metrics.ITEM_DOWNLOAD_SECONDS.get()
+    requests = metrics.REQUESTS.get(endpoint="download_page", status=200)
+    config = MockBandcampConfig(items=3, file_size=16 * 1024)
+    metrics_file = tmp_path / "bandcampsync.prom"
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, engine=engine, page_size=2, metrics_file=metrics_file
+    )
+
+    assert metrics.COLLECTION_PAGES.get() - pages == 2
+    assert metrics.ITEM_DOWNLOAD_SECONDS.get() - downloads == 3
+    assert metrics.DOWNLOADED_BYTES.get() - downloaded >= 3 * 16 * 1024
+    assert (
+        metrics.REQUESTS.get(endpoint="download_page", status=200) - requests
+        == stats["requests"]["download_page"]
+    )
+    assert metrics.QUEUE_DEPTH.get() == 0
+    text = metrics_file.read_text()
+    assert "bandcampsync_checkpoint_advances_total " in text
+    assert 'bandcampsync_runs_total{result="success"} ' in text
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_bandwidth_is_limited(tmp_path, engine):
+    config = MockBandcampConfig(items=3, track_ratio=1, file_size=128 * 1024)
+    started = time.monotonic()
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, engine=engine, concurrency=3, bandwidth=512 * 1024
+    )
+    elapsed = time.monotonic() - started
+
+    assert len(list(media_dir.glob("*/*/*.flac"))) == 3
+    # 384 KB at 512 KB/s after the first 128 KB burst
+    assert elapsed >= 0.45
+    assert syncer.transfer_stats.throttle_seconds >= 0.45
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_schedule_largest_first_fetches_download_pages_once(tmp_path, engine):
+    config = MockBandcampConfig(items=4, file_size=16 * 1024)
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, engine=engine, concurrency=2, schedule="largest"
+    )
+
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 4
+    assert stats["requests"]["download_page"] == 4
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_uncached_sync_fetches_download_pages_once(tmp_path, engine):
+    config = MockBandcampConfig(items=4, file_size=16 * 1024)
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, engine=engine, download_cache_ttl=0
+    )
+
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 4
+    assert stats["requests"]["download_page"] == 4
+
+
+def test_download_cache_is_kept_out_of_media_dir(tmp_path):
+    config = MockBandcampConfig(items=2, file_size=16 * 1024)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    legacy_cache_path = media_dir / Syncer.LEGACY_CACHE_FILENAME
+    legacy_cache_path.write_text("{}")
+    options = BandcampSyncOptions(
+        cookies="identity=e2e", dir_path=media_dir, temp_dir_root=tmp_path
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        Syncer(options)
+
+    assert not legacy_cache_path.exists()
+    assert not list(media_dir.glob(".bandcampsync-cache*"))
+    assert DownloadPageCache.path_for(tmp_path, media_dir).is_file()
+
+
+def _multi_format_options(tmp_path, **options):
+    flac_dir = tmp_path / "flac"
+    mp3_dir = tmp_path / "mp3"
+    flac_dir.mkdir(exist_ok=True)
+    mp3_dir.mkdir(exist_ok=True)
+    return BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=flac_dir,
+        media_format="flac",
+        format_dirs={"mp3-v0": mp3_dir},
+        temp_dir_root=tmp_path,
+        retry_wait=0,
+        **options,
+    )
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_multi_format_sync_fetches_download_pages_once(tmp_path, engine):
+    config = MockBandcampConfig(items=4, track_ratio=0.5, file_size=16 * 1024)
+    options = _multi_format_options(tmp_path, engine=engine, concurrency=2)
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        syncer = MultiFormatSyncer(options)
+        stats = server.stats()
+
+    assert syncer.had_sync_errors is False
+    assert syncer.new_items_downloaded is True
+    assert stats["requests"]["collection_items"] == 1
+    assert stats["requests"]["download_page"] == 4
+    assert stats["requests"]["file"] == 8
+    # Every format extracts on the same pool, closed once the sync is finished
+    assert {id(s.zip_extractor) for s in syncer.syncers} == {id(syncer.zip_extractor)}
+    assert syncer.zip_extractor.executor is None
+    for media_dir, extension in ((options.dir_path, "flac"), (tmp_path / "mp3", "mp3")):
+        assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 4
+        assert list(media_dir.glob(f"*/*/*.{extension}"))
+        assert (media_dir / Syncer.SNAPSHOT_FILENAME).is_file()
+
+
+def test_multi_format_sync_downloads_only_missing_formats(tmp_path):
+    config = MockBandcampConfig(items=3, file_size=16 * 1024)
+    options = _multi_format_options(tmp_path)
+    mp3_dir = options.format_dirs["mp3-v0"]
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        MultiFormatSyncer(options)
+        first = server.stats()["requests"]
+        # An item removed from one directory is downloaded again in that format
+        # once its snapshot is gone
+        removed = next(mp3_dir.glob("*/*/bandcamp_item_id.txt")).parent
+        for path in removed.iterdir():
+            path.unlink()
+        removed.rmdir()
+        (mp3_dir / Syncer.SNAPSHOT_FILENAME).unlink()
+        (mp3_dir / Syncer.STATE_FILENAME).unlink(missing_ok=True)
+        syncer = MultiFormatSyncer(options)
+        second = server.stats()["requests"]
+
+    assert syncer.had_sync_errors is False
+    assert first["file"] == 6
+    assert second["file"] - first["file"] == 1
+    assert len(list(mp3_dir.glob("*/*/bandcamp_item_id.txt"))) == 3
+
+
+def test_sync_retries_server_errors(tmp_path):
+    config = MockBandcampConfig(items=4, file_size=16 * 1024, error_rate=0.2, seed=3)
+    syncer, media_dir, stats = _run_sync(tmp_path, config, max_retries=10)
+
+    assert stats["errors"] > 0
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 4
+
+
+def test_second_sync_downloads_nothing(tmp_path):
+    config = MockBandcampConfig(items=3, file_size=16 * 1024)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e", dir_path=media_dir, temp_dir_root=tmp_path
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        Syncer(options)
+        syncer = Syncer(options)
+        stats = server.stats()
+
+    assert syncer.new_items_downloaded is False
+    assert stats["requests"]["file"] == 3
+
+
+def test_snapshot_loads_only_new_purchases(tmp_path):
+    config = MockBandcampConfig(items=12, file_size=16 * 1024, max_per_page=4)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=media_dir,
+        temp_dir_root=tmp_path,
+        page_size=4,
+        auth_cache_ttl=0,
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        Syncer(options)
+        first = server.stats()["requests"]
+        syncer = Syncer(options)
+        second = server.stats()["requests"]
+
+    assert first["collection_items"] == 3
+    # Only the first page is loaded, it already contains the snapshot head
+    assert second["collection_items"] - first["collection_items"] == 1
+    assert second["file"] == first["file"] == 12
+    assert syncer.new_items_downloaded is False
+    assert syncer.collection_snapshot.counts() == {"downloaded": 12}
+
+
+def test_first_snapshot_stops_at_checkpoint(tmp_path):
+    config = MockBandcampConfig(items=12, file_size=16 * 1024, max_per_page=4)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=media_dir,
+        temp_dir_root=tmp_path,
+        page_size=4,
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        Syncer(options)
+        # As if upgrading from a version that only kept the checkpoint
+        (media_dir / Syncer.SNAPSHOT_FILENAME).unlink()
+        first = server.stats()["requests"]
+        syncer = Syncer(options)
+        second = server.stats()["requests"]
+
+    # The newest purchase is the checkpoint, so only the first page is loaded and
+    # the page requested ahead of it is discarded
+    assert second["collection_items"] - first["collection_items"] <= 2
+    assert syncer.new_items_downloaded is False
+    snapshot = CollectionSnapshot(media_dir / Syncer.SNAPSHOT_FILENAME)
+    assert snapshot.usable is True
+    assert snapshot.counts() == {"checkpointed": 1}
+    assert snapshot.has_unknown_items() is False
+
+
+def test_snapshot_retries_old_failures(tmp_path):
+    config = MockBandcampConfig(items=8, file_size=16 * 1024, max_per_page=4)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=media_dir,
+        temp_dir_root=tmp_path,
+        page_size=4,
+        max_retries=1,
+        retry_wait=0,
+    )
+
+    def fail_oldest_item(url, *args, **kwargs):
+        # Items are numbered from 1000, newest first
+        if "&id=1007&" in url:
+            raise DownloadBadStatusCode("Got non-200 status code: 500")
+        return download_file(url, *args, **kwargs)
+
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        with patch("bandcampsync.sync.download_file", side_effect=fail_oldest_item):
+            first = Syncer(options)
+        assert first.had_sync_errors is True
+        assert first.collection_snapshot.counts() == {"downloaded": 7, "failed": 1}
+
+        second = Syncer(options)
+        stats = server.stats()
+
+    assert second.had_sync_errors is False
+    assert second.new_items_downloaded is True
+    assert second.collection_snapshot.counts() == {"downloaded": 8}
+    # The failed item is the oldest, but only the newest page and the page from
+    # the failed item, for its download URL, are loaded again
+    assert stats["requests"]["collection_items"] == 2 + 2
+    snapshot = (media_dir / Syncer.SNAPSHOT_FILENAME).read_text()
+    assert "mocksig" not in snapshot
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_interrupted_downloads_resume(tmp_path, engine):
+    config = MockBandcampConfig(
+        items=4, file_size=256 * 1024, interrupt_rate=0.5, seed=1
+    )
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, concurrency=2, engine=engine, max_retries=10
+    )
+
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 4
+    assert stats["requests"]["file_interrupted"] > 0
+    assert stats["requests"]["file_range"] > 0
+    # Partial files are kept in the temporary directory and removed once complete
+    assert syncer.download_journal.dir_path == tmp_path / Syncer.PARTIAL_DIRNAME
+    assert list((tmp_path / Syncer.PARTIAL_DIRNAME).glob("*.part")) == []
+    assert not (media_dir / Syncer.PARTIAL_DIRNAME).exists()
+
+
+def test_download_resumes_after_restart(tmp_path):
+    config = MockBandcampConfig(items=1, file_size=256 * 1024, interrupt_rate=1.0)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=media_dir,
+        temp_dir_root=tmp_path,
+        max_retries=1,
+        retry_wait=0,
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        first = Syncer(options)
+        assert first.had_sync_errors is True
+        assert len(first.download_journal.pending()) == 1
+        server.state.config.interrupt_rate = 0.0
+        second = Syncer(options)
+        stats = server.stats()
+
+    assert second.had_sync_errors is False
+    assert stats["requests"]["file_range"] == 1
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 1
+
+
+def test_sync_with_segmented_downloads(tmp_path):
+    config = MockBandcampConfig(items=3, track_ratio=0.5, file_size=3 * 1024 * 1024)
+    syncer, media_dir, stats = _run_sync(
+        tmp_path,
+        config,
+        concurrency=2,
+        download_segments=3,
+        segment_min_size=2,
+        threaded_writer=True,
+    )
+
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/bandcamp_item_id.txt"))) == 3
+    # A probe request then two segments for the rest of each file
+    assert stats["requests"]["file"] == 9
+    assert stats["requests"]["file_range"] == 9
+
+
+@pytest.mark.parametrize("extract_while_downloading", [False, True])
+def test_albums_are_extracted(tmp_path, extract_while_downloading):
+    config = MockBandcampConfig(items=3, track_ratio=0.0, file_size=256 * 1024)
+    syncer, media_dir, stats = _run_sync(
+        tmp_path, config, extract_while_downloading=extract_while_downloading
+    )
+
+    assert syncer.had_sync_errors is False
+    assert len(list(media_dir.glob("*/*/*.flac"))) == 3 * 4
+    assert not list(media_dir.glob("*/*/.bandcampsync-extract-*"))
+    # The temporary directory is on the same filesystem so it is used for staging
+    assert syncer.staging.dir_path == tmp_path / StagingArea.STAGING_DIRNAME
+    assert not any(syncer.staging.dir_path.iterdir())
+
+
+@pytest.mark.parametrize(
+    "engine,extract_while_downloading",
+    [("threads", False), ("threads", True), ("async", True)],
+)
+def test_manifests_are_written_and_verified(
+    tmp_path, engine, extract_while_downloading
+):
+    config = MockBandcampConfig(items=4, track_ratio=0.5, file_size=64 * 1024)
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    options = BandcampSyncOptions(
+        cookies="identity=e2e",
+        dir_path=media_dir,
+        temp_dir_root=tmp_path,
+        engine=engine,
+        extract_while_downloading=extract_while_downloading,
+    )
+    with MockBandcampServer(config) as server, server.patch_bandcamp():
+        Syncer(options)
+        manifests = list(media_dir.glob(f"*/*/{AlbumManifest.MANIFEST_FILENAME}"))
+        assert len(manifests) == 4
+        for manifest_path in manifests:
+            manifest = AlbumManifest.load(manifest_path.parent)
+            assert manifest.files
+            for name, entry in manifest.files.items():
+                path = manifest_path.parent / name
+                assert hash_file(path) == (entry["size"], entry["sha256"])
+
+        damaged = next(media_dir.glob("*/*/*.flac"))
+        original = damaged.read_bytes()
+        damaged.write_bytes(original[:100])
+        options.verify = True
+        syncer = Syncer(options)
+        stats = server.stats()
+
+    assert syncer.had_sync_errors is False
+    assert len(syncer.damaged_item_ids) == 1
+    assert damaged.read_bytes() == original
+    assert stats["requests"]["file"] == 5
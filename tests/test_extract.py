@@ -0,0 +1,111 @@
+import hashlib
+import random
+import stat
+import threading
+import zipfile
+
+import pytest
+
+from bandcampsync.download import DownloadInvalidArchive, unzip_file
+from bandcampsync.extract import FILE_MODE, ParallelZipExtractor, member_name
+
+
+def _members():
+    data_random = random.Random(1)
+    return {
+        "01 - Track.flac": data_random.randbytes(300 * 1024),
+        "02 - Track.flac": b"silence " * 40000,
+        "cover.jpg": data_random.randbytes(3000),
+        "empty.txt": b"",
+    }
+
+
+def _build_zip(path, members):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return path
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("track.flac", "track.flac"),
+        ("disc 1/track.flac", "disc 1/track.flac"),
+        ("/abs/../../track.flac", "abs/track.flac"),
+        ("./", ""),
+    ],
+)
+def test_member_name(name, expected):
+    assert member_name(zipfile.ZipInfo(name)) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_extracts_members(tmp_path, workers):
+    members = _members()
+    members["disc 2/03 - Track.flac"] = b"data"
+    archive = _build_zip(tmp_path / "album.zip", members)
+    extractor = ParallelZipExtractor(workers=workers)
+    extracted = extractor.extract(archive, tmp_path / "out")
+    extractor.close()
+
+    assert len(extracted) == len(members)
+    for name, data in members.items():
+        assert (tmp_path / "out" / name).read_bytes() == data
+    assert sorted(digest for path, digest in extracted) == sorted(
+        hashlib.sha256(data).hexdigest() for data in members.values()
+    )
+    assert extractor.archives == 1
+    assert extractor.extracted_bytes == sum(len(d) for d in members.values())
+    assert extractor.extract_rate.endswith("MB/s")
+    # No temporary files are left behind
+    assert not list((tmp_path / "out").glob(f"{extractor.TEMP_PREFIX}*"))
+    # Files are given the mode ZipFile.extract() would create them with
+    for name in members:
+        assert stat.S_IMODE((tmp_path / "out" / name).stat().st_mode) == FILE_MODE
+
+
+def test_members_are_inflated_in_parallel(tmp_path, monkeypatch):
+    archive = _build_zip(tmp_path / "album.zip", _members())
+    extractor = ParallelZipExtractor(workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    extract_member = extractor._extract_member
+
+    def extract_member_together(zip_path, info, target):
+        # The two largest members are only extracted if they run at the same time
+        if info.file_size > 100 * 1024:
+            barrier.wait()
+        return extract_member(zip_path, info, target)
+
+    monkeypatch.setattr(extractor, "_extract_member", extract_member_together)
+    extractor.extract(archive, tmp_path / "out")
+    extractor.close()
+    assert (tmp_path / "out" / "01 - Track.flac").exists()
+
+
+def test_member_path_names_files(tmp_path):
+    archive = _build_zip(tmp_path / "album.zip", {"a:b.flac": b"data"})
+    media_dir = tmp_path / "media"
+    unzip_file(
+        archive,
+        tmp_path / "unused",
+        extractor=ParallelZipExtractor(workers=2),
+        member_path=lambda name: media_dir / name.replace(":", ""),
+    )
+    assert (media_dir / "ab.flac").read_bytes() == b"data"
+    assert not (tmp_path / "unused").exists()
+
+
+def test_corrupt_member_extracts_nothing(tmp_path):
+    members = _members()
+    archive = _build_zip(tmp_path / "album.zip", members)
+    data = bytearray(archive.read_bytes())
+    # Corrupt the compressed data of the first member
+    data[200] ^= 0xFF
+    archive.write_bytes(bytes(data))
+    extractor = ParallelZipExtractor(workers=3)
+    with pytest.raises(DownloadInvalidArchive):
+        unzip_file(archive, tmp_path / "out", extractor=extractor)
+    extractor.close()
+    assert not any((tmp_path / "out").iterdir())
+    assert extractor.archives == 0
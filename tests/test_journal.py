@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+from time import time
+
+import pytest
+
+from bandcampsync.aio import download_file_async, new_async_session
+from bandcampsync.download import (
+    DownloadInterrupted,
+    download_file,
+)
+from bandcampsync.journal import DownloadJournal, PartialDownload, parse_content_range
+from bandcampsync.sessions import SessionPool
+from tests.mockserver import MockBandcampConfig, MockBandcampServer
+
+
+@pytest.fixture
+def server():
+    config = MockBandcampConfig(items=1, track_ratio=1.0, file_size=512 * 1024)
+    with MockBandcampServer(config) as server:
+        yield server
+
+
+def _file_url(server):
+    return f"{server.url}/download/track?enc=flac&id=1000&sig=mocksig&ts=1.0"
+
+
+def _payload(server):
+    return server.state.payload(True, "flac")
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 100-199/1000") == (100, 199, 1000)
+    assert parse_content_range("bytes 0-9/*") == (0, 9, None)
+    assert parse_content_range("bytes */1000") is None
+    assert parse_content_range(None) is None
+
+
+def test_journal_never_claims_more_than_the_file(tmp_path):
+    partial = PartialDownload(tmp_path / "1-flac.part")
+    with partial.open() as f:
+        partial.start("https://example.com/file", 1000, "audio/flac")
+        f.write(b"x" * 600)
+        partial.written(600, f)
+        partial.sync(f)
+    journal = json.loads(partial.journal_path.read_text())
+    assert journal["bytes_written"] == 600
+    assert journal["length"] == 1000
+
+    # The file lost data that the journal had recorded, such as after a crash
+    os.truncate(partial.path, 400)
+    reloaded = PartialDownload(tmp_path / "1-flac.part")
+    assert reloaded.resume_offset == 400
+    assert reloaded.range_headers() == {"Range": "bytes=400-"}
+    with reloaded.open() as f:
+        assert f.tell() == 400
+
+
+def test_range_headers_prefer_strong_etag(tmp_path):
+    partial = PartialDownload(tmp_path / "1-flac.part")
+    partial.length = 1000
+    partial.bytes_written = 10
+    partial.last_modified = "Mon, 02 Feb 2026 10:00:00 GMT"
+    partial.etag = '"abc"'
+    assert partial.range_headers()["If-Range"] == '"abc"'
+    partial.etag = 'W/"abc"'
+    assert partial.range_headers()["If-Range"] == partial.last_modified
+
+
+def test_check_resumed(tmp_path):
+    partial = PartialDownload(tmp_path / "1-flac.part")
+    partial.length = 1000
+    assert partial.check_resumed("bytes 400-999/1000", 400, 600) is None
+    assert "starts at 0" in partial.check_resumed("bytes 0-999/1000", 400)
+    assert "total length" in partial.check_resumed("bytes 400-1999/2000", 400)
+    assert "invalid" in partial.check_resumed(None, 400)
+
+
+def test_pending_and_prune(tmp_path):
+    journal = DownloadJournal(tmp_path / "partial")
+    partial = journal.partial(1, "mp3-v0")
+    with partial.open() as f:
+        partial.start("https://example.com/file", 100, "audio/mpeg")
+        f.write(b"x" * 10)
+        partial.written(10, f)
+        partial.sync(f)
+    assert [p.path.name for p in journal.pending()] == ["1-mp3-v0.part"]
+
+    stale = time() - DownloadJournal.MAX_AGE - 60
+    for path in (partial.path, partial.journal_path):
+        os.utime(path, (stale, stale))
+    assert journal.prune() == 2
+    assert journal.pending() == []
+
+
+def test_download_file_resumes_after_interruption(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    session_pool = SessionPool()
+    server.state.config.interrupt_rate = 1.0
+    with partial.open() as f, pytest.raises(DownloadInterrupted):
+        download_file(_file_url(server), f, session_pool=session_pool, partial=partial)
+    payload = _payload(server)
+    assert 0 < partial.bytes_written < len(payload)
+    assert partial.etag
+
+    server.state.config.interrupt_rate = 0.0
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    with partial.open() as f:
+        content_type = download_file(
+            _file_url(server), f, session_pool=session_pool, partial=partial
+        )
+    assert content_type == "audio/flac"
+    assert partial.path.read_bytes() == payload
+    assert partial.complete
+    assert server.stats()["requests"]["file_range"] == 1
+
+
+def test_download_file_restarts_when_file_changed(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    with partial.open() as f:
+        partial.start(_file_url(server), len(_payload(server)), "audio/flac")
+        f.write(b"stale data")
+        partial.written(10, f)
+        partial.etag = '"changed"'
+        partial.sync(f)
+        download_file(_file_url(server), f, partial=partial)
+    # If-Range did not match so the whole file was sent again
+    assert partial.path.read_bytes() == _payload(server)
+    assert "file_range" not in server.stats()["requests"]
+
+
+def test_download_file_restarts_mismatched_range(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    with partial.open() as f:
+        # A different length means the range sent back is not the expected one
+        partial.start(_file_url(server), len(_payload(server)) + 10, "audio/flac")
+        f.write(b"x" * 100)
+        partial.written(100, f)
+        partial.sync(f)
+        assert download_file(_file_url(server), f, partial=partial) == "audio/flac"
+    assert partial.path.read_bytes() == _payload(server)
+    assert partial.complete
+    requests = server.stats()["requests"]
+    assert requests["file_range"] == 1
+    assert requests["file"] == 2
+
+
+def test_complete_partial_is_not_downloaded_again(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    with partial.open() as f:
+        download_file(_file_url(server), f, partial=partial)
+    with partial.open() as f:
+        assert download_file(_file_url(server), f, partial=partial) == "audio/flac"
+    assert server.stats()["requests"]["file"] == 1
+
+
+def test_download_file_async_resumes(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+
+    async def run():
+        async with new_async_session() as session:
+            with partial.open() as f:
+                return await download_file_async(
+                    _file_url(server), f, session, write_size=64 * 1024, partial=partial
+                )
+
+    server.state.config.interrupt_rate = 1.0
+    with pytest.raises(DownloadInterrupted):
+        asyncio.run(run())
+    assert partial.bytes_written > 0
+
+    server.state.config.interrupt_rate = 0.0
+    assert asyncio.run(run()) == "audio/flac"
+    assert partial.path.read_bytes() == _payload(server)
+    assert server.stats()["requests"]["file_range"] == 1
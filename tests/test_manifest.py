@@ -0,0 +1,118 @@
+import hashlib
+import os
+
+from bandcampsync.manifest import (
+    AlbumManifest,
+    LibraryVerifier,
+    StreamHasher,
+    hash_file,
+)
+
+
+def _album(media_dir, item_id=123, files=None):
+    album_dir = media_dir / "Artist" / f"Album {item_id}"
+    album_dir.mkdir(parents=True)
+    files = files or {"01 - Track.flac": b"one" * 1000, "cover.jpg": b"jpeg"}
+    manifest = AlbumManifest(album_dir, item_id=item_id)
+    for name, data in files.items():
+        (album_dir / name).write_bytes(data)
+        manifest.add(album_dir / name, hashlib.sha256(data).hexdigest())
+    manifest.save()
+    return album_dir
+
+
+def test_hash_file(tmp_path):
+    (tmp_path / "file").write_bytes(b"data" * 1000)
+    assert hash_file(tmp_path / "file") == (
+        4000,
+        hashlib.sha256(b"data" * 1000).hexdigest(),
+    )
+
+
+def test_stream_hasher():
+    hasher = StreamHasher()
+    hasher.feed(b"da")
+    hasher.feed(memoryview(b"ta"))
+    assert hasher.size == 4
+    assert hasher.hexdigest() == hashlib.sha256(b"data").hexdigest()
+    hasher.abort("resumed")
+    assert hasher.hexdigest() is None
+
+
+def test_manifest_round_trip(tmp_path):
+    album_dir = _album(tmp_path)
+    manifest = AlbumManifest.load(album_dir)
+    assert manifest.item_id == 123
+    assert sorted(manifest.files) == ["01 - Track.flac", "cover.jpg"]
+    entry = manifest.files["cover.jpg"]
+    assert entry["size"] == 4
+    assert entry["sha256"] == hashlib.sha256(b"jpeg").hexdigest()
+    # Files without a known digest are hashed
+    (album_dir / "extra.txt").write_bytes(b"extra")
+    manifest.add(album_dir / "extra.txt")
+    assert manifest.files["extra.txt"]["sha256"] == hashlib.sha256(b"extra").hexdigest()
+
+
+def test_invalid_manifest_is_ignored(tmp_path):
+    assert AlbumManifest.load(tmp_path) is None
+    (tmp_path / AlbumManifest.MANIFEST_FILENAME).write_text("{not json")
+    assert AlbumManifest.load(tmp_path) is None
+    (tmp_path / AlbumManifest.MANIFEST_FILENAME).write_text('{"version": 99}')
+    assert AlbumManifest.load(tmp_path) is None
+
+
+def test_verify_only_hashes_changed_files(tmp_path, monkeypatch):
+    album_dir = _album(tmp_path)
+    manifest = AlbumManifest.load(album_dir)
+    hashed = []
+    monkeypatch.setattr(
+        "bandcampsync.manifest.hash_file",
+        lambda path, bucket=None: hashed.append(path.name) or hash_file(path),
+    )
+    assert manifest.verify() == []
+    assert hashed == []
+
+    # A touched file with the same content is hashed and its new mtime recorded
+    track = album_dir / "01 - Track.flac"
+    stat = track.stat()
+    os.utime(track, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.verify() == []
+    assert hashed == ["01 - Track.flac"]
+    assert manifest.files["01 - Track.flac"]["mtime_ns"] == stat.st_mtime_ns + 10**9
+    assert manifest.verify() == []
+    assert hashed == ["01 - Track.flac"]
+
+
+def test_verify_finds_damaged_files(tmp_path):
+    album_dir = _album(tmp_path)
+    manifest = AlbumManifest.load(album_dir)
+    track = album_dir / "01 - Track.flac"
+    stat = track.stat()
+    track.write_bytes(b"two" * 1000)
+    os.utime(track, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    (album_dir / "cover.jpg").unlink()
+    assert manifest.verify() == [
+        "01 - Track.flac: sha256 does not match",
+        "cover.jpg: missing",
+    ]
+    with open(track, "r+b") as f:
+        f.truncate(10)
+    assert manifest.verify()[0] == "01 - Track.flac: size is 10, expected 3000"
+
+
+def test_library_verifier(tmp_path):
+    _album(tmp_path, item_id=1)
+    damaged_dir = _album(tmp_path, item_id=2)
+    (tmp_path / "Artist" / "No Manifest").mkdir()
+    (tmp_path / ".bandcampsync-partial").mkdir()
+    (damaged_dir / "cover.jpg").unlink()
+
+    verifier = LibraryVerifier(tmp_path, workers=2, rate=100)
+    damaged = verifier.run()
+    assert list(damaged) == [2]
+    assert damaged[2] == (damaged_dir, ["cover.jpg: missing"])
+    assert verifier.stats.albums == 2
+    assert verifier.stats.skipped_files == 3
+    # Intact items have their verification time recorded
+    assert AlbumManifest.load(tmp_path / "Artist" / "Album 1").verified_at
+    assert AlbumManifest.load(damaged_dir).verified_at is None
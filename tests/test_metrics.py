@@ -0,0 +1,87 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bandcampsync.metrics import MetricsRegistry, MetricsServer
+
+
+def _registry():
+    registry = MetricsRegistry()
+    requests = registry.counter(
+        "test_requests_total", "Requests by endpoint", ("endpoint", "status")
+    )
+    depth = registry.gauge("test_queue_depth", "Queue depth")
+    latency = registry.histogram(
+        "test_latency_seconds", "Latency", ("endpoint",), buckets=(0.1, 1)
+    )
+    return registry, requests, depth, latency
+
+
+def test_render():
+    registry, requests, depth, latency = _registry()
+    requests.inc(endpoint="collection_items", status=200)
+    requests.inc(2, endpoint="collection_items", status=200)
+    requests.inc(endpoint='a "quoted"\nname', status="error")
+    depth.set(5)
+    depth.dec()
+    latency.observe(0.05, endpoint="index")
+    latency.observe(0.5, endpoint="index")
+    latency.observe(3, endpoint="index")
+
+    assert requests.get(endpoint="collection_items", status=200) == 3
+    assert latency.get(endpoint="index") == 3
+    assert registry.render().splitlines() == [
+        "# HELP test_requests_total Requests by endpoint",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{endpoint="a \\"quoted\\"\\nname",status="error"} 1',
+        'test_requests_total{endpoint="collection_items",status="200"} 3',
+        "# HELP test_queue_depth Queue depth",
+        "# TYPE test_queue_depth gauge",
+        "test_queue_depth 4",
+        "# HELP test_latency_seconds Latency",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{endpoint="index",le="0.1"} 1',
+        'test_latency_seconds_bucket{endpoint="index",le="1"} 2',
+        'test_latency_seconds_bucket{endpoint="index",le="+Inf"} 3',
+        'test_latency_seconds_sum{endpoint="index"} 3.55',
+        'test_latency_seconds_count{endpoint="index"} 3',
+    ]
+
+
+def test_invalid_use():
+    registry, requests, depth, latency = _registry()
+    with pytest.raises(ValueError):
+        requests.inc(endpoint="index")
+    with pytest.raises(ValueError):
+        requests.inc(-1, endpoint="index", status=200)
+    with pytest.raises(ValueError):
+        registry.gauge("test_queue_depth", "Registered twice")
+
+
+def test_write_textfile(tmp_path):
+    registry, requests, depth, latency = _registry()
+    depth.set(2)
+    path = tmp_path / "bandcampsync.prom"
+    path.write_text("old")
+    registry.write_textfile(path)
+    assert path.read_text() == registry.render()
+    assert "test_queue_depth 2\n" in path.read_text()
+    # Only the metrics file is left in the directory
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_metrics_server():
+    registry, requests, depth, latency = _registry()
+    depth.set(7)
+    server = MetricsServer(0, address="127.0.0.1", registry=registry).start()
+    try:
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert response.read().decode() == registry.render()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}/missing", timeout=5)
+        assert e.value.code == 404
+    finally:
+        server.stop()
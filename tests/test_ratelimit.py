@@ -0,0 +1,269 @@
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+from bandcampsync.bandcamp import Bandcamp, BandcampRateLimited
+from bandcampsync.download import DownloadRateLimited, download_file
+from bandcampsync.ratelimit import (
+    BandwidthLimiter,
+    BandwidthSchedule,
+    RateLimiter,
+    TokenBucket,
+    parse_bandwidth,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    fake_clock = FakeClock()
+    with (
+        patch("bandcampsync.ratelimit.monotonic", fake_clock.monotonic),
+        patch("bandcampsync.ratelimit.sleep", fake_clock.sleep),
+    ):
+        yield fake_clock
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Responses are popped from the front of the list, the last one is repeated
+    responses = []
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if len(self.responses) > 1:
+            status, headers, body = self.responses.pop(0)
+        else:
+            status, headers, body = self.responses[0]
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubHandler.responses = []
+    StubHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("30") == 30.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-5") == 0.0
+    assert parse_retry_after("") is None
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=120)
+    assert 115 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 120
+    retry_at = datetime.now(timezone.utc) - timedelta(seconds=120)
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == 0.0
+
+
+def test_token_bucket_unlimited(clock):
+    bucket = TokenBucket()
+    assert bucket.unlimited
+    for _ in range(100):
+        assert bucket.acquire() == 0.0
+    assert clock.sleeps == []
+
+
+def test_token_bucket_spaces_requests(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    # The initial burst is available immediately
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    # Then requests are spaced out at the rate
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+    # Tokens refill while idle, but never above the burst size
+    clock.now += 60
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_token_bucket_reservations_are_first_come_first_served(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert bucket.reserve() == pytest.approx(3.0)
+
+
+def test_token_bucket_set_rate(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.acquire()
+    bucket.set_rate(0)
+    assert bucket.unlimited
+    assert bucket.acquire() == 0.0
+    bucket.set_rate(10)
+    assert bucket.burst == 10
+
+
+def test_rate_limiter_budgets_are_separate(clock):
+    limiter = RateLimiter(api_rate=1, download_rate=None)
+    assert limiter.wait("api") == 0.0
+    assert limiter.wait("api") == pytest.approx(1.0)
+    for _ in range(10):
+        assert limiter.wait("download") == 0.0
+
+
+def test_rate_limiter_retry_after_pauses_all_budgets(clock):
+    limiter = RateLimiter()
+    assert limiter.update(200, {}) is False
+    assert limiter.update(429, {"Retry-After": "30"}) is True
+    assert limiter.backoff_remaining() == pytest.approx(30.0)
+    assert limiter.wait("download") == pytest.approx(30.0)
+    assert limiter.wait("api") == 0.0
+    assert limiter.throttled_count == 1
+
+
+def test_rate_limiter_exponential_backoff_without_retry_after(clock):
+    limiter = RateLimiter()
+    limiter.update(503, {})
+    assert limiter.backoff_remaining() == pytest.approx(RateLimiter.BACKOFF_INITIAL)
+    limiter.update(503, {})
+    assert limiter.backoff_remaining() == pytest.approx(RateLimiter.BACKOFF_INITIAL * 2)
+    for _ in range(20):
+        limiter.update(429, None)
+    assert limiter.backoff_remaining() == pytest.approx(RateLimiter.BACKOFF_MAX)
+    # A successful response resets the backoff growth
+    clock.now += RateLimiter.BACKOFF_MAX
+    limiter.update(200, {})
+    limiter.update(429, {})
+    assert limiter.backoff_remaining() == pytest.approx(RateLimiter.BACKOFF_INITIAL)
+
+
+def test_rate_limiter_shorter_retry_after_does_not_shorten_backoff(clock):
+    limiter = RateLimiter()
+    limiter.update(429, {"Retry-After": "60"})
+    limiter.update(429, {"Retry-After": "5"})
+    assert limiter.backoff_remaining() == pytest.approx(60.0)
+
+
+def test_rate_limiter_clamps_long_retry_after(clock, caplog):
+    limiter = RateLimiter()
+    limiter.update(429, {"Retry-After": "86400"})
+    assert limiter.backoff_remaining() == pytest.approx(RateLimiter.BACKOFF_MAX)
+    assert "longer than the maximum backoff" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("0", 0),
+        ("", 0),
+        ("1048576", 1048576),
+        ("2MB", 2 * 1024 * 1024),
+        ("512K", 512 * 1024),
+        ("1.5mb/s", 1.5 * 1024 * 1024),
+        ("1G", 1024**3),
+    ],
+)
+def test_parse_bandwidth(value, expected):
+    assert parse_bandwidth(value) == expected
+
+
+@pytest.mark.parametrize("spec", ["fast", "01:00=0", "01:00-25:00=0", "1-2=0"])
+def test_bandwidth_schedule_invalid(spec):
+    with pytest.raises(ValueError):
+        BandwidthSchedule.parse(spec)
+
+
+def test_bandwidth_schedule():
+    schedule = BandwidthSchedule.parse("01:00-07:00=0, 22:30-01:00=1MB")
+    at = lambda hour, minute=0: datetime(2026, 1, 1, hour, minute)  # noqa: E731
+    assert schedule.bandwidth_at(at(3), default=5) == 0
+    assert schedule.bandwidth_at(at(7), default=5) == 5
+    assert schedule.bandwidth_at(at(22, 30), default=5) == 1024 * 1024
+    assert schedule.bandwidth_at(at(0, 59), default=5) == 1024 * 1024
+    assert not BandwidthSchedule.parse("")
+
+
+def test_bandwidth_limiter_follows_schedule(clock):
+    now = [datetime(2026, 1, 1, 6, 59)]
+    limiter = BandwidthLimiter(
+        1000, BandwidthSchedule.parse("01:00-07:00=0"), clock=lambda: now[0]
+    )
+    assert limiter.reserve(10**9) == 0
+    # The schedule is only checked again after CHECK_SECONDS
+    now[0] = datetime(2026, 1, 1, 7, 0)
+    assert limiter.reserve(10**9) == 0
+    clock.now += BandwidthLimiter.CHECK_SECONDS
+    limiter.reserve(64 * 1024)
+    assert limiter.reserve(1000) == pytest.approx(1.0)
+
+
+def test_rate_limiter_bandwidth_is_shared(clock):
+    limiter = RateLimiter(bandwidth=BandwidthLimiter(100 * 1024))
+    # The burst is used up, then each chunk waits its turn behind the others
+    assert limiter.throttle(64 * 1024) == 0
+    waits = [limiter.throttle(10 * 1024) for _ in range(4)]
+    assert waits == pytest.approx([0.1] * 4)
+    assert clock.now == pytest.approx(1000.4)
+    assert RateLimiter().throttle(10**9) == 0
+
+
+def test_download_file_backs_off_on_stub_server(stub_server, clock):
+    server, base_url = stub_server
+    StubHandler.responses = [
+        (429, {"Retry-After": "7"}, b""),
+        (200, {"Content-Type": "application/zip"}, b"PK\x03\x04data"),
+    ]
+    limiter = RateLimiter()
+    with pytest.raises(DownloadRateLimited):
+        download_file(f"{base_url}/file", BytesIO(), rate_limiter=limiter)
+    assert limiter.throttled_count == 1
+    target = BytesIO()
+    content_type = download_file(f"{base_url}/file", target, rate_limiter=limiter)
+    assert content_type == "application/zip"
+    assert target.getvalue() == b"PK\x03\x04data"
+    assert clock.sleeps == [pytest.approx(7.0)]
+    assert StubHandler.requests == ["/file", "/file"]
+
+
+def test_bandcamp_request_backs_off_on_stub_server(stub_server, clock):
+    server, base_url = stub_server
+    StubHandler.responses = [
+        (503, {}, b""),
+        (200, {"Content-Type": "application/json"}, b'{"ok": true}'),
+    ]
+    limiter = RateLimiter(api_rate=100)
+    bandcamp = Bandcamp("identity=test", rate_limiter=limiter)
+    with pytest.raises(BandcampRateLimited):
+        bandcamp._request("get", f"{base_url}/api", is_json=True)
+    assert bandcamp._request("get", f"{base_url}/api", is_json=True) == {"ok": True}
+    assert clock.sleeps == [pytest.approx(RateLimiter.BACKOFF_INITIAL)]
@@ -0,0 +1,56 @@
+import asyncio
+
+from bandcampsync.bandcamp import BandcampError
+from bandcampsync.download import DownloadBadStatusCode
+from bandcampsync.retry import Backoff, DownloadSlots, RetryPolicy
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    backoff = Backoff(5, 60, factor=2, jitter=lambda: 1.0)
+    assert [backoff.delay(attempt) for attempt in range(6)] == [5, 10, 20, 40, 60, 60]
+    # The jitter picks a delay between half of the backoff and all of it
+    backoff = Backoff(5, 60, factor=2, jitter=lambda: 0.0)
+    assert [backoff.delay(attempt) for attempt in range(3)] == [2.5, 5, 10]
+
+
+def test_retry_policy_backs_off_by_error_class():
+    policy = RetryPolicy(
+        [
+            (DownloadBadStatusCode, Backoff(5, 300, factor=2, jitter=lambda: 1.0)),
+            (BandcampError, Backoff(5, 300, factor=4, jitter=lambda: 1.0)),
+        ],
+        default=Backoff(1, 1, jitter=lambda: 1.0),
+    )
+    assert policy.delay(DownloadBadStatusCode("502"), 2) == 20
+    assert policy.delay(BandcampError("503"), 2) == 80
+    assert policy.delay(ValueError("other"), 2) == 1
+
+
+def test_download_slots_give_retries_the_next_free_slot():
+    started = []
+
+    async def run():
+        slots = DownloadSlots(1)
+        await slots.acquire()
+
+        async def sync(name, priority):
+            await slots.acquire(priority)
+            started.append(name)
+            slots.release()
+
+        waiting = [
+            asyncio.create_task(sync("new 1", DownloadSlots.PRIORITY_NEW)),
+            asyncio.create_task(sync("new 2", DownloadSlots.PRIORITY_NEW)),
+            asyncio.create_task(sync("retry", DownloadSlots.PRIORITY_RETRY)),
+        ]
+        await asyncio.sleep(0)
+        # A cancelled waiter does not take a slot
+        cancelled = asyncio.create_task(sync("cancelled", DownloadSlots.PRIORITY_RETRY))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        slots.release()
+        await asyncio.gather(*waiting)
+        assert slots.free == 1
+
+    asyncio.run(run())
+    assert started == ["retry", "new 1", "new 2"]
@@ -0,0 +1,15 @@
+from bandcampsync.schedule import estimate_makespan, largest_first
+
+
+def test_estimate_makespan():
+    assert estimate_makespan([], 2) == 0
+    assert estimate_makespan([5, 5, 5, 5], 2) == 10
+    # The large item starts last and finishes after everything else
+    assert estimate_makespan([1, 1, 1, 1, 4], 2) == 6
+    assert estimate_makespan([4, 1, 1, 1, 1], 2) == 4
+    assert estimate_makespan([3, None, 2], 1) == 5
+
+
+def test_largest_first_keeps_order_of_ties():
+    entries = [("a", 1), ("b", 5), ("c", None), ("d", 5), ("e", 2)]
+    assert [item for item, size in largest_first(entries)] == ["b", "d", "e", "a", "c"]
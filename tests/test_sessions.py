@@ -0,0 +1,130 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from bandcampsync.download import (
+    DownloadBadStatusCode,
+    DownloadExpired,
+    DownloadInvalidContentType,
+    download_file,
+)
+from bandcampsync.sessions import SessionPool
+
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+FILE_BODY = b"PK\x03\x04" + b"x" * 200000
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        if self.path == "/file":
+            status, content_type, body = 200, "application/zip", FILE_BODY
+        elif self.path == "/expired":
+            body = (DATA_DIR / "download-expired.html").read_bytes()
+            status, content_type = 200, "text/html; charset=utf-8"
+        else:
+            status, content_type, body = 404, "text/plain", b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    KeepAliveHandler.client_ports = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_host_group():
+    assert SessionPool.host_group("https://bandcamp.com/") == "bandcamp"
+    assert (
+        SessionPool.host_group("https://popplers5.bandcamp.com/download/album?id=1")
+        == "bandcamp"
+    )
+    assert SessionPool.host_group("https://p4.bcbits.com/download/album/1") == "cdn"
+    assert SessionPool.host_group("https://notbandcamp.com/") == "cdn"
+
+
+def test_idle_sessions_are_limited_to_pool_size():
+    pool = SessionPool(size=2)
+    url = "https://p4.bcbits.com/file"
+    sessions = [pool.checkout(url) for _ in range(3)]
+    assert len({id(s) for s in sessions}) == 3
+    assert [pool.checkin(s) for s in sessions] == [True, True, False]
+    assert pool.checkout(url) is sessions[1]
+    assert pool.checkout(url) is sessions[0]
+    # A different host group does not take idle sessions from another group
+    assert pool.checkout("https://bandcamp.com/") not in sessions
+    pool.close()
+
+
+def test_download_file_reuses_connection(server_url):
+    pool = SessionPool(size=1)
+    for _ in range(3):
+        target = BytesIO()
+        content_type = download_file(
+            f"{server_url}/file", target, session_pool=pool, logevery=0
+        )
+        assert content_type == "application/zip"
+        assert target.getvalue() == FILE_BODY
+    assert len(set(KeepAliveHandler.client_ports)) == 1
+    assert pool.stats() == {
+        "sessions": 1,
+        "requests": 3,
+        "new_connections": 1,
+        "reused_connections": 2,
+    }
+    pool.close()
+
+
+def test_download_file_without_pool_uses_new_connections(server_url):
+    for _ in range(2):
+        download_file(f"{server_url}/file", BytesIO(), logevery=0)
+    assert len(set(KeepAliveHandler.client_ports)) == 2
+
+
+def test_download_file_bad_status_code(server_url):
+    pool = SessionPool(size=1)
+    target = BytesIO()
+    with pytest.raises(DownloadBadStatusCode):
+        download_file(f"{server_url}/missing", target, session_pool=pool)
+    assert target.getvalue() == b""
+    # The connection is still reused after an error response
+    download_file(f"{server_url}/file", BytesIO(), session_pool=pool)
+    assert pool.stats()["reused_connections"] == 1
+    pool.close()
+
+
+def test_download_file_expired_html(server_url):
+    target = BytesIO()
+    with pytest.raises(DownloadExpired):
+        download_file(f"{server_url}/expired", target, session_pool=SessionPool())
+    assert target.getvalue() == b""
+
+
+def test_download_file_disallowed_content_type(server_url):
+    with pytest.raises(DownloadInvalidContentType):
+        download_file(
+            f"{server_url}/file",
+            BytesIO(),
+            disallow_content_type="application/zip",
+        )
@@ -0,0 +1,111 @@
+import json
+
+from bandcampsync.bandcamp import BandcampItem
+from bandcampsync.snapshot import CollectionSnapshot
+
+
+def _item(item_id, download_url=True, **data):
+    data.setdefault("band_name", f"Artist {item_id}")
+    data.setdefault("item_title", f"Album {item_id}")
+    data.setdefault("token", f"{1700000000 + item_id}:{item_id}:a::")
+    item = BandcampItem({"item_id": item_id, "sale_item_type": "a", **data})
+    if download_url:
+        item.download_url = f"https://bandcamp.com/download?id={item_id}"
+    return item
+
+
+def test_merge_and_persist(tmp_path):
+    snapshot = CollectionSnapshot(tmp_path / "collection.json")
+    assert snapshot.usable is False
+
+    snapshot.set_status(_item(2), CollectionSnapshot.STATUS_DOWNLOADED)
+    snapshot.merge([_item(2), _item(1, download_url=False)])
+    assert snapshot.save() is True
+
+    reloaded = CollectionSnapshot(tmp_path / "collection.json")
+    assert reloaded.usable is True
+    assert [e["item_id"] for e in reloaded.entries] == [2, 1]
+    assert reloaded.counts() == {"downloaded": 1, "unavailable": 1}
+    assert reloaded.has_unknown_items() is False
+    data = json.loads((tmp_path / "collection.json").read_text())
+    assert "folder_suffix" not in data["items"][0]
+    assert "hidden" not in data["items"][0]
+    # Download URLs expire so are not stored
+    assert "download_url" not in data["items"][0]
+    assert data["items"][0]["downloadable"] is True
+
+
+def test_merge_prepends_new_items_and_keeps_statuses(tmp_path):
+    snapshot = CollectionSnapshot(tmp_path / "collection.json")
+    snapshot.set_status(_item(1), CollectionSnapshot.STATUS_DOWNLOADED)
+    snapshot.set_status(_item(2), CollectionSnapshot.STATUS_FAILED)
+    snapshot.merge([_item(2), _item(1)])
+    snapshot.save()
+
+    snapshot = CollectionSnapshot(tmp_path / "collection.json")
+    # Pagination stops at the first known item, which is loaded again
+    snapshot.merge([_item(4), _item(3, hidden=True), _item(2)])
+
+    assert [e["item_id"] for e in snapshot.entries] == [4, 3, 2, 1]
+    assert snapshot.entries_by_id[2]["status"] == "failed"
+    assert snapshot.entries_by_id[3]["hidden"] is True
+    assert snapshot.has_unknown_items() is True
+
+
+def test_unresolved_items(tmp_path):
+    snapshot = CollectionSnapshot(tmp_path / "collection.json")
+    snapshot.set_status(_item(1), CollectionSnapshot.STATUS_DOWNLOADED)
+    snapshot.set_status(_item(2), CollectionSnapshot.STATUS_FAILED)
+    snapshot.set_status(_item(3), CollectionSnapshot.STATUS_PREORDER)
+    snapshot.merge(
+        [_item(4, download_url=False), _item(3), _item(2, url_hints={"slug": "two"})]
+        + [_item(1)]
+    )
+
+    items = snapshot.unresolved_items()
+    assert [item.item_id for item in items] == [3, 2]
+    assert items[1].download_url is None
+    assert items[1].url_hints == {"slug": "two"}
+    assert items[1].token == "1700000002:2:a::"
+
+
+def test_ignores_incompatible_snapshot(tmp_path):
+    path = tmp_path / "collection.json"
+    path.write_text(json.dumps({"version": 99, "complete": True, "items": []}))
+    assert CollectionSnapshot(path).usable is False
+    path.write_text("not json")
+    assert CollectionSnapshot(path).usable is False
+
+
+def test_incomplete_snapshot_is_not_usable(tmp_path):
+    path = tmp_path / "collection.json"
+    path.write_text(
+        json.dumps({"version": 1, "complete": False, "items": [{"item_id": 1}]})
+    )
+    snapshot = CollectionSnapshot(path)
+    assert len(snapshot) == 1
+    assert snapshot.usable is False
+
+
+def test_filtered_items_are_not_unknown(tmp_path):
+    snapshot = CollectionSnapshot(tmp_path / "collection.json")
+    snapshot.set_status(_item(3), CollectionSnapshot.STATUS_DOWNLOADED)
+    snapshot.set_status(_item(2), CollectionSnapshot.STATUS_FILTERED)
+    snapshot.set_status(_item(1), CollectionSnapshot.STATUS_CHECKPOINTED)
+    snapshot.merge([_item(3), _item(2), _item(1)])
+
+    assert snapshot.has_unknown_items() is False
+    # Items older than --until-date are synced again if the date changes
+    assert [item.item_id for item in snapshot.unresolved_items()] == [2]
+
+
+def test_loads_download_urls_from_older_snapshots(tmp_path):
+    path = tmp_path / "collection.json"
+    entries = [
+        {"item_id": 2, "download_url": "https://bandcamp.com/download?id=2&sig=s"},
+        {"item_id": 1},
+    ]
+    path.write_text(json.dumps({"version": 1, "complete": True, "items": entries}))
+    snapshot = CollectionSnapshot(path)
+
+    assert snapshot.entries == [{"item_id": 2, "downloadable": True}, {"item_id": 1}]
@@ -0,0 +1,107 @@
+import io
+import zipfile
+
+import pytest
+
+from bandcampsync.download import DownloadInvalidContentType, download_file
+from bandcampsync.sniff import (
+    KIND_AIFF,
+    KIND_FLAC,
+    KIND_HTML,
+    KIND_MP3,
+    KIND_MP4,
+    KIND_OGG,
+    KIND_WAV,
+    KIND_ZIP,
+    ContentSniffer,
+    sniff,
+)
+from tests.mockserver import MockBandcampConfig, MockBandcampServer
+
+
+def _zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("track.flac", b"fLaC")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "data,kind",
+    [
+        (_zip(), KIND_ZIP),
+        (b"fLaC\x00\x00\x00\x22", KIND_FLAC),
+        (b"OggS\x00\x02", KIND_OGG),
+        (b"RIFF\x24\x00\x00\x00WAVEfmt ", KIND_WAV),
+        (b"FORM\x00\x00\x00\x00AIFFCOMM", KIND_AIFF),
+        (b"\x00\x00\x00\x20ftypM4A \x00\x00", KIND_MP4),
+        (b"\xff\xfb\x90\x00", KIND_MP3),
+        (b"ID3\x04\x00\x00\x00\x00\x00\x02ab\xff\xfb\x90\x00", KIND_MP3),
+        (b"ID3\x04\x00\x00\x00\x00\x00\x02abfLaC", KIND_FLAC),
+        (b"\xef\xbb\xbf\n  <!DOCTYPE html><html>", KIND_HTML),
+        (b"<html><body>error</body></html>", KIND_HTML),
+        # The tag continues past the data so the audio cannot be seen
+        (b"ID3\x04\x00\x00\x00\x00\x7f\x7f", None),
+        (b"\x00\x01\x02\x03", None),
+        (b"", None),
+    ],
+)
+def test_sniff(data, kind):
+    assert sniff(data) == kind
+
+
+def test_sniffer_for_encoding():
+    sniffer = ContentSniffer.for_encoding("flac")
+    sniffer.sniff(_zip())
+    assert sniffer.problem() is None
+    sniffer.sniff(b"fLaC")
+    assert sniffer.problem() is None
+    sniffer.sniff(b"OggS")
+    assert sniffer.problem() == "content is ogg, expected one of: flac, zip"
+    # Unrecognised content and unknown encodings are never a problem
+    sniffer.sniff(b"\x00\x00")
+    assert sniffer.problem() is None
+    unknown = ContentSniffer.for_encoding("opus")
+    unknown.sniff(b"OggS")
+    assert unknown.problem() is None
+
+
+@pytest.fixture
+def server():
+    config = MockBandcampConfig(items=1, track_ratio=1.0, file_size=16 * 1024 * 1024)
+    with MockBandcampServer(config) as server:
+        yield server
+
+
+def _file_url(server, encoding="flac"):
+    return f"{server.url}/download/track?enc={encoding}&id=1000&sig=mocksig&ts=1.0"
+
+
+def test_download_file_sniffs_content(server, tmp_path):
+    sniffer = ContentSniffer.for_encoding("flac")
+    with open(tmp_path / "out", "wb") as f:
+        assert download_file(_file_url(server), f, sniffer=sniffer) == "audio/flac"
+    assert sniffer.kind == KIND_FLAC
+
+
+def test_unexpected_content_fails_fast(server, tmp_path):
+    sniffer = ContentSniffer.for_encoding("wav")
+    with open(tmp_path / "out", "wb") as f:
+        with pytest.raises(DownloadInvalidContentType, match="content is flac"):
+            download_file(_file_url(server), f, sniffer=sniffer)
+    # The request is aborted before the body has been written
+    assert (tmp_path / "out").stat().st_size == 0
+    assert server.stats()["bytes_sent"] < 16 * 1024 * 1024
+
+
+def test_html_served_as_audio_is_rejected(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        server.state,
+        "payload",
+        lambda is_track, encoding: b"<!DOCTYPE html><html><body>oops</body></html>",
+    )
+    sniffer = ContentSniffer.for_encoding("flac")
+    with open(tmp_path / "out", "wb") as f:
+        with pytest.raises(DownloadInvalidContentType, match="HTML page"):
+            download_file(_file_url(server), f, sniffer=sniffer)
+    assert (tmp_path / "out").stat().st_size == 0
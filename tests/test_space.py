@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from bandcampsync.space import DiskSpaceAdmission, DiskSpaceUnavailable
+
+
+MB = 1024 * 1024
+
+
+def test_reserves_space_on_each_filesystem(tmp_path):
+    admission = DiskSpaceAdmission(disk_free=lambda path: 100 * MB)
+    # Both directories are on the same filesystem so their needs are combined, and
+    # directories that do not exist yet are checked on their parent
+    with admission.reserve({tmp_path / "partial": 30 * MB, tmp_path / "new": 30 * MB}):
+        assert list(admission.reserved.values()) == [60 * MB]
+    assert list(admission.reserved.values()) == [0]
+    # Nothing to reserve
+    with admission.reserve({tmp_path: 0}) as reservation:
+        assert reservation.needs == {}
+
+
+def test_item_that_never_fits_fails(tmp_path):
+    admission = DiskSpaceAdmission(headroom=20 * MB, disk_free=lambda path: 100 * MB)
+    with pytest.raises(DiskSpaceUnavailable, match="needs 90.0 MB"):
+        admission.reserve({tmp_path: 90 * MB}, name="item")
+    admission.reserve({tmp_path: 80 * MB}).release()
+
+
+def test_waits_for_space_to_be_released(tmp_path):
+    admission = DiskSpaceAdmission(disk_free=lambda path: 100 * MB)
+    first = admission.reserve({tmp_path: 70 * MB})
+    admitted = threading.Event()
+
+    def reserve_second():
+        with admission.reserve({tmp_path: 50 * MB}):
+            admitted.set()
+
+    thread = threading.Thread(target=reserve_second)
+    thread.start()
+    # The second item waits while the first is using the space
+    assert not admitted.wait(0.2)
+    first.release()
+    assert admitted.wait(5)
+    thread.join(5)
@@ -0,0 +1,78 @@
+import os
+import stat
+from unittest.mock import Mock
+
+from bandcampsync.staging import StagingArea
+
+
+def _stage(staging, files, item_id=1):
+    staged_dir = staging.new_item_dir(Mock(item_id=item_id))
+    for name, data in files.items():
+        path = staged_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return staged_dir
+
+
+def test_publish_renames_the_item_directory(tmp_path):
+    staging = StagingArea(tmp_path)
+    staged_dir = _stage(staging, {"track.flac": b"data", "disc 2/track.flac": b"2"})
+    assert staged_dir.parent == tmp_path / StagingArea.STAGING_DIRNAME
+    inode = staged_dir.stat().st_ino
+
+    local_path = tmp_path / "Artist" / "Album"
+    staging.publish(staged_dir, local_path)
+    # The whole directory appears at once
+    assert local_path.stat().st_ino == inode
+    assert (local_path / "track.flac").read_bytes() == b"data"
+    assert (local_path / "disc 2" / "track.flac").read_bytes() == b"2"
+    assert not staged_dir.exists()
+
+
+def test_publish_merges_into_an_existing_directory(tmp_path):
+    staging = StagingArea(tmp_path)
+    local_path = tmp_path / "Artist" / "Album"
+    (local_path / "disc 2").mkdir(parents=True)
+    (local_path / "cover.jpg").write_bytes(b"old cover")
+    (local_path / "track.flac").write_bytes(b"damaged")
+    (local_path / "disc 2" / "other.flac").write_bytes(b"other")
+
+    staged_dir = _stage(staging, {"track.flac": b"data", "disc 2/track.flac": b"2"})
+    staging.publish(staged_dir, local_path)
+    assert (local_path / "track.flac").read_bytes() == b"data"
+    assert (local_path / "cover.jpg").read_bytes() == b"old cover"
+    assert (local_path / "disc 2" / "track.flac").read_bytes() == b"2"
+    assert (local_path / "disc 2" / "other.flac").read_bytes() == b"other"
+    assert not staged_dir.exists()
+
+
+def test_clean_removes_interrupted_items(tmp_path):
+    staging = StagingArea(tmp_path)
+    assert staging.clean() == 0
+    _stage(staging, {"track.flac": b"data"}, item_id=1)
+    _stage(staging, {"track.flac": b"data"}, item_id=2)
+    assert staging.clean() == 2
+    assert not any(staging.dir_path.iterdir())
+
+
+def test_temp_dir_on_the_same_filesystem_is_used(tmp_path):
+    temp_dir = tmp_path / "temp"
+    temp_dir.mkdir()
+    staging = StagingArea(tmp_path / "media", temp_dir_root=temp_dir)
+    # The media directory does not exist so it can not be compared
+    assert staging.dir_path == tmp_path / "media" / StagingArea.STAGING_DIRNAME
+    (tmp_path / "media").mkdir()
+    staging = StagingArea(tmp_path / "media", temp_dir_root=temp_dir)
+    assert staging.dir_path == temp_dir / StagingArea.STAGING_DIRNAME
+
+
+def test_published_item_follows_the_umask(tmp_path):
+    umask = os.umask(0o022)
+    try:
+        staging = StagingArea(tmp_path)
+        staged_dir = _stage(staging, {"track.flac": b"data"})
+        local_path = tmp_path / "Artist" / "Album"
+        staging.publish(staged_dir, local_path)
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(local_path.stat().st_mode) == 0o755
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import random
+import zipfile
+
+import pytest
+
+from bandcampsync.streamzip import StreamingZipError, StreamingZipExtractor
+
+
+class _Unseekable(io.RawIOBase):
+    """A write only stream, zipfile writes data descriptors to these."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+    def tell(self):
+        raise OSError("not seekable")
+
+
+def _members():
+    data_random = random.Random(1)
+    return {
+        "01 - Track.flac": data_random.randbytes(200 * 1024),
+        "02 - Track.flac": b"silence " * 30000,
+        "cover.jpg": data_random.randbytes(3000),
+        "empty.txt": b"",
+    }
+
+
+def _build_zip(members, streamed=False, compression=zipfile.ZIP_DEFLATED, zip64=False):
+    output = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=compression) as z:
+        for name, data in members.items():
+            with z.open(name, "w", force_zip64=zip64) as f:
+                f.write(data)
+    return bytes(output.data) if streamed else output.getvalue()
+
+
+def _feed(extractor, data, seed=0):
+    # Feed in uneven blocks so records are split between blocks
+    chunk_random = random.Random(seed)
+    position = 0
+    while position < len(data):
+        size = chunk_random.randint(1, 70000)
+        extractor.feed(memoryview(data)[position : position + size])
+        position += size
+
+
+@pytest.mark.parametrize(
+    "streamed,compression,zip64",
+    [
+        (False, zipfile.ZIP_DEFLATED, False),
+        (False, zipfile.ZIP_STORED, False),
+        (True, zipfile.ZIP_DEFLATED, False),
+        (True, zipfile.ZIP_DEFLATED, True),
+        (False, zipfile.ZIP_STORED, True),
+    ],
+)
+def test_extracts_while_feeding(tmp_path, streamed, compression, zip64):
+    members = _members()
+    archive = _build_zip(members, streamed, compression, zip64)
+    dest_dir = tmp_path / "album"
+    extractor = StreamingZipExtractor(dest_dir)
+    _feed(extractor, archive)
+
+    assert extractor.finished
+    assert extractor.extracted_bytes == sum(len(d) for d in members.values())
+    paths = extractor.commit()
+    assert sorted(p.name for p in paths) == sorted(members)
+    for name, data in members.items():
+        assert (dest_dir / name).read_bytes() == data
+    for member in extractor.members:
+        assert member.path == dest_dir / member.name
+        assert (
+            member.hash.hexdigest() == hashlib.sha256(members[member.name]).hexdigest()
+        )
+    # No temporary files are left behind and a later abort does nothing
+    extractor.abort("not needed")
+    assert sorted(p.name for p in dest_dir.iterdir()) == sorted(members)
+
+
+def test_member_path_names_files(tmp_path):
+    archive = _build_zip({"a:b.flac": b"data"})
+    extractor = StreamingZipExtractor(
+        tmp_path, member_path=lambda name: tmp_path / name.replace(":", "")
+    )
+    extractor.feed(archive)
+    extractor.commit()
+    assert (tmp_path / "ab.flac").read_bytes() == b"data"
+
+
+def test_crc_mismatch_stops_extraction(tmp_path):
+    archive = bytearray(_build_zip({"track.flac": b"x" * 5000}, compression=0))
+    archive[100] ^= 0xFF
+    dest_dir = tmp_path / "album"
+    extractor = StreamingZipExtractor(dest_dir)
+    extractor.feed(bytes(archive))
+
+    assert extractor.stopped
+    assert "does not match" in extractor.stop_reason
+    assert not dest_dir.exists()
+    with pytest.raises(StreamingZipError):
+        extractor.commit()
+
+
+def test_stored_member_with_data_descriptor_is_not_streamed(tmp_path):
+    archive = _build_zip(_members(), streamed=True, compression=zipfile.ZIP_STORED)
+    extractor = StreamingZipExtractor(tmp_path / "album")
+    _feed(extractor, archive)
+    assert extractor.stopped
+    assert "unknown size" in extractor.stop_reason
+
+
+def test_subdirectories_are_not_streamed(tmp_path):
+    archive = _build_zip({"disc 1/track.flac": b"data"})
+    extractor = StreamingZipExtractor(tmp_path / "album")
+    extractor.feed(archive)
+    assert extractor.stopped
+    assert not (tmp_path / "album").exists()
+
+
+def test_not_a_zip(tmp_path):
+    extractor = StreamingZipExtractor(tmp_path / "album")
+    extractor.feed(b"fLaC\x00\x00\x00\x22")
+    assert extractor.stopped
+    assert extractor.stop_reason is None
+    extractor.feed(b"more")
+    assert extractor.bytes_fed == 8
+
+
+def test_incomplete_download_is_aborted(tmp_path):
+    archive = _build_zip(_members())
+    dest_dir = tmp_path / "album"
+    extractor = StreamingZipExtractor(dest_dir)
+    extractor.feed(archive[: len(archive) // 2])
+    assert not extractor.finished
+    assert any(dest_dir.iterdir())
+    extractor.abort("download failed")
+    assert not dest_dir.exists()
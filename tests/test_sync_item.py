@@ -1,10 +1,19 @@
 """Tests for Syncer's sync_item functionality and retry logic."""
 
-from unittest.mock import Mock, patch
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, Mock, patch
+
 import pytest
-from bandcampsync.sync import Syncer
+
+from bandcampsync.bandcamp import (
+    BandcampDownloadUnavailable,
+    BandcampError,
+    BandcampRateLimited,
+)
+from bandcampsync.download import DownloadBadStatusCode
 from bandcampsync.options import BandcampSyncOptions
-from bandcampsync.bandcamp import BandcampDownloadUnavailable, BandcampError
+from bandcampsync.sync import ItemSync, Syncer
 
 
 @pytest.fixture
@@ -44,112 +53,157 @@ def syncer(mock_bandcamp, tmp_path):
     return s
 
 
-def test_sync_item_success(syncer, mock_bandcamp, tmp_path):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        download_url="http://example.com/download",
+def _fake_unzip(zip_path, dest_dir, extractor=None, member_path=None):
+    path = member_path("track1.flac")
+    path.write_text("audio data")
+    return [(path, None)]
+
+
+def _item(**attrs):
+    """Returns a mock album purchase, "attrs" override its attributes."""
+    return Mock(
+        **{
+            "is_preorder": False,
+            "band_name": "Artist",
+            "item_title": "Album",
+            "item_id": 1,
+            "item_type": "album",
+            "download_url": "http://example.com/download",
+            **attrs,
+        }
     )
 
-    mock_bandcamp.get_download_file_url.return_value = "http://example.com/file"
+
+def _serve_download(mock_bandcamp, size=None):
+    """Makes the download page and stat check of every item succeed."""
+    mock_bandcamp.get_download_file.return_value = ("http://example.com/file", size)
     mock_bandcamp.check_download_stat.return_value = "http://example.com/file_ok"
 
+
+def test_sync_item_success(syncer, mock_bandcamp, tmp_path):
+    item = _item()
+
+    _serve_download(mock_bandcamp)
+
     with (
         patch("bandcampsync.sync.download_file") as mock_download,
         patch("bandcampsync.sync.is_zip_file", return_value=True),
-        patch("bandcampsync.sync.unzip_file") as mock_unzip,
-        patch("bandcampsync.sync.TemporaryDirectory") as mock_temp_dir,
+        patch("bandcampsync.sync.unzip_file", side_effect=_fake_unzip) as mock_unzip,
     ):
-        # Setup temp directory mock
-        temp_dir_path = tmp_path / "temp_extract"
-        temp_dir_path.mkdir()
-        mock_temp_dir.return_value.__enter__.return_value = str(temp_dir_path)
+        result = syncer.sync_item(item)
+
+        assert result is True
+        assert syncer.new_items_downloaded is True
+        mock_download.assert_called_once()
+        mock_unzip.assert_called_once()
+
+    # The album is assembled in the staging directory then moved into place
+    local_path = syncer.local_media.get_path_for_purchase(item)
+    assert (local_path / "track1.flac").read_text() == "audio data"
+    assert (local_path / "bandcamp_item_id.txt").is_file()
+    assert not any(syncer.staging.dir_path.iterdir())
 
-        # Create a fake file in the temp directory
-        (temp_dir_path / "track1.flac").write_text("audio data")
 
-        with patch("bandcampsync.sync.move_file") as mock_move:
-            result = syncer.sync_item(item)
+def test_sync_item_publishes_with_suffix_added_while_syncing(syncer, mock_bandcamp):
+    item = _item(folder_suffix="")
+    first_path = syncer.local_media.get_path_for_purchase(item)
 
-            assert result is True
-            assert syncer.new_items_downloaded is True
-            mock_download.assert_called_once()
-            mock_unzip.assert_called_once()
-            mock_move.assert_called_once()
+    _serve_download(mock_bandcamp)
+
+    def download_file(*args, **kwargs):
+        # A later purchase with the same artist and title was loaded
+        item.folder_suffix = " [1]"
+
+    with (
+        patch("bandcampsync.sync.download_file", side_effect=download_file),
+        patch("bandcampsync.sync.is_zip_file", return_value=True),
+        patch("bandcampsync.sync.unzip_file", side_effect=_fake_unzip),
+    ):
+        assert syncer.sync_item(item) is True
+
+    # Published where the sync started, then moved once the collection has loaded
+    assert (first_path / "track1.flac").is_file()
+    assert syncer.published_paths[item.item_id] == first_path
+    mock_bandcamp.purchases = [item]
+    syncer._move_suffixed_items()
+    local_path = syncer.local_media.get_path_for_purchase(item)
+    assert local_path.name == "Album [1]"
+    assert (local_path / "track1.flac").is_file()
+    assert not first_path.exists()
+
+
+def test_move_suffixed_items_moves_published_items(syncer, mock_bandcamp):
+    item = _item(folder_suffix="")
+    published_path = syncer.local_media.get_path_for_purchase(item)
+    published_path.mkdir(parents=True)
+    (published_path / "track1.flac").write_text("audio data")
+    syncer.published_paths[item.item_id] = published_path
+    mock_bandcamp.purchases = [item]
+
+    item.folder_suffix = " [1]"
+    syncer._move_suffixed_items()
+
+    local_path = syncer.local_media.get_path_for_purchase(item)
+    assert (local_path / "track1.flac").read_text() == "audio data"
+    assert not published_path.exists()
+    assert syncer.published_paths[item.item_id] == local_path
 
 
 def test_sync_item_retries_and_succeeds(syncer, mock_bandcamp, tmp_path):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        download_url="http://example.com/download",
-    )
+    item = _item()
 
     # Fail once, then succeed
-    mock_bandcamp.get_download_file_url.side_effect = [
+    mock_bandcamp.get_download_file.side_effect = [
         BandcampError("first fail"),
-        "http://example.com/file",
+        ("http://example.com/file", None),
     ]
     mock_bandcamp.check_download_stat.return_value = "http://example.com/file_ok"
 
     with (
         patch("bandcampsync.sync.download_file"),
         patch("bandcampsync.sync.is_zip_file", return_value=True),
-        patch("bandcampsync.sync.unzip_file"),
-        patch("bandcampsync.sync.TemporaryDirectory") as mock_temp_dir,
+        patch("bandcampsync.sync.unzip_file", side_effect=_fake_unzip),
         patch("bandcampsync.sync.time.sleep") as mock_sleep,
     ):
-        temp_dir_path = tmp_path / "temp_extract"
-        temp_dir_path.mkdir()
-        mock_temp_dir.return_value.__enter__.return_value = str(temp_dir_path)
-        (temp_dir_path / "track1.flac").write_text("audio data")
-
-        with patch("bandcampsync.sync.move_file"):
-            result = syncer.sync_item(item)
+        result = syncer.sync_item(item)
 
-            assert result is True
-            assert mock_bandcamp.get_download_file_url.call_count == 2
-            mock_sleep.assert_called_once_with(syncer.retry_wait)
+        assert result is True
+        assert mock_bandcamp.get_download_file.call_count == 2
+        mock_sleep.assert_called_once_with(syncer.retry_wait)
 
 
 def test_sync_item_fails_after_max_retries(syncer, mock_bandcamp):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        download_url="http://example.com/download",
-    )
+    item = _item()
 
     # Always fail
-    mock_bandcamp.get_download_file_url.side_effect = BandcampError("persistent fail")
+    mock_bandcamp.get_download_file.side_effect = BandcampError("persistent fail")
 
     with patch("bandcampsync.sync.time.sleep") as mock_sleep:
         result = syncer.sync_item(item)
 
         assert result is False
-        assert mock_bandcamp.get_download_file_url.call_count == syncer.max_retries
+        assert mock_bandcamp.get_download_file.call_count == syncer.max_retries
         assert mock_sleep.call_count == syncer.max_retries - 1
 
 
+def test_sync_item_rate_limited_retry_skips_retry_wait(syncer, mock_bandcamp):
+    item = _item()
+
+    mock_bandcamp.get_download_file.side_effect = BandcampRateLimited("rate limited")
+
+    with patch("bandcampsync.sync.time.sleep") as mock_sleep:
+        result = syncer.sync_item(item)
+
+    assert result is False
+    assert mock_bandcamp.get_download_file.call_count == syncer.max_retries
+    mock_sleep.assert_not_called()
+    mock_bandcamp.invalidate_item_downloads.assert_not_called()
+
+
 def test_sync_item_does_not_retry_unavailable_download(syncer, mock_bandcamp):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        download_url="http://example.com/download",
-    )
+    item = _item()
 
-    mock_bandcamp.get_download_file_url.side_effect = BandcampDownloadUnavailable(
+    mock_bandcamp.get_download_file.side_effect = BandcampDownloadUnavailable(
         "No downloads listed"
     )
 
@@ -158,51 +212,61 @@ def test_sync_item_does_not_retry_unavailable_download(syncer, mock_bandcamp):
 
     assert result is False
     assert syncer.had_sync_errors is False
-    assert mock_bandcamp.get_download_file_url.call_count == 1
+    assert mock_bandcamp.get_download_file.call_count == 1
+    mock_sleep.assert_not_called()
+
+
+def test_sync_item_does_not_retry_item_that_never_fits(syncer, mock_bandcamp):
+    item = _item()
+    _serve_download(mock_bandcamp, size=600 * 1024 * 1024)
+    syncer.disk_space.disk_free = lambda path: 1000 * 1024 * 1024
+
+    with (
+        patch("bandcampsync.sync.download_file") as mock_download,
+        patch("bandcampsync.sync.time.sleep") as mock_sleep,
+    ):
+        result = syncer.sync_item(item)
+
+    # An album needs space for the zip file and the extracted files
+    assert result is False
+    assert syncer.had_sync_errors is True
+    assert "Not enough disk space" in syncer.sync_errors[0]
+    assert mock_bandcamp.get_download_file.call_count == 1
+    mock_download.assert_not_called()
     mock_sleep.assert_not_called()
+    assert syncer.disk_space.reserved == {}
 
 
 def test_sync_item_track_success(syncer, mock_bandcamp, tmp_path):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="TrackTitle",
-        item_id=1,
-        item_type="track",
-        url_hints={"slug": "track-slug"},
-        download_url="http://example.com/download",
+    item = _item(
+        item_title="TrackTitle", item_type="track", url_hints={"slug": "track-slug"}
     )
 
-    mock_bandcamp.get_download_file_url.return_value = "http://example.com/file"
-    mock_bandcamp.check_download_stat.return_value = "http://example.com/file_ok"
+    _serve_download(mock_bandcamp)
 
     with (
         patch("bandcampsync.sync.download_file"),
         patch("bandcampsync.sync.is_zip_file", return_value=False),
-        patch("bandcampsync.sync.copy_file") as mock_copy,
+        patch("bandcampsync.sync.move_file") as mock_move,
     ):
         result = syncer.sync_item(item)
 
         assert result is True
         assert syncer.new_items_downloaded is True
-        # Check if copy_file was called with expected destination name (using slug)
-        args, _ = mock_copy.call_args
+        # Check if move_file was called with expected destination name (using slug)
+        args, _ = mock_move.call_args
         assert "track-slug.flac" in str(args[1])
 
 
 def test_sync_item_album_audio_file_success(syncer, mock_bandcamp, tmp_path):
-    item = Mock(
-        is_preorder=False,
+    item = _item(
         band_name="Mala x Magugu",
         item_title="MILITANT DON",
         item_id=188280431,
-        item_type="album",
         url_hints={"slug": "militant-don"},
-        download_url="http://example.com/download",
     )
 
-    mock_bandcamp.get_download_file_url.return_value = "http://example.com/file"
-    mock_bandcamp.check_download_stat.return_value = "http://example.com/file_ok"
+    _serve_download(mock_bandcamp)
 
     with (
         patch(
@@ -210,74 +274,52 @@ def test_sync_item_album_audio_file_success(syncer, mock_bandcamp, tmp_path):
             return_value="audio/mpeg",
         ),
         patch("bandcampsync.sync.is_zip_file", return_value=False),
-        patch("bandcampsync.sync.copy_file") as mock_copy,
+        patch("bandcampsync.sync.move_file") as mock_move,
     ):
         result = syncer.sync_item(item, encoding="mp3-320")
 
     assert result is True
     assert syncer.new_items_downloaded is True
-    args, _ = mock_copy.call_args
+    args, _ = mock_move.call_args
     assert "militant-don.mp3" in str(args[1])
 
 
 def test_sync_item_uses_encoding_parameter(syncer, mock_bandcamp):
     """sync_item uses the encoding kwarg, not self.media_format, when provided."""
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        folder_suffix="",
-    )
-    mock_bandcamp.get_download_file_url.side_effect = BandcampError(
-        "stop after first call"
-    )
+    item = _item(folder_suffix="")
+    mock_bandcamp.get_download_file.side_effect = BandcampError("stop after first call")
 
     syncer.sync_item(item, encoding="mp3-320")
 
-    _, kwargs = mock_bandcamp.get_download_file_url.call_args
+    _, kwargs = mock_bandcamp.get_download_file.call_args
     assert kwargs["encoding"] == "mp3-320"
 
 
 def test_sync_item_falls_back_to_media_format_when_no_encoding(syncer, mock_bandcamp):
     """When encoding=None, self.media_format is used as the encoding."""
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        folder_suffix="",
-    )
-    mock_bandcamp.get_download_file_url.side_effect = BandcampError(
-        "stop after first call"
-    )
+    item = _item(folder_suffix="")
+    mock_bandcamp.get_download_file.side_effect = BandcampError("stop after first call")
 
     syncer.sync_item(item)  # no encoding kwarg
 
-    _, kwargs = mock_bandcamp.get_download_file_url.call_args
+    _, kwargs = mock_bandcamp.get_download_file.call_args
     assert kwargs["encoding"] == syncer.media_format  # "flac" from fixture
 
 
 def test_sync_item_continues_if_writing_item_id_fails(syncer, mock_bandcamp):
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
+    item = _item(
         item_title="TrackTitle",
         item_id="",
         item_type="track",
         url_hints={"slug": "track-slug"},
-        download_url="http://example.com/download",
     )
 
-    mock_bandcamp.get_download_file_url.return_value = "http://example.com/file"
-    mock_bandcamp.check_download_stat.return_value = "http://example.com/file_ok"
+    _serve_download(mock_bandcamp)
 
     with (
         patch("bandcampsync.sync.download_file"),
         patch("bandcampsync.sync.is_zip_file", return_value=False),
-        patch("bandcampsync.sync.copy_file"),
+        patch("bandcampsync.sync.move_file"),
         patch.object(
             syncer.local_media,
             "write_bandcamp_id",
@@ -312,15 +354,7 @@ def test_sync_item_dry_run_no_side_effects(mock_bandcamp, tmp_path):
             coro = mock_run.call_args[0][0]
             coro.close()
 
-    item = Mock(
-        is_preorder=False,
-        band_name="Artist",
-        item_title="Album",
-        item_id=1,
-        item_type="album",
-        folder_suffix="",
-        download_url="http://example.com/download",
-    )
+    item = _item(folder_suffix="")
 
     with patch("bandcampsync.sync.download_file") as mock_download:
         result = syncer.sync_item(item)
@@ -328,3 +362,244 @@ def test_sync_item_dry_run_no_side_effects(mock_bandcamp, tmp_path):
     assert result is False
     assert syncer.new_items_downloaded is False
     assert not mock_download.called
+
+
+def test_async_sync_item_success(syncer, mock_bandcamp):
+    item = _item()
+    syncer.async_bandcamp = Mock()
+    syncer.async_bandcamp.get_download_file = AsyncMock(
+        return_value=("http://example.com/file", None)
+    )
+    syncer.async_bandcamp.check_download_stat = AsyncMock(
+        return_value="http://example.com/file_ok"
+    )
+
+    async def run():
+        syncer.executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            return await syncer.async_sync_item(item)
+        finally:
+            syncer.executor.shutdown()
+
+    with (
+        patch(
+            "bandcampsync.sync.download_file_async",
+            new=AsyncMock(return_value="application/zip"),
+        ) as mock_download,
+        patch.object(syncer, "_install_download", return_value=True) as mock_install,
+    ):
+        result = asyncio.run(run())
+
+    assert result is True
+    assert mock_download.call_args[0][0] == "http://example.com/file_ok"
+    mock_install.assert_called_once()
+    mock_bandcamp.get_download_file.assert_not_called()
+
+
+def test_async_sync_item_retries_with_async_sleep(syncer, mock_bandcamp):
+    item = _item()
+    syncer.async_bandcamp = Mock()
+    syncer.async_bandcamp.get_download_file = AsyncMock(
+        side_effect=BandcampError("persistent fail")
+    )
+
+    with (
+        patch("bandcampsync.sync.time.sleep") as mock_sleep,
+        patch("bandcampsync.sync.asyncio.sleep", new=AsyncMock()) as mock_async_sleep,
+    ):
+        result = asyncio.run(syncer.async_sync_item(item))
+
+    assert result is False
+    assert syncer.async_bandcamp.get_download_file.await_count == 2
+    mock_async_sleep.assert_awaited_once_with(syncer.retry_wait)
+    mock_sleep.assert_not_called()
+    assert syncer.had_sync_errors is True
+
+
+def test_thread_engine_executor_follows_concurrency(syncer):
+    syncer.concurrency = 64
+    assert syncer._executor_workers() == 64
+    syncer.engine = "async"
+    assert syncer._executor_workers() <= 64
+
+
+def test_sync_item_retries_only_the_failed_transfer(syncer, mock_bandcamp):
+    syncer.max_retries = 3
+    _serve_download(mock_bandcamp)
+
+    with (
+        patch(
+            "bandcampsync.sync.download_file",
+            side_effect=[DownloadBadStatusCode("502"), "application/zip"],
+        ) as mock_download,
+        patch.object(syncer, "_install_download", return_value=True),
+        patch("bandcampsync.sync.time.sleep"),
+    ):
+        result = syncer.sync_item(_item())
+
+    assert result is True
+    assert mock_download.call_count == 2
+    # The download page and stat check are not repeated
+    assert mock_bandcamp.get_download_file.call_count == 1
+    assert mock_bandcamp.check_download_stat.call_count == 1
+    mock_bandcamp.invalidate_item_downloads.assert_not_called()
+
+
+def test_sync_item_starts_over_when_a_stage_fails_twice(syncer, mock_bandcamp):
+    syncer.max_retries = 4
+    _serve_download(mock_bandcamp)
+
+    with (
+        patch(
+            "bandcampsync.sync.download_file",
+            side_effect=[
+                DownloadBadStatusCode("403"),
+                DownloadBadStatusCode("403"),
+                "application/zip",
+            ],
+        ),
+        patch.object(syncer, "_install_download", return_value=True),
+        patch("bandcampsync.sync.time.sleep"),
+    ):
+        result = syncer.sync_item(_item())
+
+    assert result is True
+    assert mock_bandcamp.get_download_file.call_count == 2
+    mock_bandcamp.invalidate_item_downloads.assert_called_once()
+
+
+def test_sync_item_install_retry_that_succeeds_is_not_an_error(syncer, mock_bandcamp):
+    syncer.max_retries = 3
+    _serve_download(mock_bandcamp)
+
+    with (
+        patch("bandcampsync.sync.download_file"),
+        patch("bandcampsync.sync.is_zip_file", return_value=True),
+        patch("bandcampsync.sync.unzip_file", side_effect=_fake_unzip),
+        patch.object(
+            syncer.staging, "publish", side_effect=[OSError("busy"), None]
+        ) as mock_publish,
+    ):
+        assert syncer.sync_item(_item()) is True
+
+    assert mock_publish.call_count == 2
+
+    assert syncer.had_sync_errors is False
+
+    with (
+        patch("bandcampsync.sync.download_file", return_value="application/zip"),
+        patch.object(syncer, "_install_download", return_value=None) as mock_install,
+    ):
+        assert syncer.sync_item(_item()) is False
+
+    # Only the item's last failed attempt is recorded
+    assert mock_install.call_count == syncer.max_retries
+    assert syncer.had_sync_errors is True
+    assert len(syncer.sync_errors) == 1
+
+
+def test_retry_backoff_is_chosen_by_error(mock_bandcamp, tmp_path):
+    options = BandcampSyncOptions(
+        cookies="identity=test",
+        dir_path=tmp_path,
+        max_retries=5,
+        retry_wait=5,
+        retry_max_wait=300,
+    )
+    syncer = Syncer(options, auto_run=False)
+    sync = ItemSync(_item(), "flac", tmp_path)
+    sync.attempt = 2
+    for _, backoff in syncer.retry_policy.backoffs:
+        backoff.jitter = lambda: 1.0
+    # Failed transfers back off slower than errors from Bandcamp
+    assert syncer._handle_sync_error(sync, DownloadBadStatusCode("502"))
+    assert sync.delay == 20
+    assert syncer._handle_sync_error(sync, BandcampError("503"))
+    assert sync.delay == 80
+
+
+def test_retry_wait_frees_the_download_slot(syncer):
+    syncer.engine = "async"
+    syncer.concurrency = 1
+    first, second = _item(), _item()
+    order = []
+
+    def new_item_sync(item, encoding=None):
+        return ItemSync(item, "flac", None)
+
+    async def attempt(sync):
+        name = "first" if sync.item is first else "second"
+        order.append(f"{name} {sync.attempt}")
+        if sync.item is first and sync.attempt == 0:
+            sync.attempt += 1
+            sync.delay = 0.05
+            return None
+        return True
+
+    async def run():
+        syncer.start_sync()
+        try:
+            return await asyncio.gather(
+                syncer.sync_item_in_engine(first),
+                syncer.sync_item_in_engine(second),
+            )
+        finally:
+            await syncer.stop_sync()
+
+    with (
+        patch("bandcampsync.sync.new_async_session"),
+        patch.object(syncer, "_new_item_sync", side_effect=new_item_sync),
+        patch.object(syncer, "_async_sync_attempt", side_effect=attempt),
+        patch("bandcampsync.sync.AsyncBandcamp") as mock_async_bandcamp,
+    ):
+        mock_async_bandcamp.return_value.session.close = AsyncMock()
+        results = asyncio.run(run())
+
+    assert results == [True, True]
+    # The second item is synced while the first waits to retry
+    assert order == ["first 0", "second 0", "first 1"]
+
+
+def test_sequential_retry_wait_frees_the_download_slot(syncer):
+    # The default single thread engine with concurrency 1
+    first, second = _item(), _item()
+    order = []
+
+    def new_item_sync(item, encoding=None):
+        return ItemSync(item, "flac", None)
+
+    def attempt(sync):
+        name = "first" if sync.item is first else "second"
+        order.append(f"{name} {sync.attempt}")
+        if sync.item is first and sync.attempt == 0:
+            sync.attempt += 1
+            sync.delay = 0.05
+            return None
+        return True
+
+    async def run():
+        syncer.start_sync()
+        try:
+            await syncer._sync_selected_purchases()
+        finally:
+            await syncer.stop_sync()
+
+    with (
+        patch.object(syncer, "select_items_to_sync", return_value=[first, second]),
+        patch.object(syncer, "_new_item_sync", side_effect=new_item_sync),
+        patch.object(syncer, "_sync_attempt", side_effect=attempt),
+        patch("bandcampsync.sync.time.sleep") as mock_sleep,
+        patch("bandcampsync.sync.log.info") as mock_log_info,
+    ):
+        asyncio.run(run())
+
+    assert syncer.concurrency == 1
+    assert order == ["first 0", "second 0", "first 1"]
+    mock_sleep.assert_not_called()
+    # Progress is logged once per item, when it starts rather than on a retry
+    progress = [
+        call.args[0]
+        for call in mock_log_info.call_args_list
+        if call.args[0].startswith("Syncing item")
+    ]
+    assert progress == ["Syncing item 1 of 2 (50.0%)", "Syncing item 2 of 2 (100.0%)"]
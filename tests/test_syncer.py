@@ -1,11 +1,16 @@
 """Tests for Syncer."""
 
+import asyncio
 import json
 from datetime import datetime
 from unittest.mock import Mock, patch
+
 import pytest
-from bandcampsync.sync import Syncer
+
+from bandcampsync.bandcamp import BandcampItem
 from bandcampsync.options import BandcampSyncOptions
+from bandcampsync.snapshot import CollectionSnapshot
+from bandcampsync.sync import Syncer, parse_formats
 
 
 @pytest.fixture
@@ -155,7 +160,7 @@ def test_until_date_inclusive(mock_bandcamp, tmp_path):
             coro = mock_run.call_args[0][0]
             coro.close()
 
-    selected = syncer._select_items_to_sync()
+    selected = syncer.select_items_to_sync()
     assert [item.item_id for item in selected] == [1, 2]
 
 
@@ -205,8 +210,10 @@ def test_checkpoint_stops_selection(mock_bandcamp, tmp_path):
             coro = mock_run.call_args[0][0]
             coro.close()
 
-    selected = syncer._select_items_to_sync()
+    selected = syncer.select_items_to_sync()
     assert [item.item_id for item in selected] == [1]
+    # Items synced by earlier runs are not left unknown in the snapshot
+    assert syncer.collection_snapshot.statuses == {2: "checkpointed", 3: "checkpointed"}
 
 
 def test_checkpoint_skips_initial_local_media_index(mock_bandcamp, tmp_path):
@@ -283,3 +290,206 @@ def test_logs_sync_error_summary(syncer_minimal):
     assert "2 error(s)" in mock_warning.call_args_list[0][0][0]
     assert "first failure" in mock_warning.call_args_list[1][0][0]
     assert "second failure" in mock_warning.call_args_list[2][0][0]
+
+
+def _item(item_id, **data):
+    """Returns a BandcampItem, "data" overrides its collection item fields."""
+    return BandcampItem(
+        {
+            "item_id": item_id,
+            "band_name": "Artist",
+            "item_title": f"Album {item_id}",
+            "download_url": f"https://bandcamp.com/download?id={item_id}",
+            **data,
+        }
+    )
+
+
+def _syncer(tmp_path, **options):
+    """Returns a Syncer for tmp_path that has not started syncing."""
+    options = BandcampSyncOptions(
+        cookies="identity=test", dir_path=tmp_path, temp_dir_root=tmp_path, **options
+    )
+    return Syncer(options, auto_run=False)
+
+
+def _sync_items(syncer):
+    """Runs sync_items() and returns the ids of the items it would have synced."""
+    synced = []
+
+    async def sync_item_in_engine(item, queued=False, progress=None):
+        synced.append(item.item_id)
+
+    with patch.object(syncer, "sync_item_in_engine", sync_item_in_engine):
+        asyncio.run(syncer.sync_items())
+    return synced
+
+
+def test_stream_purchases_syncs_items_as_they_load(mock_bandcamp, tmp_path):
+    items = [_item(1), _item(2), _item(3)]
+
+    def iter_purchases(stop_when=None):
+        for item in items:
+            mock_bandcamp.purchases.append(item)
+            yield item
+
+    mock_bandcamp.iter_purchases.side_effect = iter_purchases
+
+    syncer = _syncer(tmp_path, concurrency=2, stream_purchases=True)
+    mock_bandcamp.load_purchases.assert_not_called()
+
+    assert sorted(_sync_items(syncer)) == [1, 2, 3]
+    stop_when = mock_bandcamp.iter_purchases.call_args.kwargs["stop_when"]
+    assert stop_when == syncer.should_stop_loading_purchase
+
+
+def test_stream_purchases_stop_syncing_at_checkpoint(mock_bandcamp, tmp_path):
+    items = [_item(item_id, token=f"t{item_id}") for item_id in (1, 2, 3)]
+    loaded = []
+
+    def iter_purchases(stop_when=None):
+        for item in items:
+            if stop_when and stop_when(item):
+                return
+            loaded.append(item.item_id)
+            mock_bandcamp.purchases.append(item)
+            yield item
+
+    mock_bandcamp.iter_purchases.side_effect = iter_purchases
+    state_file = tmp_path / ".bandcampsync-state.json"
+    state_file.write_text(json.dumps({"last_seen_token": "t2"}) + "\n")
+
+    syncer = _syncer(tmp_path, concurrency=2, stream_purchases=True)
+    assert syncer.collection_checkpoint_token == "t2"
+
+    # Pagination stops at the checkpoint and the first snapshot is written from
+    # the purchases newer than it
+    assert _sync_items(syncer) == [1]
+    assert loaded == [1]
+    assert syncer.collection_snapshot.statuses == {2: "checkpointed"}
+
+
+def test_until_date_stops_pagination_without_completing_snapshot(
+    mock_bandcamp, tmp_path
+):
+    syncer = _syncer(tmp_path, until_date=datetime(2025, 1, 1).date())
+    new = _item(2, purchased="01 Jan 2026 00:00:00 GMT")
+    old = _item(1, purchased="01 Jan 2020 00:00:00 GMT")
+    assert syncer.should_stop_loading_purchase(new) is False
+    assert syncer.should_stop_loading_purchase(old) is True
+
+    mock_bandcamp.collection_items = [new, old]
+    syncer._save_collection_snapshot()
+    # Purchases older than --until-date may not have been loaded
+    assert syncer.collection_snapshot.usable is False
+    assert not (tmp_path / Syncer.SNAPSHOT_FILENAME).exists()
+
+
+def test_snapshot_purchases_share_folder_suffixes(mock_bandcamp, tmp_path):
+    album, other = _item(1, item_title="Album"), _item(2, item_title="Other")
+    snapshot = CollectionSnapshot(tmp_path / Syncer.SNAPSHOT_FILENAME)
+    snapshot.set_status(album, CollectionSnapshot.STATUS_DOWNLOADED)
+    snapshot.set_status(other, CollectionSnapshot.STATUS_FAILED)
+    snapshot.merge([other, album])
+    snapshot.save()
+
+    syncer = _syncer(tmp_path)
+    mock_bandcamp.purchases = [_item(3, item_title="Album")]
+    mock_bandcamp.resolve_download_urls.side_effect = lambda items: items
+
+    selected = syncer.select_items_to_sync()
+    assert [(i.item_id, i.folder_suffix) for i in selected] == [(3, " [3]"), (2, "")]
+    # Only the snapshot item needs its download URL resolved again
+    (resolved,), _ = mock_bandcamp.resolve_download_urls.call_args
+    assert [i.item_id for i in resolved] == [2]
+    assert syncer.should_stop_loading_purchase(other) is True
+    assert syncer.should_stop_loading_purchase(_item(4, item_title="New")) is False
+
+
+def test_snapshot_purchases_that_are_skipped_again_are_not_resolved(
+    mock_bandcamp, tmp_path
+):
+    def item(item_id, band, purchased="01 Jan 2026 00:00:00 GMT"):
+        return _item(item_id, band_name=band, item_title="Album", purchased=purchased)
+
+    old = item(1, "Old", purchased="01 Jan 2020 00:00:00 GMT")
+    snapshot = CollectionSnapshot(tmp_path / Syncer.SNAPSHOT_FILENAME)
+    snapshot.set_status(item(2, "Ignored"), CollectionSnapshot.STATUS_SKIPPED)
+    snapshot.set_status(item(3, "Failed"), CollectionSnapshot.STATUS_FAILED)
+    snapshot.merge([item(3, "Failed"), item(2, "Ignored"), old])
+    snapshot.save()
+
+    syncer = _syncer(
+        tmp_path, ign_patterns="ignored", until_date=datetime(2025, 1, 1).date()
+    )
+    mock_bandcamp.resolve_download_urls.side_effect = lambda items: items
+
+    selected = syncer.select_items_to_sync()
+    assert [i.item_id for i in selected] == [3]
+    (resolved,), _ = mock_bandcamp.resolve_download_urls.call_args
+    assert [i.item_id for i in resolved] == [3]
+    syncer.collection_snapshot.merge([])
+    assert syncer.collection_snapshot.counts() == {
+        "failed": 1,
+        "skipped": 1,
+        "filtered": 1,
+    }
+    assert syncer.collection_snapshot.has_unknown_items() is False
+
+
+def test_schedule_largest_first(mock_bandcamp, tmp_path):
+    (tmp_path / "Band" / "Downloaded").mkdir(parents=True)
+    (tmp_path / "Band" / "Downloaded" / "bandcamp_item_id.txt").write_text("5\n")
+
+    def item(item_id, title, is_preorder=False):
+        return Mock(
+            band_name="Band",
+            item_title=title,
+            item_id=item_id,
+            item_type="album",
+            is_preorder=is_preorder,
+            hidden=False,
+            url_hints=None,
+        )
+
+    # Newest first
+    mock_bandcamp.purchases = [
+        item(1, "Small"),
+        item(2, "Large"),
+        item(3, "Medium"),
+        item(4, "Also Medium"),
+        item(5, "Downloaded"),
+        item(6, "Preorder", is_preorder=True),
+    ]
+    sizes = {1: 10 * 1024**2, 2: 3000 * 1024**2, 3: 200 * 1024**2, 4: 200 * 1024**2}
+    mock_bandcamp.get_download_file_size.side_effect = lambda i, enc: sizes[i.item_id]
+    syncer = _syncer(tmp_path, concurrency=2, schedule="largest")
+
+    # Items that are skipped come first, then the largest first and ties newest first
+    assert _sync_items(syncer) == [5, 6, 2, 3, 4, 1]
+    assert mock_bandcamp.get_download_file_size.call_count == 4
+
+
+def test_invalid_schedule(mock_bandcamp, tmp_path):
+    with pytest.raises(ValueError, match="Invalid schedule"):
+        _syncer(tmp_path, schedule="smallest")
+
+
+def test_parse_formats(tmp_path):
+    mp3_dir = tmp_path / "mp3"
+    assert parse_formats("flac", tmp_path) == ("flac", tmp_path, {})
+    assert parse_formats(f" flac , mp3-v0={mp3_dir} ", tmp_path) == (
+        "flac",
+        tmp_path,
+        {"mp3-v0": mp3_dir},
+    )
+    # The first format can have its own directory too
+    assert parse_formats(f"mp3-v0={mp3_dir},", tmp_path) == ("mp3-v0", mp3_dir, {})
+    with pytest.raises(ValueError, match="different directory"):
+        parse_formats("flac,mp3-v0", tmp_path)
+    with pytest.raises(ValueError, match="more than once"):
+        parse_formats(f"flac,flac={mp3_dir}", tmp_path)
+    with pytest.raises(ValueError, match="Missing format"):
+        parse_formats(f"flac,={mp3_dir}", tmp_path)
+    with pytest.raises(ValueError, match="No format"):
+        parse_formats("", tmp_path)
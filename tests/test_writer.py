@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+import pytest
+
+from bandcampsync.aio import download_file_async, new_async_session
+from bandcampsync.download import DownloadInterrupted, download_file
+from bandcampsync.journal import PartialDownload
+from bandcampsync.writer import (
+    BufferPool,
+    FileWriter,
+    ThreadedFileWriter,
+    TransferStats,
+    preallocate,
+)
+from tests.mockserver import MockBandcampConfig, MockBandcampServer
+
+
+@pytest.fixture
+def server():
+    config = MockBandcampConfig(items=1, track_ratio=1.0, file_size=3 * 1024 * 1024)
+    with MockBandcampServer(config) as server:
+        yield server
+
+
+def _file_url(server):
+    return f"{server.url}/download/track?enc=flac&id=1000&sig=mocksig&ts=1.0"
+
+
+def test_buffer_pool_reuses_and_bounds_buffers():
+    pool = BufferPool(buffer_size=16, max_buffers=2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert len(first) == 16 and pool.allocated == 2
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(0.1)
+    # The pool is exhausted so the third acquire waits for a release
+    assert thread.is_alive()
+    pool.release(first)
+    thread.join(1)
+    assert acquired == [first] and acquired[0] is first
+    pool.release(bytearray(8))
+    assert not pool.free
+    pool.release(second)
+    assert pool.acquire() is second
+    assert pool.allocated == 2
+
+
+def test_file_writer_writes_and_releases(tmp_path):
+    pool = BufferPool(buffer_size=8, max_buffers=1)
+    stats = TransferStats()
+    with open(tmp_path / "out", "wb") as f:
+        writer = FileWriter(f, pool, stats=stats)
+        buffer = pool.acquire()
+        buffer[:5] = b"hello"
+        writer.submit(buffer, 5)
+        writer.close()
+    assert (tmp_path / "out").read_bytes() == b"hello"
+    assert list(pool.free) == [buffer]
+    assert stats.disk_bytes == 5
+
+
+def test_threaded_file_writer_raises_write_errors(tmp_path):
+    pool = BufferPool(buffer_size=8, max_buffers=2)
+    with open(tmp_path / "out", "wb") as f:
+        writer = ThreadedFileWriter(f, pool, depth=1)
+        f.close()
+        writer.submit(pool.acquire(), 4)
+        with pytest.raises(ValueError):
+            writer.drain()
+        writer.close()
+    # The failed buffer is still returned to the pool
+    assert len(pool.free) == 1
+
+
+def test_transfer_stats_summary():
+    stats = TransferStats()
+    other = TransferStats()
+    other.downloads = 1
+    other.network_bytes = 4 * 1024 * 1024
+    other.network_seconds = 2.0
+    other.add_disk(4 * 1024 * 1024, 0.5)
+    other.wait_seconds = 0.25
+    stats.add(other)
+    stats.add(other)
+    assert stats.downloads == 2
+    assert stats.network_rate == "2.0 MB/s"
+    assert stats.disk_rate == "8.0 MB/s"
+    assert stats.summary() == (
+        "8.0 MB: network 2.0 MB/s, disk 8.0 MB/s, 0.5s waiting for disk"
+    )
+    assert TransferStats().network_rate == "-"
+
+
+def test_preallocate(tmp_path):
+    with open(tmp_path / "out", "wb") as f:
+        if not preallocate(f, 0, 4096):
+            pytest.skip("posix_fallocate is not supported here")
+        assert (tmp_path / "out").stat().st_size == 4096
+        assert not preallocate(f, 4096, 4096)
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_download_file_writes_pooled_blocks(server, tmp_path, threaded):
+    pool = BufferPool(max_buffers=4)
+    stats = TransferStats()
+    with open(tmp_path / "out", "wb") as f:
+        content_type = download_file(
+            _file_url(server),
+            f,
+            threaded=threaded,
+            buffer_pool=pool,
+            stats=stats,
+        )
+    payload = server.state.payload(True, "flac")
+    assert content_type == "audio/flac"
+    assert (tmp_path / "out").read_bytes() == payload
+    assert stats.downloads == 1
+    assert stats.network_bytes == stats.disk_bytes == len(payload)
+    # Blocks grow from the chunk size so only a few buffers are ever allocated
+    assert pool.allocated <= (4 if threaded else 1)
+    assert len(pool.free) == pool.allocated
+
+
+def test_threaded_download_file_resumes(server, tmp_path):
+    partial = PartialDownload(tmp_path / "1000-flac.part")
+    server.state.config.interrupt_rate = 1.0
+    with partial.open() as f, pytest.raises(DownloadInterrupted):
+        download_file(_file_url(server), f, partial=partial, threaded=True)
+    assert 0 < partial.bytes_written < partial.length
+    # Preallocated space past the interruption is not mistaken for data
+    assert partial.path.stat().st_size == partial.bytes_written
+    server.state.config.interrupt_rate = 0.0
+    with partial.open() as f:
+        download_file(_file_url(server), f, partial=partial, threaded=True)
+    assert partial.path.read_bytes() == server.state.payload(True, "flac")
+
+
+def test_download_file_async_records_stats(server, tmp_path):
+    stats = TransferStats()
+
+    async def run(f):
+        session = new_async_session()
+        try:
+            return await download_file_async(
+                _file_url(server),
+                f,
+                session,
+                preallocate_file=True,
+                stats=stats,
+            )
+        finally:
+            await session.close()
+
+    with open(tmp_path / "out", "wb") as f:
+        assert asyncio.run(run(f)) == "audio/flac"
+    payload = server.state.payload(True, "flac")
+    assert (tmp_path / "out").read_bytes() == payload
+    assert stats.downloads == 1
+    assert stats.network_bytes == stats.disk_bytes == len(payload)